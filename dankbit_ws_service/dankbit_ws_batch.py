@@ -1,37 +1,456 @@
+import argparse
 import asyncio
+import bisect
+import functools
+import glob
+import gzip
+import itertools
 import json
+import multiprocessing as mp
 import os
+import resource
 import websockets
 import logging
+import struct
+import threading
+import zlib
 import psycopg2
+from collections import OrderedDict, deque
 from psycopg2.extras import execute_values
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Full
 import time
 
 # -----------------------------------------------------
 # Config
 # -----------------------------------------------------
-WS_URL = "wss://www.deribit.com/ws/api/v2/"
+# Point at deribit_standin.py (e.g. ws://deribit_standin:8765/) for offline
+# load and reconnect testing.
+WS_URL = os.getenv("DERIBIT_WS_URL", "wss://www.deribit.com/ws/api/v2/")
 
 last_request_ts = 0
 REQUEST_INTERVAL = 0.15  # ~7 requests / second
+RPC_TIMEOUT = 15         # seconds to wait for a JSON-RPC response
 SUB_CHUNK_SIZE = 400     # subscribe in chunks < 500 to respect Deribit limits
 
+CURRENCIES = ["BTC", "ETH"]
+
+# "currency": one trades.option.<CCY>.raw channel per currency — two
+# subscriptions in total, and instruments listed after startup are covered
+# automatically. "instrument": the original one trades.<instrument>.raw
+# channel per listed option, kept as a fallback.
+SUBSCRIPTION_MODE = os.getenv("SUBSCRIPTION_MODE", "currency")
+
+# Sharding: by default one process and one WS connection carry every
+# channel. With SHARD_BY=currency each currency gets its own connection in
+# its own worker process (SHARDS_PER_CURRENCY > 1 further splits a
+# currency's instrument channels in instrument mode), so JSON decoding and
+# per-frame handling spread across cores and one shard's reconnect doesn't
+# interrupt the others. Workers forward parsed trades to this process over
+# a bounded multiprocessing queue; the writer pool below stays shared.
+SHARD_BY = os.getenv("SHARD_BY", "")
+SHARDS_PER_CURRENCY = int(os.getenv("SHARDS_PER_CURRENCY", "1"))
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "10000"))  # messages (one per frame)
+SHARD_RESTART_DELAY = 3  # seconds before a dead shard process is restarted
+
+# Hot standby: with LEADER_ELECTION on, several replicas can run at once.
+# All stay connected and subscribed, but only the one holding the
+# PostgreSQL advisory lock LEADER_LOCK_ID writes; the others keep the last
+# STANDBY_BUFFER_SECONDS of trades in memory and flush them (ON CONFLICT
+# dedupes) the moment they win the lock, which they retry every
+# LEADER_POLL_INTERVAL seconds. The buffer is only the fast path: the new
+# leader also backfills from the newest trade the old one committed, since
+# a backed-up queue or spool can hold far more than the buffer's window.
+LEADER_ELECTION = os.getenv("LEADER_ELECTION", "0").lower() in ("1", "true", "yes")
+LEADER_LOCK_ID = int(os.getenv("LEADER_LOCK_ID", "7301"))
+LEADER_POLL_INTERVAL = float(os.getenv("LEADER_POLL_INTERVAL", "0.2"))
+STANDBY_BUFFER_SECONDS = float(os.getenv("STANDBY_BUFFER_SECONDS", "10"))
+STANDBY_BUFFER_MAX = 200000  # trades, whatever their age
+
+# After a reconnect, trades printed while disconnected are fetched with
+# public/get_last_trades_by_currency_and_time, from the last trade seen per
+# currency. Gaps longer than BACKFILL_MAX_WINDOW are clamped — anything older
+# is left to the REST backfill cron in Odoo.
+BACKFILL_MAX_WINDOW = int(os.getenv("BACKFILL_MAX_WINDOW", str(6 * 3600)))
+BACKFILL_PAGE_SIZE = 1000
+# A page answered with a JSON-RPC error is retried this many times, with
+# exponential backoff from 1s; after that the gap stays open and is retried
+# after the next reconnect.
+BACKFILL_RETRIES = 5
+
+# Live market state (index price, option mark price/IV, open interest) is
+# upserted into dankbit_instrument_state so Odoo reads it from the DB instead
+# of calling Deribit on the request path. Index/mark updates arrive many times
+# a second; only the latest value per row is kept and written every
+# STATE_FLUSH_INTERVAL seconds. Open interest has no push channel at the
+# currency level, so it is polled with get_book_summary_by_currency.
+INDEX_NAMES = {"BTC": "btc_usdt", "ETH": "eth_usdt"}  # same indices as Trade.get_index_price()
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "2"))
+BOOK_SUMMARY_INTERVAL = int(os.getenv("BOOK_SUMMARY_INTERVAL", "30"))
+
+# Every committed batch is announced on this PostgreSQL NOTIFY channel (see
+# notify_trades), so Odoo can tell which expiries changed without polling.
+NOTIFY_CHANNEL = "dankbit_trades"
+
+# Trades are written in micro-batches: flushed as soon as BATCH_MAX_ROWS are
+# pending, or once the oldest pending trade has waited BATCH_MAX_AGE seconds.
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "500"))
+BATCH_MAX_AGE = float(os.getenv("BATCH_MAX_AGE_MS", "100")) / 1000.0
+STATS_INTERVAL = 60      # seconds between ingest throughput log lines
+
+# The WS reader only parses frames and hands trades to a bounded queue;
+# WRITER_COUNT writer tasks drain it into PostgreSQL on a thread pool, so a
+# slow DB never blocks ws.recv() (and with it Deribit's ping/pong). The queue
+# is sized to absorb minutes of burst traffic; only once it is full does the
+# reader wait for the writers (backpressure).
+TRADE_QUEUE_SIZE = int(os.getenv("TRADE_QUEUE_SIZE", "50000"))
+WRITER_COUNT = int(os.getenv("WRITER_COUNT", "1"))
+last_queue_full_warning = 0
+
+# Trade ids already queued are remembered in an LRU of this many entries, so
+# the overlap between stream, reconnect backfill and standby takeover is
+# dropped before it costs a round trip and a unique-index probe (0 disables;
+# ON CONFLICT still catches anything the cache has forgotten).
+DEDUPE_CACHE_SIZE = int(os.getenv("DEDUPE_CACHE_SIZE", "200000"))
+
+# Relative paths below (spool, frame recordings) are resolved against this
+# script's directory, not the working directory it happens to be started from.
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Trades that can't be written because PostgreSQL is unreachable are appended
+# to this fsync'd spool file and replayed once the DB is back.
+SPOOL_PATH = os.path.join(SERVICE_DIR, os.getenv("SPOOL_PATH", "spool/trades.spool"))
+SPOOL_REPLAY_CHUNK = 5000
+DB_RETRY_MAX = 30        # cap (seconds) for the reconnect backoff
+
+# Optional raw frame recording for offline benchmarks (see --replay): every
+# inbound WS frame, with its receive time, goes to gzip'd JSON-lines files in
+# RECORD_DIR — a new file every RECORD_ROTATE seconds, the newest RECORD_KEEP
+# kept. Off unless RECORD_DIR is set.
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+if RECORD_DIR:
+    RECORD_DIR = os.path.join(SERVICE_DIR, RECORD_DIR)
+RECORD_ROTATE = int(os.getenv("RECORD_ROTATE", "3600"))
+RECORD_KEEP = int(os.getenv("RECORD_KEEP", "24"))
+
+# Prometheus text-format metrics on http://<host>:METRICS_PORT/metrics
+# (0 disables).
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
 log = logging.getLogger("ws")
 
 # -----------------------------------------------------
-# PostgreSQL connection (global)
+# PostgreSQL connection (one per writer)
+# -----------------------------------------------------
+def pg_connect(**kwargs):
+    conn = psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST", "db"),
+        port=os.getenv("POSTGRES_PORT", "5432"),
+        connect_timeout=5,
+        **kwargs,
+    )
+    conn.autocommit = True
+    print("WS connecting to DB:", conn.dsn, flush=True)
+    return conn
+
+
 # -----------------------------------------------------
-PG_CONN = psycopg2.connect(
-    dbname=os.getenv("POSTGRES_DB"),
-    user=os.getenv("POSTGRES_USER"),
-    password=os.getenv("POSTGRES_PASSWORD"),
-    host=os.getenv("POSTGRES_HOST", "db"),
-    port=os.getenv("POSTGRES_PORT", "5432")
+# Metrics (Prometheus text format, stdlib HTTP server)
+# -----------------------------------------------------
+class Metric:
+    """
+    One metric family: values keyed by a tuple of label values, in the
+    order of `labels`. Updated from the event loop and the writer threads,
+    rendered from the HTTP thread, hence the lock.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values = {}
+        self.remote = {}  # shard name -> values reported by that shard process
+        METRICS.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _labels(self, key, extra=""):
+        pairs = [f'{label}="{value}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+            for remote in self.remote.values():
+                for key, value in remote.items():
+                    values[key] = values.get(key, 0) + value
+        return [f"{self.name}{self._labels(key)} {value}" for key, value in sorted(values.items())]
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Set directly, or computed at scrape time by a `collect` callback
+    returning {label tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def samples(self):
+        if self.collect is not None:
+            with self.lock:
+                self.values = dict(self.collect())
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, labels=()):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ["+Inf"], counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+                lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+METRICS = []
+
+FRAMES = Counter(
+    "dankbit_ws_frames_total",
+    "Subscription notifications received, by currency and channel kind.",
+    ("currency", "channel"),
+)
+TRADES_RECEIVED = Counter(
+    "dankbit_ws_trades_received_total",
+    "Trades received from Deribit, by currency and source (stream or reconnect backfill).",
+    ("currency", "source"),
+)
+TRADES_INSERTED = Counter(
+    "dankbit_ws_trades_inserted_total",
+    "Trades written to dankbit_trade as new rows.",
+    ("currency",),
 )
-PG_CONN.autocommit = True
-print("WS connecting to DB:", PG_CONN.dsn, flush=True)
+TRADES_DUPLICATE = Counter(
+    "dankbit_ws_trades_duplicate_total",
+    "Trades dropped by ON CONFLICT because they were already stored.",
+    ("currency",),
+)
+TRADES_REJECTED = Counter(
+    "dankbit_ws_trades_rejected_total",
+    "Malformed trades PostgreSQL refused and that were dropped.",
+    ("currency",),
+)
+TRADES_SPOOLED = Counter(
+    "dankbit_ws_trades_spooled_total",
+    "Trades spooled to disk because PostgreSQL was unreachable.",
+)
+BATCH_ROWS = Histogram(
+    "dankbit_ws_batch_rows",
+    "Trades per insert batch.",
+    (1, 10, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+BATCH_SECONDS = Histogram(
+    "dankbit_ws_batch_seconds",
+    "Insert batch latency (spool replay included).",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+COMMIT_LAG = Histogram(
+    "dankbit_ws_commit_lag_seconds",
+    "Deribit trade timestamp to commit in dankbit_trade.",
+    (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800),
+)
+LAST_COMMIT_LAG = Gauge(
+    "dankbit_ws_last_commit_lag_seconds",
+    "Commit lag of the newest trade in the last committed batch.",
+    ("currency",),
+)
+RECONNECTS = Counter(
+    "dankbit_ws_reconnects_total",
+    "Deribit WS connections lost and re-established.",
+)
+LEADER = Gauge(
+    "dankbit_ws_leader",
+    "1 while this replica holds the writer lock (always 1 without LEADER_ELECTION).",
+)
+TAKEOVERS = Counter(
+    "dankbit_ws_leader_takeovers_total",
+    "Times this replica won the writer lock.",
+)
+DEDUPE_HITS = Counter(
+    "dankbit_ws_dedupe_hits_total",
+    "Trades dropped before queueing because their trade_id was in the dedupe cache.",
+)
+DEDUPE_MISSES = Counter(
+    "dankbit_ws_dedupe_misses_total",
+    "Trades whose trade_id was not in the dedupe cache (queued for insert).",
+)
+DEDUPE_SIZE = Gauge(
+    "dankbit_ws_dedupe_cache_size",
+    "trade_ids held in the dedupe cache (max DEDUPE_CACHE_SIZE).",
+)
+STANDBY_BUFFERED = Gauge(
+    "dankbit_ws_standby_buffered",
+    "Trades held in the standby ring buffer.",
+)
+CONNECTED = Gauge(
+    "dankbit_ws_connected",
+    "Deribit WS connections currently subscribed (one per shard).",
+)
+# collect callbacks are wired up in run(), where the queue/spool/gaps live
+QUEUE_DEPTH = Gauge(
+    "dankbit_ws_queue_depth",
+    "Trades received but not yet taken by a writer.",
+)
+QUEUE_CAPACITY = Gauge(
+    "dankbit_ws_queue_capacity",
+    "Trade queue size limit (TRADE_QUEUE_SIZE).",
+)
+SPOOL_BYTES = Gauge(
+    "dankbit_ws_spool_bytes",
+    "Size of the on-disk spool waiting to be replayed.",
+)
+SINCE_LAST_TRADE = Gauge(
+    "dankbit_ws_seconds_since_last_trade",
+    "Seconds since the Deribit timestamp of the newest trade seen, by currency.",
+    ("currency",),
+)
+
+
+def channel_currency(channel):
+    """BTC/ETH from trades.option.BTC.raw, trades.BTC-27MAR26-…, deribit_price_index.btc_usdt, markprice.options.btc_usd."""
+    parts = channel.split(".")
+    i = 2 if channel.startswith(("trades.option.", "markprice.options.")) else 1
+    return parts[i].replace("_", "-").split("-")[0].upper() if len(parts) > i else ""
+
+
+def trade_currency(t):
+    return (t.get("instrument_name") or "").split("-")[0]
+
+
+def count_by_currency(trades):
+    counts = {}
+    for t in trades:
+        currency = trade_currency(t)
+        counts[currency] = counts.get(currency, 0) + 1
+    return counts
+
+
+def observe_commit_lag(trades):
+    now = time.time()
+    newest = {}
+    for t in trades:
+        ts = (t.get("timestamp") or 0) / 1000.0
+        COMMIT_LAG.observe(now - ts)
+        currency = trade_currency(t)
+        newest[currency] = max(newest.get(currency, 0), ts)
+    for currency, ts in newest.items():
+        LAST_COMMIT_LAG.set(round(now - ts, 3), currency=currency)
+
+
+def shard_metrics():
+    """Counter/gauge values a shard process reports to the main one, which
+    adds them to its own at scrape time (Metric.remote)."""
+    return {
+        metric.name: metric.snapshot()
+        for metric in METRICS
+        if isinstance(metric, (Counter, Gauge)) and getattr(metric, "collect", None) is None
+    }
+
+
+def merge_shard_metrics(shard, snapshot):
+    for metric in METRICS:
+        if metric.name in snapshot:
+            with metric.lock:
+                metric.remote[shard] = snapshot[metric.name]
+
+
+def retire_shard_metrics(shard):
+    """Fold a dead shard's last reported counters into this process's own,
+    so totals stay monotonic when its replacement starts from zero."""
+    for metric in METRICS:
+        with metric.lock:
+            remote = metric.remote.pop(shard, {})
+            if isinstance(metric, Counter):
+                for key, value in remote.items():
+                    metric.values[key] = metric.values.get(key, 0) + value
+
+
+def render_metrics():
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scraped every few seconds; don't flood the log
+
+
+def start_metrics_server(port):
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info(f"Serving metrics on :{port}/metrics")
+    return server
 
 
 # -----------------------------------------------------
@@ -59,29 +478,56 @@ def extract_expiration(instrument_name):
 
 
 # -----------------------------------------------------
-# DB Insert (single-row, ON CONFLICT ignore)
+# DB Insert (multi-row, ON CONFLICT ignore)
 # -----------------------------------------------------
-def insert_trade(t):
-    sql = """
-        INSERT INTO dankbit_trade
-        (
-            name, strike, active, deribit_trade_identifier, amount, price, direction,
-            option_type, index_price, iv, block_trade_id, is_block_trade,
-            expiration, deribit_ts,
-            create_uid, create_date, write_uid, write_date
-        )
-        VALUES
-        (
-            %s,%s,True,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,TO_TIMESTAMP(%s/1000.0),
-            1, NOW(), 1, NOW()
-        )
-        ON CONFLICT (deribit_trade_identifier) DO NOTHING;
+INSERT_SQL = """
+    INSERT INTO dankbit_trade
+    (
+        name, instrument_id, currency, expiry_code, strike, active, deribit_trade_identifier, amount, price, direction,
+        option_type, index_price, iv, block_trade_id, is_block_trade,
+        expiration, deribit_ts,
+        create_uid, create_date, write_uid, write_date
+    )
+    VALUES %s
+    ON CONFLICT (deribit_trade_identifier) DO NOTHING
+    RETURNING id, name
+"""
+
+INSERT_TEMPLATE = """(
+    %s,%s,%s,%s,%s,True,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,TO_TIMESTAMP(%s/1000.0),
+    1, NOW(), 1, NOW()
+)"""
+
+# dankbit_instrument ids by name. Odoo keeps that table in sync with
+# get_instruments and can't delete a row that trades point to (ondelete
+# restrict), so an id once seen stays good; names not there yet are
+# looked up again with the next batch.
+INSTRUMENT_IDS = {}
+
+
+def instrument_ids(conn, names):
+    """
+    Name → dankbit_instrument id for `names`, from INSTRUMENT_IDS plus one
+    query for the names it doesn't have yet. A trade on an instrument Odoo
+    hasn't created yet gets NULL and is linked when the instrument row is.
     """
+    missing = [name for name in set(names) if name and name not in INSTRUMENT_IDS]
+    if missing:
+        with conn.cursor() as cur:
+            cur.execute("SELECT name, id FROM dankbit_instrument WHERE name = ANY(%s)", (missing,))
+            INSTRUMENT_IDS.update(cur.fetchall())
+    return INSTRUMENT_IDS
+
 
+def trade_row(t, instruments):
     instr_name = t.get("instrument_name")
+    parts = (instr_name or "").split("-")
 
-    values = (
+    return (
         instr_name,
+        instruments.get(instr_name),                       # instrument_id
+        parts[0] or None,                                  # currency
+        parts[1] if len(parts) > 1 and parts[1] else None,  # expiry_code
         instr_name.split("-")[2] if instr_name else 0,  # strike
         t.get("trade_id"),
         t.get("amount"),
@@ -96,58 +542,930 @@ def insert_trade(t):
         t.get("timestamp"),             # ms → converted in SQL
     )
 
+
+def insert_trades(conn, trades):
+    """
+    Write `trades` in a single INSERT statement (one round trip, one
+    autocommit transaction, plus an instrument lookup when the batch has
+    names instrument_ids() hasn't seen). Returns (id, name) of the rows that were
+    actually new — duplicates are dropped by ON CONFLICT.
+    """
+    instruments = instrument_ids(conn, (t.get("instrument_name") for t in trades))
+    rows = [trade_row(t, instruments) for t in trades]
+    with conn.cursor() as cur:
+        return execute_values(
+            cur, INSERT_SQL, rows, template=INSERT_TEMPLATE, page_size=len(rows), fetch=True
+        )
+
+
+def insert_trades_checked(conn, trades):
+    """
+    insert_trades(), except that a batch rejected for something other than
+    connectivity (a malformed trade) is retried row by row so only the bad
+    rows are dropped, followed by the change notification for whatever was
+    new. Connectivity errors propagate to the caller. Returns the number of
+    new rows.
+    """
+    rejected = {}
     try:
-        with PG_CONN.cursor() as cur:
-            cur.execute(sql, values)
+        new_rows = insert_trades(conn, trades)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
     except Exception as e:
-        log.error(f"DB insert error: {e}")
-        PG_CONN.rollback()
+        log.error(f"DB insert error ({len(trades)} trades), retrying row by row: {e}")
+        conn.rollback()
+        # an instrument deleted and recreated in Odoo leaves a stale id
+        INSTRUMENT_IDS.clear()
+
+        new_rows = []
+        for t in trades:
+            try:
+                new_rows += insert_trades(conn, [t])
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                raise
+            except Exception as e:
+                log.error(f"Dropping trade {t.get('trade_id')}: {e}")
+                conn.rollback()
+                currency = trade_currency(t)
+                rejected[currency] = rejected.get(currency, 0) + 1
+
+    notify_trades(conn, new_rows)
+
+    inserted = count_by_currency({"instrument_name": name} for _, name in new_rows)
+    for currency, received in count_by_currency(trades).items():
+        new, bad = inserted.get(currency, 0), rejected.get(currency, 0)
+        TRADES_INSERTED.inc(new, currency=currency)
+        TRADES_DUPLICATE.inc(received - new - bad, currency=currency)
+        if bad:
+            TRADES_REJECTED.inc(bad, currency=currency)
+    return len(new_rows)
+
+
+def notify_trades(conn, new_rows):
+    """
+    NOTIFY dankbit_trades once per currency with the expirations the batch
+    touched and its highest dankbit_trade id, e.g.
+    {"currency": "BTC", "expirations": ["27MAR26"], "max_id": 123}.
+    Odoo's trade feed listener (models/trade_feed.py) turns these into
+    per-(asset, expiry) data versions. Sent after the INSERT has committed,
+    so listeners never see an id they can't read yet.
+    """
+    touched = {}
+    for row_id, name in new_rows:
+        parts = (name or "").split("-")
+        if len(parts) < 2:
+            continue
+        expirations, max_id = touched.get(parts[0], (set(), 0))
+        expirations.add(parts[1])
+        touched[parts[0]] = (expirations, max(max_id, row_id))
+
+    with conn.cursor() as cur:
+        for currency, (expirations, max_id) in touched.items():
+            payload = json.dumps({
+                "currency": currency,
+                "expirations": sorted(expirations),
+                "max_id": max_id,
+            }, separators=(",", ":"))
+            cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, payload))
 
 
 # -----------------------------------------------------
-# WebSocket helper
+# Local spool for trades the DB couldn't take
 # -----------------------------------------------------
-async def ws_call(ws, method, params=None):
+class TradeSpool:
     """
-    Simple RPC helper with basic rate limiting and retry on 'over_limit'.
+    Append-only file of length-prefixed JSON records (4-byte big-endian
+    length, then a JSON list of raw Deribit trade dicts). Every append is
+    fsync'd, so spooled trades survive a crash of this process too — any
+    spool left over from a previous run is replayed on the next successful
+    DB write. Shared by all writers; the lock also keeps appends out while a
+    replay is in flight, so truncating after it never loses a record.
     """
-    global last_request_ts
-    now = time.time()
-    if now - last_request_ts < REQUEST_INTERVAL:
-        await asyncio.sleep(REQUEST_INTERVAL - (now - last_request_ts))
-    last_request_ts = time.time()
-
-    req = {
-        "jsonrpc": "2.0",
-        "id": int(time.time() * 1000),
-        "method": method,
-        "params": params or {}
-    }
-    await ws.send(json.dumps(req))
-    resp = json.loads(await ws.recv())
 
-    if "error" in resp:
-        err = resp["error"]
-        if err.get("message") == "over_limit":
-            log.warning("Rate limit hit. Sleeping 0.5 seconds…")
-            await asyncio.sleep(0.5)
-            return await ws_call(ws, method, params)
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.f = open(path, "ab")
+        self.size = self.f.seek(0, os.SEEK_END)
+        if self.size:
+            # A crash mid-append leaves a torn last record; appending after
+            # it would put every later record out of _read()'s reach.
+            _, end = self._scan()
+            if end < self.size:
+                log.warning(f"Spool {path}: dropping a torn record ({self.size - end} bytes) left by a crash.")
+                self.f.truncate(end)
+                self.f.flush()
+                os.fsync(self.f.fileno())
+                self.size = end
+        if self.size:
+            log.warning(f"Spool {path} holds {self.size} bytes from a previous run, will replay.")
+
+    def pending(self):
+        return self.size > 0
+
+    def append(self, trades):
+        payload = json.dumps(trades).encode()
+        with self.lock:
+            self.f.write(struct.pack(">I", len(payload)) + payload)
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.size += 4 + len(payload)
+
+    def _scan(self):
+        """(trades, end): every trade in the complete records, and the
+        offset just past the last one — where a torn tail begins."""
+        trades = []
+        end = 0
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(4)
+                if len(header) < 4:
+                    break
+                length = struct.unpack(">I", header)[0]
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                try:
+                    trades.extend(json.loads(payload))
+                except ValueError:
+                    break
+                end += 4 + length
+        return trades, end
+
+    def _read(self):
+        trades, end = self._scan()
+        if end < self.size:
+            log.warning(f"Skipping unreadable record at the end of {self.path}")
+        return trades
+
+    def replay(self, conn):
+        """
+        Bulk-insert everything spooled so far, then truncate the spool —
+        only once every chunk has committed. A failure part-way leaves the
+        spool intact; the next replay re-sends it and ON CONFLICT drops the
+        rows that already made it. Returns the number of new rows.
+        """
+        with self.lock:
+            trades = self._read()
+            inserted = 0
+            for i in range(0, len(trades), SPOOL_REPLAY_CHUNK):
+                inserted += insert_trades_checked(conn, trades[i:i + SPOOL_REPLAY_CHUNK])
+
+            self.f.truncate(0)
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.size = 0
+
+        log.info(f"Replayed {len(trades)} spooled trades ({inserted} new).")
+        return inserted
+
+
+class TradeBatch:
+    """
+    One writer's trades taken off the queue but not yet written, plus the
+    throughput counters it reports every STATS_INTERVAL seconds. flush()
+    blocks on the DB and is run on the writer thread pool.
+
+    The writer owns its connection: it is (re)opened lazily with exponential
+    backoff, and while the DB is unreachable batches go to the spool instead.
+    """
+
+    def __init__(self, spool, queue, name="writer", keep_latencies=False):
+        self.spool = spool
+        self.queue = queue
+        self.name = name
+        self.conn = None
+        self.retry_at = 0
+        self.backoff = 1
+        self.trades = []
+        self.oldest = None
+        self._reset_stats()
+        # every flush's latency and row count since startup, for --replay's
+        # summary (the periodic stats above reset each window)
+        self.latencies = [] if keep_latencies else None
+        self.total_rows = 0
+
+    def _reset_stats(self):
+        self.stats_since = time.monotonic()
+        self.rows = 0
+        self.inserted = 0
+        self.flushes = 0
+        self.flush_time = 0.0
+        self.flush_max = 0.0
+        self.queue_peak = 0
+        self.spooled = 0
+
+    def add(self, trades):
+        if not self.trades:
+            self.oldest = time.monotonic()
+        self.trades.extend(trades)
+
+    def due(self):
+        return len(self.trades) >= BATCH_MAX_ROWS or self.time_left() == 0
+
+    def time_left(self):
+        """
+        Seconds until the pending batch must be flushed. With nothing
+        pending that's None (wait for trades) unless there is a spool to
+        replay, in which case the writer wakes up for the next DB retry.
+        """
+        if not self.trades:
+            return max(self.retry_at - time.monotonic(), 1) if self.spool.pending() else None
+        return max(BATCH_MAX_AGE - (time.monotonic() - self.oldest), 0)
+
+    def connection(self):
+        """The writer's open connection, or None while backing off."""
+        if self.conn is not None and not self.conn.closed:
+            return self.conn
+        if time.monotonic() < self.retry_at:
+            return None
+        try:
+            self.conn = pg_connect()
+        except psycopg2.OperationalError as e:
+            log.warning(f"[{self.name}] DB connect failed, retrying in {self.backoff}s: {e}")
+            self.retry_at = time.monotonic() + self.backoff
+            self.backoff = min(self.backoff * 2, DB_RETRY_MAX)
+            return None
+        self.backoff = 1
+        return self.conn
+
+    def disconnect(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.conn = None
+
+    def write(self, trades):
+        conn = self.connection()
+        if conn is None:
+            self.spool_trades(trades)
+            return
+
+        try:
+            if self.spool.pending():
+                self.inserted += self.spool.replay(conn)
+            if trades:
+                self.inserted += insert_trades_checked(conn, trades)
+                observe_commit_lag(trades)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            log.error(f"[{self.name}] DB unreachable, spooling {len(trades)} trades: {e}")
+            self.disconnect()
+            self.spool_trades(trades)
+
+    def spool_trades(self, trades):
+        if not trades:
+            return
+        try:
+            self.spool.append(trades)
+            self.spooled += len(trades)
+            TRADES_SPOOLED.inc(len(trades))
+        except OSError as e:
+            log.error(f"[{self.name}] Could not spool {len(trades)} trades to {self.spool.path}: {e}")
+
+    def flush(self):
+        if self.trades or self.spool.pending():
+            trades, self.trades = self.trades, []
+            started = time.monotonic()
+            self.write(trades)
+            elapsed = time.monotonic() - started
+
+            self.rows += len(trades)
+            self.flushes += 1
+            self.flush_time += elapsed
+            self.flush_max = max(self.flush_max, elapsed)
+            self.total_rows += len(trades)
+            if self.latencies is not None:
+                self.latencies.append(elapsed)
+            BATCH_ROWS.observe(len(trades))
+            BATCH_SECONDS.observe(elapsed)
+
+        self.log_stats()
+
+    def log_stats(self, force=False):
+        self.queue_peak = max(self.queue_peak, self.queue.qsize())
+        window = time.monotonic() - self.stats_since
+        if window < STATS_INTERVAL and not force:
+            return
+        if self.flushes:
+            log.info(
+                f"[{self.name}] Ingested {self.rows} trades ({self.inserted} new) in {self.flushes} batches: "
+                f"{self.rows / window:.1f} rows/s, flush latency "
+                f"avg {1000 * self.flush_time / self.flushes:.1f} ms / "
+                f"max {1000 * self.flush_max:.1f} ms, "
+                f"queue depth {self.queue.qsize()} (peak {self.queue_peak}) of {TRADE_QUEUE_SIZE}, "
+                f"{self.spooled} spooled"
+            )
+        self._reset_stats()
+
+
+# -----------------------------------------------------
+# Trade queue: WS reader → DB writers
+# -----------------------------------------------------
+class TradeIdCache:
+    """
+    Bounded LRU of trade_ids already queued for insert. Ids are recorded
+    when queued, not when committed: a trade queued twice before its batch
+    lands is the common case (stream vs. backfill overlap), and a queued
+    trade reaches the DB or the spool either way.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.ids = OrderedDict()
+        DEDUPE_SIZE.collect = lambda: {(): len(self.ids)}
+
+    def filter(self, trades):
+        if not self.size:
+            return trades
+        fresh = []
+        for t in trades:
+            trade_id = t.get("trade_id")
+            if trade_id in self.ids:
+                self.ids.move_to_end(trade_id)
+                continue
+            self.ids[trade_id] = None
+            fresh.append(t)
+        while len(self.ids) > self.size:
+            self.ids.popitem(last=False)
+
+        DEDUPE_MISSES.inc(len(fresh))
+        DEDUPE_HITS.inc(len(trades) - len(fresh))
+        return fresh
+
+
+recent_trade_ids = TradeIdCache(DEDUPE_CACHE_SIZE)
+
+
+async def enqueue_trades(queue, trades):
+    global last_queue_full_warning
+    for t in recent_trade_ids.filter(trades):
+        try:
+            queue.put_nowait(t)
+        except asyncio.QueueFull:
+            if time.time() - last_queue_full_warning > STATS_INTERVAL:
+                last_queue_full_warning = time.time()
+                log.warning(
+                    f"Trade queue full ({TRADE_QUEUE_SIZE}) — DB writers are behind, "
+                    f"pausing WS reads until they catch up."
+                )
+            await queue.put(t)
+
+
+# -----------------------------------------------------
+# Leader election (hot standby)
+# -----------------------------------------------------
+class Leadership:
+    """
+    Gate between the stream and the trade queue. The leader passes trades
+    straight through; a standby keeps them in a ring buffer trimmed to the
+    last STANDBY_BUFFER_SECONDS and polls pg_try_advisory_lock. The lock is
+    session-level on a dedicated connection, so it is released as soon as
+    the leader's process (or, via TCP keepalives, its host) goes away. On
+    winning it the buffer is queued first, then takeover_backfill() fetches
+    everything since the newest committed trade: what the old leader
+    received but never committed can be older than the buffer (its queue
+    and spool are unbounded in time), and is lost with it otherwise.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.backfill = None
+        self.is_leader = not LEADER_ELECTION
+        self.conn = None
+        self.buffer = deque(maxlen=STANDBY_BUFFER_MAX)
+        LEADER.set(int(self.is_leader))
+        STANDBY_BUFFERED.collect = lambda: {(): len(self.buffer)}
+
+    async def enqueue(self, trades):
+        if self.is_leader:
+            await enqueue_trades(self.queue, trades)
+            return
+        now = time.monotonic()
+        self.buffer.extend((now, t) for t in trades)
+        while self.buffer and now - self.buffer[0][0] > STANDBY_BUFFER_SECONDS:
+            self.buffer.popleft()
+
+    def _lock_conn(self):
+        if self.conn is None or self.conn.closed:
+            # keepalives: a leader whose host vanishes loses the lock in
+            # ~10s instead of the kernel's default of hours
+            self.conn = pg_connect(keepalives=1, keepalives_idle=5, keepalives_interval=2, keepalives_count=3)
+        return self.conn
+
+    def try_acquire(self):
+        with self._lock_conn().cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (LEADER_LOCK_ID,))
+            return cur.fetchone()[0]
+
+    def still_held(self):
+        with self._lock_conn().cursor() as cur:
+            cur.execute("SELECT 1")
+        return True
+
+    def drop_conn(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.conn = None
+
+    async def take_over(self):
+        self.is_leader = True
+        LEADER.set(1)
+        TAKEOVERS.inc()
+        buffered = [t for _, t in self.buffer]
+        self.buffer.clear()
+        log.info(f"Won the writer lock, flushing {len(buffered)} buffered trades.")
+        await enqueue_trades(self.queue, buffered)
+        if self.backfill is None or self.backfill.done():
+            self.backfill = asyncio.create_task(takeover_backfill(self.enqueue))
+            self.backfill.add_done_callback(self._log_backfill_failure)
+
+    @staticmethod
+    def _log_backfill_failure(task):
+        if not task.cancelled() and task.exception():
+            log.error(
+                f"Takeover backfill failed, trades the previous leader never committed "
+                f"may be missing: {task.exception()}"
+            )
+
+    def step_down(self, reason):
+        if self.is_leader:
+            log.error(f"Lost the writer lock ({reason}), back to standby.")
+        self.is_leader = False
+        LEADER.set(0)
+
+    async def run(self, executor):
+        log.info(f"Leader election on (advisory lock {LEADER_LOCK_ID}), starting as standby.")
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if self.is_leader:
+                    await loop.run_in_executor(executor, self.still_held)
+                elif await loop.run_in_executor(executor, self.try_acquire):
+                    await self.take_over()
+            except psycopg2.Error as e:
+                # the lock went with the connection, if we held it
+                self.drop_conn()
+                self.step_down(f"DB connection: {e}")
+                await asyncio.sleep(1)
+            await asyncio.sleep(LEADER_POLL_INTERVAL)
+
+
+# -----------------------------------------------------
+# Reconnect gap tracking and backfill
+# -----------------------------------------------------
+class GapTracker:
+    """
+    Newest Deribit trade timestamp (ms) seen per currency, from the stream
+    or a backfill. On reconnect each currency's gap starts there — or
+    earlier, if the previous reconnect's backfill never finished (the
+    stream has moved last_seen past that older gap in the meantime).
+    trade_seq isn't used: it is per instrument, not per currency.
+    """
+
+    def __init__(self):
+        self.last_seen = {}
+        self.open_gaps = {}
+
+    def seen(self, trades):
+        for t in trades:
+            currency = (t.get("instrument_name") or "").split("-")[0]
+            ts = t.get("timestamp")
+            if ts and ts > self.last_seen.get(currency, 0):
+                self.last_seen[currency] = ts
+
+    def open(self, currency):
+        start = self.open_gaps.get(currency, self.last_seen.get(currency))
+        if start is not None:
+            self.open_gaps[currency] = start
+        return start
+
+    def close(self, currency, start):
+        if self.open_gaps.get(currency) == start:
+            del self.open_gaps[currency]
+
+
+def load_last_seen(gaps, currencies=CURRENCIES):
+    """
+    Seed GapTracker from the newest trade already in the DB, so the gap
+    left by a restart/redeploy is backfilled too. Only looks back
+    BACKFILL_MAX_WINDOW; best effort.
+    """
+    try:
+        conn = pg_connect()
+    except psycopg2.Error as e:
+        log.warning(f"Could not read last trade timestamps from DB: {e}")
+        return
+    try:
+        with conn.cursor() as cur:
+            for currency in currencies:
+                cur.execute("""
+                    SELECT EXTRACT(EPOCH FROM MAX(deribit_ts)) * 1000
+                    FROM dankbit_trade
+                    WHERE currency = %s
+                      AND deribit_ts >= NOW() AT TIME ZONE 'UTC' - %s * INTERVAL '1 second'
+                """, (currency, BACKFILL_MAX_WINDOW))
+                ts = cur.fetchone()[0]
+                if ts:
+                    gaps.last_seen[currency] = int(ts)
+                    log.info(f"Last {currency} trade in DB: {int(ts)}")
+    except psycopg2.Error as e:
+        log.warning(f"Could not read last trade timestamps from DB: {e}")
+    finally:
+        conn.close()
+
+
+async def backfill_gap(rpc, enqueue, gaps, currency):
+    """
+    Fetch `currency`'s option trades between the last one seen and now,
+    running alongside the live stream. Everything goes through the same
+    `enqueue` as the stream (see handle_notification); the overlap is
+    dropped by ON CONFLICT.
+    The gap is only closed once a page says there is nothing more: an
+    {"error": ...} response is retried with backoff, then given up on with
+    the gap left open, never mistaken for an empty page.
+    """
+    start = gaps.open(currency)
+    if start is None:
+        return
+
+    end = int(time.time() * 1000)
+    since = max(start, end - BACKFILL_MAX_WINDOW * 1000)
+    if since > start:
+        log.warning(f"{currency} gap of {(end - start) / 1000:.0f}s clamped to {BACKFILL_MAX_WINDOW}s.")
+
+    total = 0
+    while True:
+        for attempt in range(BACKFILL_RETRIES + 1):
+            resp = await rpc.call("public/get_last_trades_by_currency_and_time", {
+                "currency": currency,
+                "kind": "option",
+                "start_timestamp": since,
+                "end_timestamp": end,
+                "count": BACKFILL_PAGE_SIZE,
+                "sorting": "asc",
+            })
+            if not resp.get("error"):
+                break
+            if attempt < BACKFILL_RETRIES:
+                await asyncio.sleep(2 ** attempt)
         else:
-            log.error(f"Error from Deribit for {method}: {err}")
+            log.error(
+                f"{currency} backfill gave up at {since} after {BACKFILL_RETRIES} retries "
+                f"({total} trades fetched); the gap stays open until the next reconnect."
+            )
+            return
+
+        result = resp.get("result") or {}
+        trades = result.get("trades") or []
+        if trades:
+            gaps.seen(trades)
+            TRADES_RECEIVED.inc(len(trades), currency=currency, source="backfill")
+            await enqueue(trades)
+            total += len(trades)
+
+        if not trades or not result.get("has_more"):
+            break
+        # Inclusive, since several trades can share the boundary millisecond;
+        # a full page that never leaves one millisecond steps past it.
+        since = max(trades[-1]["timestamp"], since + 1)
+
+    gaps.close(currency, start)
+    log.info(f"Backfilled {total} {currency} trades for a {(end - start) / 1000:.1f}s gap.")
+
+
+async def takeover_backfill(enqueue, currencies=CURRENCIES):
+    """
+    Backfill every currency from the newest trade in the DB — the last one
+    the previous leader committed — over a connection of its own, so it
+    doesn't depend on where (main process or shard) the stream runs.
+    """
+    gaps = GapTracker()
+    await asyncio.get_running_loop().run_in_executor(None, load_last_seen, gaps, currencies)
+
+    async def ignore(_params):
+        pass
+
+    async with websockets.connect(WS_URL, ping_interval=20, ping_timeout=20) as ws:
+        rpc = DeribitRpc(ws, ignore)
+        try:
+            for currency in currencies:
+                await backfill_gap(rpc, enqueue, gaps, currency)
+        finally:
+            rpc.close()
+
+
+# -----------------------------------------------------
+# Live index / mark / open interest state
+# -----------------------------------------------------
+STATE_SQL = """
+    INSERT INTO dankbit_instrument_state
+    (
+        name, currency, index_price, mark_price, mark_iv, open_interest,
+        updated_at, oi_updated_at
+    )
+    VALUES %s
+    ON CONFLICT (name) DO UPDATE SET
+        currency = EXCLUDED.currency,
+        index_price = COALESCE(EXCLUDED.index_price, dankbit_instrument_state.index_price),
+        mark_price = COALESCE(EXCLUDED.mark_price, dankbit_instrument_state.mark_price),
+        mark_iv = COALESCE(EXCLUDED.mark_iv, dankbit_instrument_state.mark_iv),
+        open_interest = COALESCE(EXCLUDED.open_interest, dankbit_instrument_state.open_interest),
+        updated_at = EXCLUDED.updated_at,
+        oi_updated_at = COALESCE(EXCLUDED.oi_updated_at, dankbit_instrument_state.oi_updated_at)
+"""
+
+STATE_COLUMNS = ("index_price", "mark_price", "mark_iv", "open_interest", "updated_at", "oi_updated_at")
+
+
+def utc_now():
+    # dankbit_instrument_state's Datetime columns are naive UTC (Odoo)
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class InstrumentState:
+    """
+    Latest index/mark/OI values received since the last flush, one dict of
+    columns per row name (index name or instrument). Columns a source
+    doesn't carry stay None and keep their stored value (COALESCE in
+    STATE_SQL). The state is only ever "latest wins", so if the DB is
+    unreachable a flush is simply dropped — the next ticks replace it.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.conn = None
+        self.retry_at = 0
+
+    def update(self, name, currency, **values):
+        row = self.rows.setdefault(name, {"currency": currency})
+        row.update(values, updated_at=utc_now())
+
+    def take(self):
+        """Hand over the pending rows (on the event loop, where update() runs)."""
+        rows, self.rows = self.rows, {}
+        return rows
+
+    def write(self, rows):
+        """Upsert `rows` from take(); blocks on the DB, run on the executor."""
+        if self.conn is None or self.conn.closed:
+            if time.monotonic() < self.retry_at:
+                return
+            try:
+                self.conn = pg_connect()
+            except psycopg2.OperationalError as e:
+                log.warning(f"[state] DB connect failed, retrying in {DB_RETRY_MAX}s: {e}")
+                self.retry_at = time.monotonic() + DB_RETRY_MAX
+                return
+
+        values = [
+            (name, row["currency"]) + tuple(row.get(col) for col in STATE_COLUMNS)
+            for name, row in rows.items()
+        ]
+        try:
+            with self.conn.cursor() as cur:
+                execute_values(cur, STATE_SQL, values, page_size=len(values))
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            log.error(f"[state] DB unreachable, dropping {len(values)} state updates: {e}")
+            self.conn.close()
+            self.conn = None
+        except psycopg2.Error as e:
+            log.error(f"[state] Could not write {len(values)} state updates: {e}")
+            self.conn.rollback()
+
+
+def state_channels(currencies=CURRENCIES):
+    channels = []
+    for currency in currencies:
+        channels.append(f"deribit_price_index.{INDEX_NAMES[currency]}")
+        channels.append(f"markprice.options.{currency.lower()}_usd")
+    return channels
+
+
+def handle_state(state, channel, data):
+    if channel.startswith("deribit_price_index."):
+        index_name = data.get("index_name") or channel.split(".", 1)[1]
+        currency = index_name.split("_")[0].upper()
+        state.update(index_name, currency, index_price=data.get("price"))
+    elif channel.startswith("markprice.options."):
+        for m in data if isinstance(data, list) else [data]:
+            name = m.get("instrument_name")
+            if name:
+                # markprice.options sends IV as a fraction; book summaries
+                # (and dankbit_trade.iv) use percent
+                iv = m.get("iv")
+                state.update(
+                    name, name.split("-")[0],
+                    mark_price=m.get("mark_price"),
+                    mark_iv=iv * 100 if iv is not None else None,
+                )
+
+
+async def poll_book_summaries(rpc, state, currencies=CURRENCIES):
+    """
+    Open interest (plus mark price/IV) for every listed option, one
+    get_book_summary_by_currency call per currency every
+    BOOK_SUMMARY_INTERVAL seconds. Runs for the life of one WS connection.
+    """
+    while True:
+        for currency in currencies:
+            try:
+                resp = await rpc.call("public/get_book_summary_by_currency", {
+                    "currency": currency,
+                    "kind": "option",
+                })
+            except ConnectionError:
+                return
+            except asyncio.TimeoutError:
+                log.warning(f"Book summary for {currency} timed out.")
+                continue
+
+            result = resp.get("result")
+            if not isinstance(result, list):
+                continue
+            polled_at = utc_now()
+            for row in result:
+                state.update(
+                    row["instrument_name"], currency,
+                    mark_price=row.get("mark_price"),
+                    mark_iv=row.get("mark_iv"),
+                    open_interest=row.get("open_interest"),
+                    oi_updated_at=polled_at,
+                )
+        await asyncio.sleep(BOOK_SUMMARY_INTERVAL)
+
+
+async def state_writer(state, executor, leadership=None):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(STATE_FLUSH_INTERVAL)
+        rows = state.take()
+        # a standby drops its state updates — they're "latest wins" anyway
+        if rows and (leadership is None or leadership.is_leader):
+            await loop.run_in_executor(executor, state.write, rows)
+
+
+async def handle_notification(enqueue, gaps, state, params):
+    """
+    Route one subscription notification from the WS reader. Trades go to
+    `enqueue` — the trade queue in this process, or the pipe to the main
+    process in a shard worker.
+    """
+    channel = params.get("channel", "")
+    FRAMES.inc(currency=channel_currency(channel), channel=channel.split(".")[0])
+    if not channel.startswith("trades."):
+        if params.get("data"):
+            handle_state(state, channel, params["data"])
+        return
+
+    data = params.get("data")
+    if not data:
+        return
+
+    # Deribit uses either dict (single trade) or list
+    if isinstance(data, dict):
+        trades = [data]
+    else:
+        trades = data
+
+    for t in trades:
+        log.debug(
+            f"{t.get('instrument_name', '???')} | {t.get('direction')} | "
+            f"price {t.get('price')} | amount {t.get('amount')}"
+        )
+    gaps.seen(trades)
+    for currency, count in count_by_currency(trades).items():
+        TRADES_RECEIVED.inc(count, currency=currency, source="stream")
+    await enqueue(trades)
+
+
+async def trade_writer(batch, executor):
+    """
+    Drain the trade queue into `batch`, flushing it on the thread pool by
+    size or age. Runs for the lifetime of the process, across WS reconnects.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            t = await asyncio.wait_for(batch.queue.get(), timeout=batch.time_left())
+        except asyncio.TimeoutError:
+            await loop.run_in_executor(executor, batch.flush)
+            continue
+
+        batch.queue_peak = max(batch.queue_peak, batch.queue.qsize() + 1)
+        trades = [t]
+        while len(trades) < BATCH_MAX_ROWS and not batch.queue.empty():
+            trades.append(batch.queue.get_nowait())
+        batch.add(trades)
+
+        if batch.due():
+            await loop.run_in_executor(executor, batch.flush)
+
+
+# -----------------------------------------------------
+# WebSocket JSON-RPC client
+# -----------------------------------------------------
+class DeribitRpc:
+    """
+    JSON-RPC over one Deribit WS connection. A single reader task owns
+    ws.recv(): a frame carrying an `id` resolves the pending call registered
+    under it, anything else (subscription notifications) is handed to
+    `on_notification`. Calls can therefore be in flight concurrently with
+    each other and with the trade stream, and a notification arriving
+    between a request and its response is never mistaken for it.
+    """
+
+    def __init__(self, ws, on_notification, recorder=None):
+        self.ws = ws
+        self.on_notification = on_notification
+        self.recorder = recorder
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.pace_lock = asyncio.Lock()
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            while True:
+                frame = await self.ws.recv()
+                if self.recorder is not None:
+                    self.recorder.write(frame)
+                msg = json.loads(frame)
+
+                fut = self.pending.pop(msg.get("id"), None)
+                if fut is not None:
+                    if not fut.done():
+                        fut.set_result(msg)
+                elif msg.get("method") == "subscription":
+                    await self.on_notification(msg.get("params") or {})
+        except Exception as e:
+            for fut in self.pending.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError(f"WS reader stopped: {e!r}"))
+            self.pending.clear()
+            raise
+
+    async def call(self, method, params=None):
+        """
+        Send one request and wait for its own response, with basic rate
+        limiting and retry on 'over_limit'.
+        """
+        global last_request_ts
+        async with self.pace_lock:
+            now = time.time()
+            if now - last_request_ts < REQUEST_INTERVAL:
+                await asyncio.sleep(REQUEST_INTERVAL - (now - last_request_ts))
+            last_request_ts = time.time()
+
+        if self.reader.done():
+            raise ConnectionError("WS reader is not running")
+
+        req_id = next(self.ids)
+        fut = asyncio.get_running_loop().create_future()
+        self.pending[req_id] = fut
+        try:
+            await self.ws.send(json.dumps({
+                "jsonrpc": "2.0",
+                "id": req_id,
+                "method": method,
+                "params": params or {}
+            }))
+            resp = await asyncio.wait_for(fut, RPC_TIMEOUT)
+        finally:
+            self.pending.pop(req_id, None)
+
+        if "error" in resp:
+            err = resp["error"]
+            if err.get("message") == "over_limit":
+                log.warning("Rate limit hit. Sleeping 0.5 seconds…")
+                await asyncio.sleep(0.5)
+                return await self.call(method, params)
+            else:
+                log.error(f"Error from Deribit for {method}: {err}")
+
+        return resp
+
+    async def wait_closed(self):
+        """Return (by raising) once the connection's reader stops."""
+        await self.reader
 
-    return resp
+    def close(self):
+        self.reader.cancel()
 
 
 # -----------------------------------------------------
 # Authentication
 # -----------------------------------------------------
-async def authenticate(ws):
+async def authenticate(rpc):
     params = {
         "grant_type": "client_credentials",
         "client_id": os.getenv("DERIBIT_KEY"),
         "client_secret": os.getenv("DERIBIT_SECRET"),
     }
-    resp = await ws_call(ws, "public/auth", params)
+    resp = await rpc.call("public/auth", params)
     if "error" in resp:
         raise Exception(f"Auth failed: {resp}")
     log.info("Authenticated.")
@@ -155,12 +1473,18 @@ async def authenticate(ws):
 
 
 # -----------------------------------------------------
-# Fetch BTC + ETH option instruments
+# Channels to subscribe to
 # -----------------------------------------------------
-async def fetch_instruments(ws):
+def currency_channels(currencies=CURRENCIES):
+    channels = [f"trades.option.{currency}.raw" for currency in currencies]
+    log.info(f"Total channels: {len(channels)} ({', '.join(channels)})")
+    return channels
+
+
+async def fetch_instruments(rpc, currencies=CURRENCIES):
     channels = []
-    for currency in ["BTC", "ETH"]:
-        resp = await ws_call(ws, "public/get_instruments", {
+    for currency in currencies:
+        resp = await rpc.call("public/get_instruments", {
             "currency": currency,
             "kind": "option",
             "expired": False,
@@ -189,7 +1513,7 @@ async def fetch_instruments(ws):
 # -----------------------------------------------------
 # Subscribe in chunks (important for ETH!)
 # -----------------------------------------------------
-async def subscribe_all(ws, channels, chunk_size=SUB_CHUNK_SIZE):
+async def subscribe_all(rpc, channels, chunk_size=SUB_CHUNK_SIZE):
     total = len(channels)
     if total == 0:
         log.warning("No channels to subscribe to.")
@@ -198,7 +1522,7 @@ async def subscribe_all(ws, channels, chunk_size=SUB_CHUNK_SIZE):
     for i in range(0, total, chunk_size):
         part = channels[i:i + chunk_size]
         log.info(f"Subscribing to channels {i+1}–{i+len(part)} of {total}…")
-        resp = await ws_call(ws, "public/subscribe", {"channels": part})
+        resp = await rpc.call("public/subscribe", {"channels": part})
 
         if "error" in resp:
             log.error(f"Subscribe error for chunk {i//chunk_size}: {resp['error']}")
@@ -209,10 +1533,165 @@ async def subscribe_all(ws, channels, chunk_size=SUB_CHUNK_SIZE):
         await asyncio.sleep(0.1)
 
 
+# -----------------------------------------------------
+# Raw frame recording and replay
+# -----------------------------------------------------
+class FrameRecorder:
+    """
+    Appends every inbound frame as {"ts": receive time, "frame": raw text}
+    to a rolling gzip'd JSON-lines file in `directory`. Replayable with
+    --replay. A crash loses at most the gzip buffer of the current file.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.f = None
+        self.opened = 0
+
+    def write(self, frame):
+        now = time.time()
+        if self.f is None or now - self.opened >= RECORD_ROTATE:
+            self._rotate(now)
+        self.f.write(json.dumps({"ts": now, "frame": frame}) + "\n")
+
+    def _rotate(self, now):
+        if self.f is not None:
+            self.f.close()
+        name = datetime.fromtimestamp(now, timezone.utc).strftime("frames-%Y%m%dT%H%M%S.jsonl.gz")
+        self.f = gzip.open(os.path.join(self.directory, name), "at")
+        self.opened = now
+        log.info(f"Recording raw frames to {self.f.name}")
+
+        files = sorted(glob.glob(os.path.join(self.directory, "frames-*.jsonl.gz")))
+        for old in files[:-RECORD_KEEP]:
+            os.remove(old)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+def read_frames(paths):
+    """(receive ts, raw frame) from recordings, in file order."""
+    for path in paths:
+        with gzip.open(path, "rt") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # truncated tail of a file that was still being written
+                    log.warning(f"Skipping unreadable line in {path}")
+                    break
+                yield rec["ts"], rec["frame"]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def replay(paths, speed, unique_ids=False):
+    """
+    Feed recorded frames through the same notification → queue → batch →
+    PostgreSQL path as the live service, `speed` times faster than they
+    were received (0: as fast as the pipeline takes them), then report
+    sustained rows/s, flush (commit) latency percentiles and peak RSS.
+    With unique_ids every trade_id gets a per-run suffix, so a recording
+    can be replayed into the same DB repeatedly without ON CONFLICT
+    turning the run into a no-op.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=TRADE_QUEUE_SIZE)
+    executor = ThreadPoolExecutor(max_workers=WRITER_COUNT, thread_name_prefix="pg-writer")
+    spool = TradeSpool(SPOOL_PATH + ".replay")
+    batches = [TradeBatch(spool, queue, f"replay-{i}", keep_latencies=True) for i in range(WRITER_COUNT)]
+    writers = [asyncio.create_task(trade_writer(batch, executor)) for batch in batches]
+
+    gaps = GapTracker()
+    state = InstrumentState()
+    state_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pg-state")
+    writers.append(asyncio.create_task(state_writer(state, state_executor)))
+
+    enqueue = functools.partial(enqueue_trades, queue)
+    suffix = f"-r{int(time.time())}" if unique_ids else ""
+    log.info(f"Replaying {len(paths)} recording(s) at {f'{speed}x' if speed else 'max'} speed…")
+
+    frames = 0
+    first_ts = None
+    started = time.monotonic()
+    for ts, frame in read_frames(paths):
+        if first_ts is None:
+            first_ts = ts
+        if speed:
+            delay = (ts - first_ts) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        msg = json.loads(frame)
+        if msg.get("method") != "subscription":
+            continue
+        params = msg.get("params") or {}
+        if suffix and params.get("channel", "").startswith("trades."):
+            data = params.get("data")
+            for t in [data] if isinstance(data, dict) else data or []:
+                t["trade_id"] = f"{t.get('trade_id')}{suffix}"
+
+        await handle_notification(enqueue, gaps, state, params)
+        frames += 1
+        if frames % 100 == 0:
+            await asyncio.sleep(0)  # let the writers in at max speed
+
+    # Drain: wait for the queue, stop the writers, let in-flight flushes
+    # finish, then flush whatever they still held.
+    while not queue.empty():
+        await asyncio.sleep(0.01)
+    for task in writers:
+        task.cancel()
+    await asyncio.gather(*writers, return_exceptions=True)
+    await asyncio.to_thread(executor.shutdown)
+    await asyncio.to_thread(state_executor.shutdown)
+    for batch in batches:
+        await loop.run_in_executor(None, batch.flush)
+    await loop.run_in_executor(None, state.write, state.take())
+    elapsed = time.monotonic() - started
+
+    rows = sum(batch.total_rows for batch in batches)
+    latencies = [lat for batch in batches for lat in batch.latencies]
+    recorded = (ts - first_ts) if first_ts is not None else 0
+    log.info(
+        f"Replayed {frames} notifications / {rows} trades ({recorded:.1f}s recorded) in {elapsed:.1f}s: "
+        f"{rows / elapsed if elapsed else 0:.1f} rows/s, {len(latencies)} flushes, commit latency "
+        f"p50 {1000 * percentile(latencies, 50):.1f} ms / p99 {1000 * percentile(latencies, 99):.1f} ms / "
+        f"max {1000 * max(latencies, default=0):.1f} ms, "
+        f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB"
+    )
+    for batch in batches:
+        batch.log_stats(force=True)
+
+
 # -----------------------------------------------------
 # Main loop
 # -----------------------------------------------------
-async def run():
+def log_backfill_failure(task):
+    if not task.cancelled() and task.exception():
+        log.error(f"Gap backfill failed, will retry after the next reconnect: {task.exception()}")
+
+
+async def stream(currencies, enqueue, gaps, state, recorder=None, part=0, parts=1):
+    """
+    Connect, subscribe to `currencies`' option trades and feed them to
+    `enqueue`, reconnecting forever. With parts > 1 (instrument mode shards)
+    only every parts-th instrument channel is taken, and only part 0 also
+    carries the currency-wide work: state channels, book summaries and the
+    reconnect backfill.
+    """
+    async def on_notification(params):
+        await handle_notification(enqueue, gaps, state, params)
+
     while True:
         try:
             log.info("Connecting to Deribit WS…")
@@ -221,56 +1700,248 @@ async def run():
                 ping_interval=20,
                 ping_timeout=20,
             ) as ws:
+                rpc = DeribitRpc(ws, on_notification, recorder)
+                poller = None
+                try:
+                    # 1) Auth
+                    await authenticate(rpc)
 
-                # 1) Auth
-                await authenticate(ws)
-
-                # 2) Fetch instruments
-                log.info("Fetching instrument list…")
-                channels = await fetch_instruments(ws)
-                log.info(f"Found {len(channels)} option channels to subscribe.")
-
-                # 3) Subscribe (BTC + ETH, in chunks)
-                await subscribe_all(ws, channels)
-
-                log.info("Listening for raw option trades…")
+                    # 2) Pick channels: per currency, or per instrument
+                    if SUBSCRIPTION_MODE == "instrument":
+                        log.info("Fetching instrument list…")
+                        channels = await fetch_instruments(rpc, currencies)
+                        if parts > 1:
+                            channels = [c for c in channels if zlib.crc32(c.encode()) % parts == part]
+                    else:
+                        channels = currency_channels(currencies)
+                    log.info(f"Found {len(channels)} option channels to subscribe ({SUBSCRIPTION_MODE} mode).")
 
-                # 4) Main receive loop
-                while True:
-                    raw = await ws.recv()
-                    msg = json.loads(raw)
+                    # 3) Subscribe (in chunks), plus the index and mark
+                    #    price streams for the live state table
+                    if part == 0:
+                        channels = channels + state_channels(currencies)
+                    await subscribe_all(rpc, channels)
+                    if part == 0:
+                        poller = asyncio.create_task(poll_book_summaries(rpc, state, currencies))
 
-                    params = msg.get("params")
-                    if not params:
-                        continue
+                    log.info("Listening for raw option trades…")
+                    CONNECTED.set(1)
 
-                    data = params.get("data")
-                    if not data:
-                        continue
+                    # 4) Backfill whatever printed while we were away,
+                    #    concurrently with the live stream
+                    if part == 0:
+                        backfills = [
+                            asyncio.create_task(backfill_gap(rpc, enqueue, gaps, currency))
+                            for currency in currencies
+                        ]
+                        for task in backfills:
+                            task.add_done_callback(log_backfill_failure)
 
-                    # Deribit uses either dict (single trade) or list
-                    if isinstance(data, dict):
-                        trades = [data]
-                    else:
-                        trades = data
-
-                    for t in trades:
-                        instr = t.get("instrument_name", "???")
-                        try:
-                            log.debug(
-                                f"{instr} | {t.get('direction')} | "
-                                f"price {t.get('price')} | amount {t.get('amount')}"
-                            )
-                            insert_trade(t)
-                        except Exception as e:
-                            log.error(f"Error processing trade {instr}: {e}")
+                    # 5) Trades flow through the reader until the socket drops
+                    await rpc.wait_closed()
+                finally:
+                    if poller is not None:
+                        poller.cancel()
+                    rpc.close()
 
         except Exception as e:
+            CONNECTED.set(0)
+            RECONNECTS.inc()
             log.error(f"WS error: {e}")
             log.info("Reconnecting in 3 seconds…")
             await asyncio.sleep(3)
 
 
+# -----------------------------------------------------
+# Shard worker processes
+# -----------------------------------------------------
+def shard_specs():
+    """(name, currencies, part, parts) for each shard process."""
+    if SHARD_BY != "currency":
+        raise ValueError(f"Unknown SHARD_BY={SHARD_BY!r} (expected 'currency')")
+    parts = SHARDS_PER_CURRENCY if SUBSCRIPTION_MODE == "instrument" else 1
+    if parts != SHARDS_PER_CURRENCY:
+        log.warning("SHARDS_PER_CURRENCY only applies in instrument mode; using one shard per currency.")
+    return [
+        (currency if parts == 1 else f"{currency}-{part}", [currency], part, parts)
+        for currency in CURRENCIES
+        for part in range(parts)
+    ]
+
+
+class ShardOutbox:
+    """A shard worker's end of the multiprocessing queue to the main
+    process. Blocks (off the event loop) while the queue is full, which
+    is the same backpressure enqueue_trades() applies in-process."""
+
+    def __init__(self, name, mp_queue):
+        self.name = name
+        self.mp_queue = mp_queue
+
+    async def send(self, msg):
+        global last_queue_full_warning
+        try:
+            self.mp_queue.put_nowait(msg)
+        except Full:
+            if time.time() - last_queue_full_warning > STATS_INTERVAL:
+                last_queue_full_warning = time.time()
+                log.warning(f"Shard queue full ({SHARD_QUEUE_SIZE}) — pausing WS reads until the writers catch up.")
+            await asyncio.get_running_loop().run_in_executor(None, self.mp_queue.put, msg)
+
+    async def trades(self, trades):
+        await self.send(("trades", trades))
+
+
+async def shard_reporter(outbox, state):
+    """Ship this shard's coalesced state rows and metric values to the main
+    process every STATE_FLUSH_INTERVAL; exit if the main process is gone."""
+    parent = os.getppid()
+    while os.getppid() == parent:
+        await asyncio.sleep(STATE_FLUSH_INTERVAL)
+        rows = state.take()
+        if rows:
+            await outbox.send(("state", rows))
+        await outbox.send(("metrics", outbox.name, shard_metrics()))
+    log.error("Main process exited, stopping shard.")
+    os._exit(1)
+
+
+async def run_shard(name, currencies, part, parts, mp_queue):
+    outbox = ShardOutbox(name, mp_queue)
+    gaps = GapTracker()
+    if part == 0:
+        load_last_seen(gaps, currencies)
+    state = InstrumentState()  # only coalesces here; the main process writes
+    reporter = asyncio.create_task(shard_reporter(outbox, state))
+    recorder = FrameRecorder(os.path.join(RECORD_DIR, name)) if RECORD_DIR else None
+    try:
+        await stream(currencies, outbox.trades, gaps, state, recorder, part, parts)
+    finally:
+        reporter.cancel()
+
+
+def shard_main(name, currencies, part, parts, mp_queue):
+    """Entry point of a shard process."""
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter(f"[%(asctime)s] [{name}] %(message)s"))
+    log.info(f"Shard {name} starting for {', '.join(currencies)}"
+             + (f" (part {part + 1} of {parts})" if parts > 1 else "") + "…")
+    asyncio.run(run_shard(name, currencies, part, parts, mp_queue))
+
+
+async def supervise_shards(mp_queue):
+    """Start one process per shard and restart any that dies, on its own —
+    the other shards keep streaming."""
+    ctx = mp.get_context("spawn")
+    specs = shard_specs()
+    procs = {}
+    while True:
+        for spec in specs:
+            proc = procs.get(spec[0])
+            if proc is not None and proc.is_alive():
+                continue
+            if proc is not None:
+                log.error(f"Shard {spec[0]} exited with code {proc.exitcode}, restarting.")
+                retire_shard_metrics(spec[0])
+                RECONNECTS.inc()
+            proc = ctx.Process(target=shard_main, args=spec + (mp_queue,), name=f"shard-{spec[0]}", daemon=True)
+            proc.start()
+            procs[spec[0]] = proc
+        await asyncio.sleep(SHARD_RESTART_DELAY)
+
+
+async def drain_shards(mp_queue, leadership, gaps, state):
+    """Main process side: move shard messages into the trade queue / state."""
+    loop = asyncio.get_running_loop()
+    reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shard-reader")
+    while True:
+        msg = await loop.run_in_executor(reader, mp_queue.get)
+        if msg[0] == "trades":
+            gaps.seen(msg[1])
+            await leadership.enqueue(msg[1])
+        elif msg[0] == "state":
+            for name, row in msg[1].items():
+                state.rows.setdefault(name, {}).update(row)
+        elif msg[0] == "metrics":
+            merge_shard_metrics(msg[1], msg[2])
+
+
+# -----------------------------------------------------
+# Main loop
+# -----------------------------------------------------
+async def run():
+    # The queue and its writers survive WS reconnects: trades already
+    # received keep draining into the DB while the socket is re-established.
+    queue = asyncio.Queue(maxsize=TRADE_QUEUE_SIZE)
+    executor = ThreadPoolExecutor(max_workers=WRITER_COUNT, thread_name_prefix="pg-writer")
+    spool = TradeSpool(SPOOL_PATH)
+    writers = [
+        asyncio.create_task(trade_writer(TradeBatch(spool, queue, f"writer-{i}"), executor))
+        for i in range(WRITER_COUNT)
+    ]
+
+    gaps = GapTracker()
+    await asyncio.get_running_loop().run_in_executor(executor, load_last_seen, gaps)
+
+    # Only the replica holding the writer lock writes (see Leadership)
+    leadership = Leadership(queue)
+    if LEADER_ELECTION:
+        leader_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pg-leader")
+        writers.append(asyncio.create_task(leadership.run(leader_executor)))
+
+    # Own single thread, so state upserts never queue behind trade flushes
+    state = InstrumentState()
+    state_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pg-state")
+    writers.append(asyncio.create_task(state_writer(state, state_executor, leadership)))
+
+    if METRICS_PORT:
+        QUEUE_DEPTH.collect = lambda: {(): queue.qsize()}
+        QUEUE_CAPACITY.set(TRADE_QUEUE_SIZE)
+        SPOOL_BYTES.collect = lambda: {(): spool.size}
+        SINCE_LAST_TRADE.collect = lambda: {
+            (currency,): round(time.time() - ts / 1000.0, 3) for currency, ts in list(gaps.last_seen.items())
+        }
+        start_metrics_server(METRICS_PORT)
+
+    if SHARD_BY:
+        mp_queue = mp.get_context("spawn").Queue(maxsize=SHARD_QUEUE_SIZE)
+        await asyncio.gather(
+            supervise_shards(mp_queue),
+            drain_shards(mp_queue, leadership, gaps, state),
+        )
+    else:
+        recorder = FrameRecorder(RECORD_DIR) if RECORD_DIR else None
+        await stream(CURRENCIES, leadership.enqueue, gaps, state, recorder)
+
+
+def parse_speed(value):
+    value = value.lower()
+    if value == "max":
+        return 0
+    speed = float(value.removesuffix("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
 if __name__ == "__main__":
-    log.info("Starting dankbit raw option trade listener…")
-    asyncio.run(run())
+    parser = argparse.ArgumentParser(description="Deribit raw option trade listener.")
+    parser.add_argument(
+        "--replay", nargs="+", metavar="FILE",
+        help="replay recorded frames (RECORD_DIR files) into the DB instead of connecting to Deribit",
+    )
+    parser.add_argument(
+        "--speed", type=parse_speed, default=1.0,
+        help="replay speed: 1 (as recorded, default), N / Nx (N times faster) or max",
+    )
+    parser.add_argument(
+        "--unique-ids", action="store_true",
+        help="suffix replayed trade ids so repeated replays insert instead of conflicting",
+    )
+    args = parser.parse_args()
+
+    if args.replay:
+        asyncio.run(replay(args.replay, args.speed, args.unique_ids))
+    else:
+        log.info("Starting dankbit raw option trade listener…")
+        asyncio.run(run())
@@ -0,0 +1,331 @@
+import asyncio
+import bisect
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import websockets
+
+# -----------------------------------------------------
+# Local stand-in for Deribit's WS API, for ingest benchmarks
+#
+# Speaks the subset of JSON-RPC dankbit_ws_batch.py uses (public/auth,
+# get_instruments, subscribe, get_last_trades_by_currency_and_time,
+# get_book_summary_by_currency and subscription notifications for trades,
+# index price and mark price) and streams synthetic option trades across a
+# BTC/ETH strike/expiry universe shaped like the real one. Point the
+# service at it with DERIBIT_WS_URL=ws://<host>:<STANDIN_PORT>/.
+# -----------------------------------------------------
+
+# -----------------------------------------------------
+# Config
+# -----------------------------------------------------
+HOST = os.getenv("STANDIN_HOST", "0.0.0.0")
+PORT = int(os.getenv("STANDIN_PORT", "8765"))
+
+# Baseline trade rate (all currencies together), and a burst profile: every
+# BURST_EVERY seconds the rate is multiplied by BURST_MULTIPLIER for
+# BURST_SECONDS — an expiry settlement or a big block print.
+TRADES_PER_SEC = float(os.getenv("STANDIN_TRADES_PER_SEC", "20"))
+BURST_EVERY = float(os.getenv("STANDIN_BURST_EVERY", "300"))
+BURST_SECONDS = float(os.getenv("STANDIN_BURST_SECONDS", "10"))
+BURST_MULTIPLIER = float(os.getenv("STANDIN_BURST_MULTIPLIER", "50"))
+BLOCK_TRADE_RATIO = 0.02
+BTC_SHARE = 0.7          # share of trades on BTC, the rest on ETH
+
+# Reconnect storms: close every client connection every DROP_EVERY seconds
+# (0 disables).
+DROP_EVERY = float(os.getenv("STANDIN_DROP_EVERY", "0"))
+
+TICK = 0.05              # seconds between trade batches
+STATE_INTERVAL = 1.0     # seconds between index / mark price notifications
+HISTORY_SIZE = 200000    # trades kept per currency for backfill requests
+
+# spot, strike step, strikes either side of spot
+UNIVERSE = {
+    "BTC": {"spot": 65000.0, "step": 1000, "strikes": 30, "index_name": "btc_usdt"},
+    "ETH": {"spot": 3000.0, "step": 50, "strikes": 30, "index_name": "eth_usdt"},
+}
+
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
+log = logging.getLogger("standin")
+
+
+# -----------------------------------------------------
+# Synthetic market
+# -----------------------------------------------------
+def expiry_dates(now):
+    """Deribit-like listing: the next 4 dailies, 4 Friday weeklies and the
+    last Friday of the next 3 months, all at 08:00 UTC."""
+    today = now.replace(hour=8, minute=0, second=0, microsecond=0)
+    if today <= now:
+        today += timedelta(days=1)
+
+    dates = {today + timedelta(days=i) for i in range(4)}
+    friday = today + timedelta(days=(4 - today.weekday()) % 7)
+    dates.update(friday + timedelta(weeks=i) for i in range(4))
+    for months in range(1, 4):
+        first = (today.replace(day=1) + timedelta(days=32 * months)).replace(day=1)
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        dates.add(last - timedelta(days=(last.weekday() - 4) % 7))
+    return sorted(dates)
+
+
+class Market:
+
+    def __init__(self):
+        now = datetime.now(timezone.utc)
+        self.trade_ids = itertools.count(int(time.time() * 1000))
+        self.trade_seq = itertools.count(1)
+        self.spot = {c: u["spot"] for c, u in UNIVERSE.items()}
+        self.instruments = {c: [] for c in UNIVERSE}
+        self.history = {c: deque(maxlen=HISTORY_SIZE) for c in UNIVERSE}
+
+        for currency, u in UNIVERSE.items():
+            atm = round(u["spot"] / u["step"]) * u["step"]
+            for exp in expiry_dates(now):
+                code = exp.strftime("%d%b%y").upper().lstrip("0")
+                for k in range(-u["strikes"], u["strikes"] + 1):
+                    strike = atm + k * u["step"]
+                    for kind in ("C", "P"):
+                        self.instruments[currency].append({
+                            "instrument_name": f"{currency}-{code}-{strike}-{kind}",
+                            "kind": "option",
+                            "option_type": "call" if kind == "C" else "put",
+                            "strike": strike,
+                            "expiration_timestamp": int(exp.timestamp() * 1000),
+                            "base_currency": currency,
+                            "is_active": True,
+                        })
+
+    def step(self, dt):
+        for currency in self.spot:
+            self.spot[currency] *= math.exp(random.gauss(0, 0.0004 * math.sqrt(dt)))
+
+    def mark(self, inst, currency):
+        """Rough option value in units of the underlying, and its IV."""
+        spot = self.spot[currency]
+        years = max(inst["expiration_timestamp"] / 1000 - time.time(), 3600) / (365 * 86400)
+        moneyness = math.log(inst["strike"] / spot)
+        iv = 0.5 + 0.8 * moneyness ** 2
+        intrinsic = max(spot - inst["strike"], 0) if inst["option_type"] == "call" else max(inst["strike"] - spot, 0)
+        time_value = 0.4 * spot * iv * math.sqrt(years) * math.exp(-(moneyness ** 2) / (2 * iv * iv * years))
+        return max(round((intrinsic + time_value) / spot, 4), 0.0001), round(iv * 100, 2)
+
+    def trade(self, currency):
+        # Like the real book, most of the flow is in the nearest expiries
+        # and close to the money.
+        instruments = self.instruments[currency]
+        inst = instruments[min(int(random.expovariate(3.0) * len(instruments) / 4), len(instruments) - 1)]
+        mark, iv = self.mark(inst, currency)
+        block = random.random() < BLOCK_TRADE_RATIO
+        t = {
+            "trade_seq": next(self.trade_seq),
+            "trade_id": str(next(self.trade_ids)),
+            "timestamp": int(time.time() * 1000),
+            "tick_direction": random.randint(0, 3),
+            "price": round(mark * random.uniform(0.97, 1.03), 4),
+            "mark_price": mark,
+            "iv": iv,
+            "instrument_name": inst["instrument_name"],
+            "index_price": round(self.spot[currency], 2),
+            "direction": random.choice(("buy", "sell")),
+            "amount": round(random.choice((0.1, 0.5, 1, 2, 5, 10, 25)) * (20 if block else 1), 1),
+        }
+        if block:
+            t["block_trade_id"] = str(next(self.trade_ids))
+        self.history[currency].append(t)
+        return t
+
+    def trades_between(self, currency, start, end, count, sorting):
+        history = self.history[currency]
+        stamps = [t["timestamp"] for t in history]
+        lo, hi = bisect.bisect_left(stamps, start), bisect.bisect_right(stamps, end)
+        selected = list(itertools.islice(history, lo, hi))
+        if sorting == "desc":
+            selected.reverse()
+        return selected[:count], len(selected) > count
+
+    def book_summary(self, currency):
+        rows = []
+        for inst in self.instruments[currency]:
+            mark, iv = self.mark(inst, currency)
+            rows.append({
+                "instrument_name": inst["instrument_name"],
+                "mark_price": mark,
+                "mark_iv": iv,
+                "open_interest": round(random.uniform(0, 2000), 1),
+                "underlying_price": round(self.spot[currency], 2),
+            })
+        return rows
+
+
+# -----------------------------------------------------
+# Connections
+# -----------------------------------------------------
+class Client:
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.channels = set()
+
+    async def send(self, channel, data):
+        await self.ws.send(json.dumps({
+            "jsonrpc": "2.0",
+            "method": "subscription",
+            "params": {"channel": channel, "data": data},
+        }))
+
+
+class StandIn:
+
+    def __init__(self):
+        self.market = Market()
+        self.clients = set()
+        self.sent = 0
+
+    def dispatch(self, method, params):
+        currency = params.get("currency")
+        if method == "public/auth":
+            return {"access_token": "standin", "expires_in": 900, "token_type": "bearer"}
+        if method == "public/get_instruments":
+            return self.market.instruments.get(currency, [])
+        if method == "public/get_last_trades_by_currency_and_time":
+            trades, has_more = self.market.trades_between(
+                currency,
+                params.get("start_timestamp", 0),
+                params.get("end_timestamp", int(time.time() * 1000)),
+                params.get("count", 10),
+                params.get("sorting", "asc"),
+            )
+            return {"trades": trades, "has_more": has_more}
+        if method == "public/get_book_summary_by_currency":
+            return self.market.book_summary(currency)
+        return None
+
+    async def serve(self, ws):
+        client = Client(ws)
+        self.clients.add(client)
+        log.info(f"Client connected ({len(self.clients)} connected).")
+        try:
+            async for frame in ws:
+                msg = json.loads(frame)
+                method, params = msg.get("method"), msg.get("params") or {}
+                resp = {"jsonrpc": "2.0", "id": msg.get("id")}
+
+                if method in ("public/subscribe", "private/subscribe"):
+                    client.channels.update(params.get("channels", []))
+                    resp["result"] = params.get("channels", [])
+                elif method == "public/unsubscribe":
+                    client.channels.difference_update(params.get("channels", []))
+                    resp["result"] = params.get("channels", [])
+                else:
+                    result = self.dispatch(method, params)
+                    if result is None:
+                        resp["error"] = {"code": -32601, "message": "Method not found"}
+                    else:
+                        resp["result"] = result
+                await ws.send(json.dumps(resp))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients.discard(client)
+            log.info(f"Client disconnected ({len(self.clients)} connected).")
+
+    async def publish(self, channel_trades):
+        for client in list(self.clients):
+            for channel, trades in channel_trades.items():
+                if channel in client.channels:
+                    try:
+                        await client.send(channel, trades)
+                    except websockets.ConnectionClosed:
+                        break
+                    self.sent += len(trades)
+
+    def rate(self, now):
+        if BURST_EVERY and now % BURST_EVERY < BURST_SECONDS:
+            return TRADES_PER_SEC * BURST_MULTIPLIER
+        return TRADES_PER_SEC
+
+    async def trade_loop(self):
+        pending = 0.0
+        while True:
+            await asyncio.sleep(TICK)
+            self.market.step(TICK)
+            pending += self.rate(time.time()) * TICK
+            count, pending = int(pending), pending - int(pending)
+            if not count:
+                continue
+
+            channel_trades = {}
+            for _ in range(count):
+                currency = "BTC" if random.random() < BTC_SHARE else "ETH"
+                t = self.market.trade(currency)
+                channel_trades.setdefault(f"trades.option.{currency}.raw", []).append(t)
+                channel_trades.setdefault(f"trades.{t['instrument_name']}.raw", []).append(t)
+            await self.publish(channel_trades)
+
+    async def state_loop(self):
+        while True:
+            await asyncio.sleep(STATE_INTERVAL)
+            now = int(time.time() * 1000)
+            for client in list(self.clients):
+                for currency, u in UNIVERSE.items():
+                    index_channel = f"deribit_price_index.{u['index_name']}"
+                    mark_channel = f"markprice.options.{currency.lower()}_usd"
+                    try:
+                        if index_channel in client.channels:
+                            await client.send(index_channel, {
+                                "index_name": u["index_name"],
+                                "price": round(self.market.spot[currency], 2),
+                                "timestamp": now,
+                            })
+                        if mark_channel in client.channels:
+                            marks = []
+                            for inst in self.market.instruments[currency]:
+                                mark, iv = self.market.mark(inst, currency)
+                                marks.append({
+                                    "instrument_name": inst["instrument_name"],
+                                    "mark_price": mark,
+                                    "iv": iv / 100,
+                                    "timestamp": now,
+                                })
+                            await client.send(mark_channel, marks)
+                    except websockets.ConnectionClosed:
+                        break
+
+    async def drop_loop(self):
+        while DROP_EVERY:
+            await asyncio.sleep(DROP_EVERY)
+            log.info(f"Dropping {len(self.clients)} connection(s).")
+            for client in list(self.clients):
+                await client.ws.close(code=1012, reason="stand-in reconnect storm")
+
+    async def stats_loop(self):
+        while True:
+            await asyncio.sleep(60)
+            log.info(f"Sent {self.sent} trades in the last 60s ({self.sent / 60:.1f}/s) to {len(self.clients)} client(s).")
+            self.sent = 0
+
+
+async def main():
+    standin = StandIn()
+    counts = {c: len(i) for c, i in standin.market.instruments.items()}
+    log.info(f"Deribit stand-in on ws://{HOST}:{PORT}/ — instruments {counts}, {TRADES_PER_SEC}/s baseline.")
+    async with websockets.serve(standin.serve, HOST, PORT, max_size=None):
+        await asyncio.gather(
+            standin.trade_loop(),
+            standin.state_loop(),
+            standin.drop_loop(),
+            standin.stats_loop(),
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+import asyncio
+
+import dankbit_ws_batch as ws
+
+
+class FakeRpc:
+    """Answers public/get_last_trades_by_currency_and_time from a list of
+    canned responses, recording the start_timestamp of each call."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.starts = []
+
+    async def call(self, method, params=None):
+        self.starts.append(params["start_timestamp"])
+        return self.responses.pop(0)
+
+
+def trade(ts, currency="BTC"):
+    return {"instrument_name": f"{currency}-27MAR26-100000-C", "timestamp": ts, "trade_id": str(ts)}
+
+
+def run_backfill(rpc, gaps, monkeypatch):
+    enqueued = []
+
+    async def enqueue(trades):
+        enqueued.extend(trades)
+
+    async def no_sleep(_delay):
+        pass
+
+    monkeypatch.setattr(ws.asyncio, "sleep", no_sleep)
+    asyncio.run(ws.backfill_gap(rpc, enqueue, gaps, "BTC"))
+    return enqueued
+
+
+def test_gap_closed_after_last_page(monkeypatch):
+    gaps = ws.GapTracker()
+    now = int(ws.time.time() * 1000)
+    gaps.last_seen["BTC"] = now - 5000
+    rpc = FakeRpc([
+        {"result": {"trades": [trade(now - 4000), trade(now - 3000)], "has_more": True}},
+        {"result": {"trades": [trade(now - 2000)], "has_more": False}},
+    ])
+
+    enqueued = run_backfill(rpc, gaps, monkeypatch)
+
+    assert [t["timestamp"] for t in enqueued] == [now - 4000, now - 3000, now - 2000]
+    assert rpc.starts == [now - 5000, now - 3000]
+    assert "BTC" not in gaps.open_gaps
+    assert gaps.last_seen["BTC"] == now - 2000
+
+
+def test_full_page_on_one_millisecond_still_advances(monkeypatch):
+    gaps = ws.GapTracker()
+    now = int(ws.time.time() * 1000)
+    gaps.last_seen["BTC"] = now - 5000
+    rpc = FakeRpc([
+        {"result": {"trades": [trade(now - 5000)] * 3, "has_more": True}},
+        {"result": {"trades": [], "has_more": False}},
+    ])
+
+    run_backfill(rpc, gaps, monkeypatch)
+
+    assert rpc.starts == [now - 5000, now - 4999]
+
+
+def test_error_response_is_retried(monkeypatch):
+    gaps = ws.GapTracker()
+    now = int(ws.time.time() * 1000)
+    gaps.last_seen["BTC"] = now - 5000
+    rpc = FakeRpc([
+        {"error": {"code": 10028, "message": "too_many_requests"}},
+        {"result": {"trades": [trade(now - 4000)], "has_more": False}},
+    ])
+
+    enqueued = run_backfill(rpc, gaps, monkeypatch)
+
+    assert len(enqueued) == 1
+    assert rpc.starts == [now - 5000, now - 5000]
+    assert "BTC" not in gaps.open_gaps
+
+
+def test_persistent_error_leaves_gap_open(monkeypatch):
+    gaps = ws.GapTracker()
+    now = int(ws.time.time() * 1000)
+    gaps.last_seen["BTC"] = now - 5000
+    rpc = FakeRpc([{"error": {"code": 13028, "message": "temporarily_unavailable"}}] * (ws.BACKFILL_RETRIES + 1))
+
+    enqueued = run_backfill(rpc, gaps, monkeypatch)
+
+    assert enqueued == []
+    assert len(rpc.starts) == ws.BACKFILL_RETRIES + 1
+    assert gaps.open_gaps == {"BTC": now - 5000}
+    # the next reconnect resumes from the same, older start
+    gaps.seen([trade(now)])
+    assert gaps.open("BTC") == now - 5000
+
+
+def test_gap_tracker_open_seen_close():
+    gaps = ws.GapTracker()
+    assert gaps.open("ETH") is None
+
+    gaps.seen([trade(1000, "ETH"), trade(900, "ETH"), trade(1200, "BTC")])
+    assert gaps.last_seen == {"ETH": 1000, "BTC": 1200}
+
+    assert gaps.open("ETH") == 1000
+    gaps.seen([trade(1500, "ETH")])
+    # an unfinished gap wins over what the stream has seen since
+    assert gaps.open("ETH") == 1000
+    # closing a different (stale) start is a no-op
+    gaps.close("ETH", 1500)
+    assert gaps.open_gaps == {"ETH": 1000}
+    gaps.close("ETH", 1000)
+    assert gaps.open("ETH") == 1500
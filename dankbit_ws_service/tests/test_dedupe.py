@@ -0,0 +1,31 @@
+import dankbit_ws_batch as ws
+
+
+def ids(trades):
+    return [t["trade_id"] for t in trades]
+
+
+def batch(*trade_ids):
+    return [{"trade_id": trade_id} for trade_id in trade_ids]
+
+
+def test_drops_repeats_within_and_across_batches():
+    cache = ws.TradeIdCache(10)
+    assert ids(cache.filter(batch("a", "b", "a"))) == ["a", "b"]
+    assert ids(cache.filter(batch("b", "c"))) == ["c"]
+
+
+def test_evicts_least_recently_seen():
+    cache = ws.TradeIdCache(2)
+    cache.filter(batch("a", "b"))
+    # seeing "a" again makes "b" the oldest
+    assert cache.filter(batch("a")) == []
+    cache.filter(batch("c"))
+    assert list(cache.ids) == ["a", "c"]
+    assert ids(cache.filter(batch("b"))) == ["b"]
+
+
+def test_disabled_passes_everything_through():
+    cache = ws.TradeIdCache(0)
+    trades = batch("a", "a")
+    assert cache.filter(trades) is trades
@@ -0,0 +1,61 @@
+import dankbit_ws_batch as ws
+
+
+class FakeConn:
+    """Answers the dankbit_instrument lookup from a name → id dict,
+    recording the names asked for in each query."""
+
+    def __init__(self, instruments):
+        self.instruments = instruments
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        names = params[0]
+        self.conn.queries.append(sorted(names))
+        self.rows = [(name, self.conn.instruments[name]) for name in names if name in self.conn.instruments]
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_looks_up_only_names_it_has_not_seen(monkeypatch):
+    monkeypatch.setattr(ws, "INSTRUMENT_IDS", {})
+    conn = FakeConn({"BTC-27MAR26-100000-C": 1, "ETH-27MAR26-4000-P": 2})
+
+    ids = ws.instrument_ids(conn, ["BTC-27MAR26-100000-C", "BTC-27MAR26-100000-C", None])
+    assert ids["BTC-27MAR26-100000-C"] == 1
+    ids = ws.instrument_ids(conn, ["BTC-27MAR26-100000-C", "ETH-27MAR26-4000-P"])
+    assert ids["ETH-27MAR26-4000-P"] == 2
+    assert conn.queries == [["BTC-27MAR26-100000-C"], ["ETH-27MAR26-4000-P"]]
+
+    # everything cached: no query at all
+    ws.instrument_ids(conn, ["ETH-27MAR26-4000-P"])
+    assert len(conn.queries) == 2
+
+
+def test_unknown_instrument_gets_null_and_is_asked_again(monkeypatch):
+    monkeypatch.setattr(ws, "INSTRUMENT_IDS", {})
+    conn = FakeConn({})
+
+    ids = ws.instrument_ids(conn, ["BTC-1JAN30-1000-C"])
+    assert ws.trade_row({"instrument_name": "BTC-1JAN30-1000-C"}, ids)[1] is None
+
+    conn.instruments["BTC-1JAN30-1000-C"] = 7
+    ids = ws.instrument_ids(conn, ["BTC-1JAN30-1000-C"])
+    assert ws.trade_row({"instrument_name": "BTC-1JAN30-1000-C"}, ids)[1] == 7
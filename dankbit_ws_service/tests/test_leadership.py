@@ -0,0 +1,28 @@
+import asyncio
+
+import dankbit_ws_batch as ws
+
+
+def test_takeover_flushes_buffer_then_backfills(monkeypatch):
+    monkeypatch.setattr(ws, "LEADER_ELECTION", True)
+    monkeypatch.setattr(ws, "recent_trade_ids", ws.TradeIdCache(100))
+    calls = []
+
+    async def fake_backfill(enqueue):
+        calls.append(enqueue)
+        await enqueue([{"trade_id": "late"}])
+
+    monkeypatch.setattr(ws, "takeover_backfill", fake_backfill)
+
+    async def scenario():
+        queue = asyncio.Queue()
+        leadership = ws.Leadership(queue)
+        await leadership.enqueue([{"trade_id": "buffered"}])
+        assert queue.empty(), "a standby only buffers"
+
+        await leadership.take_over()
+        await leadership.backfill
+        return [queue.get_nowait()["trade_id"] for _ in range(queue.qsize())]
+
+    assert asyncio.run(scenario()) == ["buffered", "late"]
+    assert len(calls) == 1
@@ -0,0 +1,56 @@
+import asyncio
+import queue
+import threading
+import time
+
+import pytest
+
+import dankbit_ws_batch as ws
+
+
+def test_one_shard_per_currency(monkeypatch):
+    monkeypatch.setattr(ws, "SHARD_BY", "currency")
+    monkeypatch.setattr(ws, "SUBSCRIPTION_MODE", "currency")
+    monkeypatch.setattr(ws, "SHARDS_PER_CURRENCY", 3)
+
+    # parts only apply to instrument channels
+    assert ws.shard_specs() == [("BTC", ["BTC"], 0, 1), ("ETH", ["ETH"], 0, 1)]
+
+
+def test_instrument_mode_splits_each_currency(monkeypatch):
+    monkeypatch.setattr(ws, "SHARD_BY", "currency")
+    monkeypatch.setattr(ws, "SUBSCRIPTION_MODE", "instrument")
+    monkeypatch.setattr(ws, "SHARDS_PER_CURRENCY", 2)
+
+    assert ws.shard_specs() == [
+        ("BTC-0", ["BTC"], 0, 2), ("BTC-1", ["BTC"], 1, 2),
+        ("ETH-0", ["ETH"], 0, 2), ("ETH-1", ["ETH"], 1, 2),
+    ]
+
+
+def test_unknown_shard_key(monkeypatch):
+    monkeypatch.setattr(ws, "SHARD_BY", "instrument")
+    with pytest.raises(ValueError):
+        ws.shard_specs()
+
+
+def test_outbox_blocks_on_full_queue_without_dropping():
+    mp_queue = queue.Queue(maxsize=1)
+    outbox = ws.ShardOutbox("BTC", mp_queue)
+    received = []
+
+    def drain():
+        time.sleep(0.2)
+        for _ in range(3):
+            received.append(mp_queue.get(timeout=5))
+
+    consumer = threading.Thread(target=drain)
+    consumer.start()
+
+    async def send_all():
+        for n in range(3):
+            await outbox.trades([{"trade_id": f"T{n}"}])
+
+    asyncio.run(send_all())
+    consumer.join()
+    assert received == [("trades", [{"trade_id": f"T{n}"}]) for n in range(3)]
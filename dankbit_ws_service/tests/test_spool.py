@@ -0,0 +1,97 @@
+import os
+import struct
+
+import dankbit_ws_batch as ws
+
+
+def trade(n):
+    return {"instrument_name": "BTC-27MAR26-100000-C", "trade_id": f"T{n}", "timestamp": 1000 + n}
+
+
+def test_spool_path_is_absolute():
+    assert os.path.isabs(ws.SPOOL_PATH)
+
+
+def test_append_replay_truncate(tmp_path, monkeypatch):
+    chunks = []
+    monkeypatch.setattr(ws, "insert_trades_checked", lambda conn, trades: chunks.append(trades) or len(trades))
+    monkeypatch.setattr(ws, "SPOOL_REPLAY_CHUNK", 2)
+
+    spool = ws.TradeSpool(str(tmp_path / "nested" / "trades.spool"))
+    assert not spool.pending()
+    spool.append([trade(1), trade(2)])
+    spool.append([trade(3)])
+    assert spool.pending()
+
+    assert spool.replay(conn=None) == 3
+    assert [[t["trade_id"] for t in chunk] for chunk in chunks] == [["T1", "T2"], ["T3"]]
+    assert not spool.pending()
+    assert os.path.getsize(spool.path) == 0
+
+    # appends after a replay start from the beginning of the file again
+    spool.append([trade(4)])
+    assert [t["trade_id"] for t in spool._read()] == ["T4"]
+
+
+def test_failed_replay_keeps_spool(tmp_path, monkeypatch):
+    def fail(conn, trades):
+        raise ws.psycopg2.OperationalError("connection lost")
+
+    monkeypatch.setattr(ws, "insert_trades_checked", fail)
+    spool = ws.TradeSpool(str(tmp_path / "trades.spool"))
+    spool.append([trade(1)])
+
+    try:
+        spool.replay(conn=None)
+    except ws.psycopg2.OperationalError:
+        pass
+    assert spool.pending()
+    assert [t["trade_id"] for t in spool._read()] == ["T1"]
+
+
+def tear(path, spool):
+    spool.f.close()
+    # a crash mid-append leaves a header promising more than was written
+    with open(path, "ab") as f:
+        f.write(struct.pack(">I", 100) + b'[{"trade_id"')
+
+
+def test_leftover_spool_and_torn_record(tmp_path):
+    path = tmp_path / "trades.spool"
+    spool = ws.TradeSpool(str(path))
+    spool.append([trade(1)])
+    complete = os.path.getsize(path)
+    tear(path, spool)
+
+    reopened = ws.TradeSpool(str(path))
+    assert reopened.pending()
+    assert os.path.getsize(path) == complete
+    assert [t["trade_id"] for t in reopened._read()] == ["T1"]
+
+
+def test_records_after_a_torn_one_are_replayed(tmp_path, monkeypatch):
+    inserted = []
+    monkeypatch.setattr(ws, "insert_trades_checked", lambda conn, trades: inserted.extend(trades) or len(trades))
+    path = tmp_path / "trades.spool"
+    spool = ws.TradeSpool(str(path))
+    spool.append([trade(1)])
+    tear(path, spool)
+
+    reopened = ws.TradeSpool(str(path))
+    reopened.append([trade(2), trade(3)])
+    assert reopened.replay(conn=None) == 3
+    assert [t["trade_id"] for t in inserted] == ["T1", "T2", "T3"]
+    assert not reopened.pending()
+
+
+def test_torn_tail_made_of_a_partial_header(tmp_path):
+    path = tmp_path / "trades.spool"
+    spool = ws.TradeSpool(str(path))
+    spool.append([trade(1)])
+    spool.f.close()
+    with open(path, "ab") as f:
+        f.write(b"\x00\x00")
+
+    reopened = ws.TradeSpool(str(path))
+    reopened.append([trade(2)])
+    assert [t["trade_id"] for t in reopened._read()] == ["T1", "T2"]
@@ -1,6 +1,8 @@
 import base64
 import json
+import threading
 import numpy as np
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
 from matplotlib import transforms as mtransforms
@@ -10,25 +12,11 @@ from . import options
 from . import delta
 from . import gamma
 
-
-class _AggTrade:
-    """SQL-aggregated trade row — duck-typed for portfolio_delta/gamma."""
-    __slots__ = ("strike", "option_type", "direction", "amount", "iv", "_expiration")
-
-    def __init__(self, strike, option_type, direction, expiration, amount, iv):
-        self.strike = strike
-        self.option_type = option_type
-        self.direction = direction
-        self.amount = amount
-        self.iv = iv
-        self._expiration = expiration
-
-    def get_hours_to_expiry(self):
-        if not self._expiration:
-            return 0.0
-        now = datetime.now(timezone.utc)
-        exp = self._expiration if self._expiration.tzinfo else self._expiration.replace(tzinfo=timezone.utc)
-        return max((exp - now).total_seconds() / 3600.0, 0.0)
+# Per-process results memoized on the trade change feed's data version, see
+# ChartController._by_data_version
+_DATA_VERSION_CACHE = OrderedDict()
+_DATA_VERSION_CACHE_SIZE = 64
+_data_version_cache_lock = threading.Lock()
 
 
 class ChartController(http.Controller):
@@ -61,14 +49,12 @@ class ChartController(http.Controller):
 
         refresh_interval = int(icp.get_param("dankbit.refresh_interval", default=60))
 
-        cutoff = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
-        domain = [
-            ("name", "ilike", f"{instrument}"),
-            ("expiration", ">=", datetime.now(timezone.utc).replace(tzinfo=None)),
-            ("deribit_ts", ">=", cutoff),
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours)
+        trades = [
+            options.AggTrade.from_row(row)
+            for row in request.env["dankbit.trade"]._aggregate_legs(instrument, traded_since=cutoff)
         ]
-
-        trades = request.env["dankbit.trade"].search(domain=domain)
+        trade_count = sum(trade.count for trade in trades)
 
         index_price = request.env["dankbit.trade"].get_index_price(instrument)
         obj = options.OptionStrat(instrument, index_price, from_price, to_price, steps)
@@ -76,14 +62,14 @@ class ChartController(http.Controller):
         for trade in trades:
             if trade.option_type == "call":
                 if trade.direction == "buy":
-                    obj.long_call(trade.strike, trade.price * trade.index_price)
+                    obj.long_call(trade.strike, trade.premium, trade.count)
                 elif trade.direction == "sell":
-                    obj.short_call(trade.strike, trade.price * trade.index_price)
+                    obj.short_call(trade.strike, trade.premium, trade.count)
             elif trade.option_type == "put":
                 if trade.direction == "buy":
-                    obj.long_put(trade.strike, trade.price * trade.index_price)
+                    obj.long_put(trade.strike, trade.premium, trade.count)
                 elif trade.direction == "sell":
-                    obj.short_put(trade.strike, trade.price * trade.index_price)
+                    obj.short_put(trade.strike, trade.premium, trade.count)
 
         STs = np.arange(from_price, to_price, steps)
         market_deltas = delta.portfolio_delta(STs, trades, 0.05)
@@ -154,7 +140,7 @@ class ChartController(http.Controller):
         last_ts = last_trade.deribit_ts.strftime('%Y-%m-%d %H:%M') if last_trade else "—"
         ax.text(
             0.01, 0.04,
-            f"{len(trades)} Trades ({hours}h)",
+            f"{trade_count} Trades ({hours}h)",
             transform=ax.transAxes,
             fontsize=14,
         )
@@ -200,19 +186,17 @@ class ChartController(http.Controller):
         refresh_interval = int(icp.get_param("dankbit.refresh_interval", default=60))
 
         midnight_utc = datetime.now(timezone.utc).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        ).strftime("%Y-%m-%d %H:%M:%S")
-        domain = [
-            ("name", "=ilike", f"{instrument}-%"),
-            ("expiration", ">=", datetime.now(timezone.utc).replace(tzinfo=None)),
-            ("deribit_ts", ">=", midnight_utc),
+            hour=0, minute=0, second=0, microsecond=0, tzinfo=None
+        )
+        trades = [
+            options.AggTrade.from_row(row)
+            for row in request.env["dankbit.trade"]._aggregate_legs(instrument, traded_since=midnight_utc)
         ]
-        trades = request.env["dankbit.trade"].search(domain=domain)
 
         index_price = request.env["dankbit.trade"].get_index_price(instrument)
 
-        long_count = len(trades.filtered(lambda t: t.direction == "buy"))
-        short_count = len(trades.filtered(lambda t: t.direction == "sell"))
+        long_count = sum(t.count for t in trades if t.direction == "buy")
+        short_count = sum(t.count for t in trades if t.direction == "sell")
         longs_obj, shorts_obj = options.build_zone_curves(
             instrument, index_price, trades, from_price, to_price, steps
         )
@@ -271,8 +255,8 @@ class ChartController(http.Controller):
         # own default) to match every other Greek computed on this page —
         # zones deliberately doesn't use the r=0.05 the combined-portfolio
         # routes use.
-        next_expiration = min(trades.mapped("expiration")) if trades else None
-        next_expiration_trades = trades.filtered(lambda t: t.expiration == next_expiration)
+        next_expiration = min(t.expiration for t in trades) if trades else None
+        next_expiration_trades = [t for t in trades if t.expiration == next_expiration]
         legs = options.per_leg_greeks(longs_obj.STs, next_expiration_trades)
         lc, lp, sc, sp = legs["long_call"], legs["long_put"], legs["short_call"], legs["short_put"]
 
@@ -458,26 +442,26 @@ class ChartController(http.Controller):
 
         refresh_interval = int(icp.get_param("dankbit.refresh_interval", default=60))
 
-        # Anchored/left-prefix match (not a bare ilike substring) and trades
+        # Exact currency/expiry match (not a bare ilike substring) and trades
         # since 00:00 UTC — same domain convention as chart_png_zones, so a
         # query for one expiry can't pull in another instrument's trades.
         midnight_utc = datetime.now(timezone.utc).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        ).strftime("%Y-%m-%d %H:%M:%S")
-        domain = [
-            ("name", "=ilike", f"{instrument}-%"),
-            ("expiration", ">=", datetime.now(timezone.utc).replace(tzinfo=None)),
-            ("deribit_ts", ">=", midnight_utc),
-            ("direction", "=", cfg["direction"]),
-            ("option_type", "=", cfg["option_type"]),
+            hour=0, minute=0, second=0, microsecond=0, tzinfo=None
+        )
+        trades = [
+            trade
+            for trade in map(
+                options.AggTrade.from_row,
+                request.env["dankbit.trade"]._aggregate_legs(instrument, traded_since=midnight_utc),
+            )
+            if trade.direction == cfg["direction"] and trade.option_type == cfg["option_type"]
         ]
-        trades = request.env["dankbit.trade"].search(domain=domain)
 
         index_price = request.env["dankbit.trade"].get_index_price(instrument)
         obj = options.OptionStrat(instrument, index_price, from_price, to_price, steps)
         leg_method = getattr(obj, cfg["method"])
         for trade in trades:
-            leg_method(trade.strike, trade.price * trade.index_price)
+            leg_method(trade.strike, trade.premium, trade.count)
 
         STs = np.arange(from_price, to_price, steps)
         market_deltas = delta.portfolio_delta(STs, trades, 0.05)
@@ -512,7 +496,7 @@ class ChartController(http.Controller):
         last_ts = last_trade.deribit_ts.strftime('%Y-%m-%d %H:%M') if last_trade else "—"
         ax.text(
             0.01, 0.04,
-            f"{len(trades)} Trades (since 00:00 UTC)",
+            f"{sum(t.count for t in trades)} Trades (since 00:00 UTC)",
             transform=ax.transAxes,
             fontsize=14,
         )
@@ -573,26 +557,10 @@ class ChartController(http.Controller):
 
         refresh_interval = int(icp.get_param("dankbit.refresh_interval", default=60))
 
-        cr = request.env.cr
-        cr.execute("""
-            SELECT
-                strike,
-                option_type,
-                direction,
-                expiration,
-                SUM(amount)                                AS total_amount,
-                SUM(iv * amount) / NULLIF(SUM(amount), 0) AS weighted_iv,
-                COUNT(*)                                   AS trade_count
-            FROM dankbit_trade
-            WHERE name ILIKE %s
-              AND expiration >= NOW()
-              AND active = TRUE
-            GROUP BY strike, option_type, direction, expiration
-        """, (f'%{instrument}%',))
-        rows = cr.fetchall()
+        rows = request.env["dankbit.trade"]._aggregate_legs(instrument)
 
         agg_trades = [
-            _AggTrade(
+            options.AggTrade(
                 strike=row[0],
                 option_type=row[1],
                 direction=row[2],
@@ -765,27 +733,10 @@ class ChartController(http.Controller):
 
         refresh_interval = int(icp.get_param("dankbit.refresh_interval", default=60))
 
-        cr = request.env.cr
-        cr.execute("""
-            SELECT
-                strike,
-                option_type,
-                direction,
-                expiration,
-                SUM(amount)                                AS total_amount,
-                SUM(iv * amount) / NULLIF(SUM(amount), 0) AS weighted_iv,
-                COUNT(*)                                   AS trade_count
-            FROM dankbit_trade
-            WHERE name ILIKE %s
-              AND expiration >= NOW()
-              AND expiration <= %s
-              AND active = TRUE
-            GROUP BY strike, option_type, direction, expiration
-        """, (f'%{asset}%', expiry_dt))
-        rows = cr.fetchall()
+        rows = request.env["dankbit.trade"]._aggregate_legs(asset, expiration_until=expiry_dt)
 
         agg_trades = [
-            _AggTrade(
+            options.AggTrade(
                 strike=row[0],
                 option_type=row[1],
                 direction=row[2],
@@ -949,6 +900,60 @@ class ChartController(http.Controller):
     # JSON API endpoints
     # ------------------------------------------------------------------
 
+    def _delta_zero_crossings(self, rows, from_price, to_price, steps):
+        """Delta=0 crossings of the portfolio built from _aggregate_legs()
+        `rows` over the configured price grid, and its trade count."""
+        agg_trades = [
+            options.AggTrade(
+                strike=row[0], option_type=row[1], direction=row[2],
+                expiration=row[3], amount=float(row[4]), iv=float(row[5] or 0.01),
+            )
+            for row in rows
+        ]
+        trade_count = sum(int(row[6]) for row in rows)
+
+        STs = np.arange(from_price, to_price, steps)
+        d_arr = np.asarray(delta.portfolio_delta(STs, agg_trades, 0.05), dtype=float)
+
+        crossings = []
+        for i in range(len(d_arr) - 1):
+            if not (np.isfinite(d_arr[i]) and np.isfinite(d_arr[i + 1])):
+                continue
+            if d_arr[i] * d_arr[i + 1] < 0:
+                px = float(STs[i] - d_arr[i] * (STs[i + 1] - STs[i]) / (d_arr[i + 1] - d_arr[i]))
+                crossings.append({
+                    "price": px,
+                    "type": "demand" if d_arr[i] > 0 else "supply",
+                })
+        return crossings, trade_count
+
+    def _by_data_version(self, asset, key, compute):
+        """compute(), memoized per process on `asset`'s trade data version
+        (dankbit.trade.get_data_version, fed by LISTEN/NOTIFY — see
+        trade_feed.py): while no trade for the asset has been inserted
+        since, a poll reuses the last result instead of re-aggregating.
+        `key` must hold every other input of compute(). Expiries settle at
+        08:00 UTC without any insert, dropping out of the unexpired set, so
+        the current settlement day is part of the key too. Not cached at
+        all while the listener isn't connected (version None)."""
+        version = request.env["dankbit.trade"].get_data_version(asset)
+        if version is None:
+            return compute()
+
+        settlement_day = (datetime.now(timezone.utc) - timedelta(hours=8)).date()
+        cache_key = (request.env.cr.dbname, asset, key, settlement_day, version)
+        with _data_version_cache_lock:
+            if cache_key in _DATA_VERSION_CACHE:
+                _DATA_VERSION_CACHE.move_to_end(cache_key)
+                return _DATA_VERSION_CACHE[cache_key]
+
+        value = compute()
+        with _data_version_cache_lock:
+            _DATA_VERSION_CACHE[cache_key] = value
+            while len(_DATA_VERSION_CACHE) > _DATA_VERSION_CACHE_SIZE:
+                _DATA_VERSION_CACHE.popitem(last=False)
+        return value
+
     @http.route("/api/delta-zero/<string:instrument>", type="http", auth="user", website=False, csrf=False)
     def delta_zero_json(self, instrument):
         parts = instrument.upper().split("-", 1)
@@ -982,41 +987,15 @@ class ChartController(http.Controller):
                 headers=[("Content-Type", "application/json")],
             )
 
-        cr = request.env.cr
-        cr.execute("""
-            SELECT strike, option_type, direction, expiration,
-                   SUM(amount), SUM(iv * amount) / NULLIF(SUM(amount), 0), COUNT(*)
-            FROM dankbit_trade
-            WHERE name ILIKE %s
-              AND expiration >= NOW()
-              AND expiration <= %s
-              AND active = TRUE
-            GROUP BY strike, option_type, direction, expiration
-        """, (f'%{asset}%', expiry_dt))
-        rows = cr.fetchall()
-
-        agg_trades = [
-            _AggTrade(
-                strike=row[0], option_type=row[1], direction=row[2],
-                expiration=row[3], amount=float(row[4]), iv=float(row[5] or 0.01),
-            )
-            for row in rows
-        ]
-        trade_count = sum(int(row[6]) for row in rows)
-
-        STs = np.arange(from_price, to_price, steps)
-        d_arr = np.asarray(delta.portfolio_delta(STs, agg_trades, 0.05), dtype=float)
-
-        crossings = []
-        for i in range(len(d_arr) - 1):
-            if not (np.isfinite(d_arr[i]) and np.isfinite(d_arr[i + 1])):
-                continue
-            if d_arr[i] * d_arr[i + 1] < 0:
-                px = float(STs[i] - d_arr[i] * (STs[i + 1] - STs[i]) / (d_arr[i + 1] - d_arr[i]))
-                crossings.append({
-                    "price": px,
-                    "type": "demand" if d_arr[i] > 0 else "supply",
-                })
+        # cumulative through expiry_dt, so any expiry's trades change it:
+        # keyed on the whole asset's version
+        crossings, trade_count = self._by_data_version(
+            asset, ("delta-zero", expiry_str, from_price, to_price, steps),
+            lambda: self._delta_zero_crossings(
+                request.env["dankbit.trade"]._aggregate_legs(asset, expiration_until=expiry_dt),
+                from_price, to_price, steps,
+            ),
+        )
 
         index_price = request.env["dankbit.trade"].get_index_price(asset)
         payload = {
@@ -1050,40 +1029,12 @@ class ChartController(http.Controller):
                 headers=[("Content-Type", "application/json")],
             )
 
-        cr = request.env.cr
-        cr.execute("""
-            SELECT strike, option_type, direction, expiration,
-                   SUM(amount), SUM(iv * amount) / NULLIF(SUM(amount), 0), COUNT(*)
-            FROM dankbit_trade
-            WHERE name ILIKE %s
-              AND expiration >= NOW()
-              AND active = TRUE
-            GROUP BY strike, option_type, direction, expiration
-        """, (f'%{asset}%',))
-        rows = cr.fetchall()
-
-        agg_trades = [
-            _AggTrade(
-                strike=row[0], option_type=row[1], direction=row[2],
-                expiration=row[3], amount=float(row[4]), iv=float(row[5] or 0.01),
-            )
-            for row in rows
-        ]
-        trade_count = sum(int(row[6]) for row in rows)
-
-        STs = np.arange(from_price, to_price, steps)
-        d_arr = np.asarray(delta.portfolio_delta(STs, agg_trades, 0.05), dtype=float)
-
-        crossings = []
-        for i in range(len(d_arr) - 1):
-            if not (np.isfinite(d_arr[i]) and np.isfinite(d_arr[i + 1])):
-                continue
-            if d_arr[i] * d_arr[i + 1] < 0:
-                px = float(STs[i] - d_arr[i] * (STs[i + 1] - STs[i]) / (d_arr[i + 1] - d_arr[i]))
-                crossings.append({
-                    "price": px,
-                    "type": "demand" if d_arr[i] > 0 else "supply",
-                })
+        crossings, trade_count = self._by_data_version(
+            asset, ("delta-zero-all", from_price, to_price, steps),
+            lambda: self._delta_zero_crossings(
+                request.env["dankbit.trade"]._aggregate_legs(asset), from_price, to_price, steps,
+            ),
+        )
 
         index_price = request.env["dankbit.trade"].get_index_price(asset)
         payload = {
@@ -1121,40 +1072,13 @@ class ChartController(http.Controller):
         target_day = (datetime.now(timezone.utc) + timedelta(days=days_ahead)).date()
         expiry_str = f"{target_day.day}{target_day.strftime('%b').upper()}{target_day.strftime('%y')}"
 
-        cr = request.env.cr
-        cr.execute("""
-            SELECT strike, option_type, direction, expiration,
-                   SUM(amount), SUM(iv * amount) / NULLIF(SUM(amount), 0), COUNT(*)
-            FROM dankbit_trade
-            WHERE name ILIKE %s
-              AND active = TRUE
-              AND deribit_ts >= NOW() - INTERVAL '24 hours'
-            GROUP BY strike, option_type, direction, expiration
-        """, (f'{asset}-{expiry_str}-%',))
-        rows = cr.fetchall()
-
-        agg_trades = [
-            _AggTrade(
-                strike=row[0], option_type=row[1], direction=row[2],
-                expiration=row[3], amount=float(row[4]), iv=float(row[5] or 0.01),
-            )
-            for row in rows
-        ]
-        trade_count = sum(int(row[6]) for row in rows)
+        rows = request.env["dankbit.trade"]._aggregate_legs(
+            f"{asset}-{expiry_str}",
+            traded_since=datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=24),
+            unexpired=False,
+        )
 
-        STs = np.arange(from_price, to_price, steps)
-        d_arr = np.asarray(delta.portfolio_delta(STs, agg_trades, 0.05), dtype=float)
-
-        crossings = []
-        for i in range(len(d_arr) - 1):
-            if not (np.isfinite(d_arr[i]) and np.isfinite(d_arr[i + 1])):
-                continue
-            if d_arr[i] * d_arr[i + 1] < 0:
-                px = float(STs[i] - d_arr[i] * (STs[i + 1] - STs[i]) / (d_arr[i + 1] - d_arr[i]))
-                crossings.append({
-                    "price": px,
-                    "type": "demand" if d_arr[i] > 0 else "supply",
-                })
+        crossings, trade_count = self._delta_zero_crossings(rows, from_price, to_price, steps)
 
         index_price = request.env["dankbit.trade"].get_index_price(asset)
         return {
@@ -1231,26 +1155,9 @@ class ChartController(http.Controller):
         if not (asset.startswith("BTC") or asset.startswith("ETH")):
             return None, 0
 
-        cr = request.env.cr
-        query_params = [f'%{asset}%']
-        cutoff_sql = ""
-        if expiry_exact:
-            cutoff_sql = "AND expiration = %s"
-            query_params.append(expiry_exact)
-        elif expiry_cutoff:
-            cutoff_sql = "AND expiration <= %s"
-            query_params.append(expiry_cutoff)
-        cr.execute(f"""
-            SELECT name, strike, option_type, direction, expiration,
-                   SUM(amount), SUM(iv * amount) / NULLIF(SUM(amount), 0), COUNT(*)
-            FROM dankbit_trade
-            WHERE name ILIKE %s
-              AND expiration >= NOW()
-              AND active = TRUE
-              {cutoff_sql}
-            GROUP BY name, strike, option_type, direction, expiration
-        """, query_params)
-        rows = cr.fetchall()
+        rows = request.env["dankbit.trade"]._aggregate_legs(
+            asset, expiration_exact=expiry_exact, expiration_until=expiry_cutoff, per_instrument=True
+        )
         trade_count = sum(int(row[7]) for row in rows)
 
         by_instrument = {}
@@ -1277,7 +1184,7 @@ class ChartController(http.Controller):
             if net == 0:
                 continue
             total_amount = e["buy_amount"] + e["sell_amount"]
-            agg_trades.append(_AggTrade(
+            agg_trades.append(options.AggTrade(
                 strike=e["strike"], option_type=e["option_type"],
                 direction="buy" if net > 0 else "sell",
                 expiration=e["expiration"], amount=abs(net),
@@ -1479,13 +1386,13 @@ class ChartController(http.Controller):
 
         expiry_by_instrument = {}
         if rows:
-            instruments = [row[0] for row in rows]
+            expiry_codes = [row[0].split("-", 1)[1] for row in rows if "-" in row[0]]
             cr.execute("""
-                SELECT SUBSTRING(name FROM '^[^-]+-[^-]+') AS instrument, MIN(expiration) AS expiration
+                SELECT currency || '-' || expiry_code AS instrument, MIN(expiration) AS expiration
                 FROM dankbit_trade
-                WHERE SUBSTRING(name FROM '^[^-]+-[^-]+') = ANY(%s)
-                GROUP BY instrument
-            """, (instruments,))
+                WHERE currency = %s AND expiry_code = ANY(%s)
+                GROUP BY currency, expiry_code
+            """, (asset, expiry_codes))
             expiry_by_instrument = dict(cr.fetchall())
 
         series = []
@@ -1677,6 +1584,15 @@ class ChartController(http.Controller):
             headers=[("Content-Type", "application/json"), ("Cache-Control", "no-cache")],
         )
 
+    @http.route("/api/deribit-status", type="http", auth="user", website=False, csrf=False)
+    def deribit_status(self, **kw):
+        """Deribit REST circuit-breaker state and call latency percentiles
+        of whichever worker answered (see dankbit.trade.get_deribit_status)."""
+        return request.make_response(
+            json.dumps(request.env["dankbit.trade"].get_deribit_status()),
+            headers=[("Content-Type", "application/json"), ("Cache-Control", "no-cache")],
+        )
+
     @http.route("/api/forecast/<string:asset>", type="http", auth="user", website=False, csrf=False)
     def forecast_json(self, asset, **kw):
         """The Thales Forecast candle engine — full port of Thales's
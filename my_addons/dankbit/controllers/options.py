@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from datetime import datetime
+from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
 import numpy as np
@@ -22,6 +22,51 @@ from . import vega as vega_lib
 DELTA_SATURATION_FRACTION = 0.9
 
 
+class AggTrade:
+    """SQL-aggregated trade row (see dankbit.trade._aggregate_legs) —
+    duck-typed for portfolio_delta/gamma/theta/vega, and for the payoff
+    curves via `count` (trades folded into the row) and `premium` (their
+    mean premium in USD, price * index_price)."""
+    __slots__ = ("strike", "option_type", "direction", "amount", "iv", "expiration", "count", "premium")
+
+    def __init__(self, strike, option_type, direction, expiration, amount, iv, count=1, premium=0.0):
+        self.strike = strike
+        self.option_type = option_type
+        self.direction = direction
+        self.amount = amount
+        self.iv = iv
+        self.expiration = expiration
+        self.count = count
+        self.premium = premium
+
+    @classmethod
+    def from_row(cls, row):
+        """From one _aggregate_legs() row (not per_instrument)."""
+        count = int(row[6])
+        return cls(
+            strike=row[0], option_type=row[1], direction=row[2], expiration=row[3],
+            amount=float(row[4]), iv=float(row[5] or 0.01),
+            count=count, premium=float(row[7] or 0.0) / count if count else 0.0,
+        )
+
+    def get_hours_to_expiry(self):
+        if not self.expiration:
+            return 0.0
+        now = datetime.now(timezone.utc)
+        exp = self.expiration if self.expiration.tzinfo else self.expiration.replace(tzinfo=timezone.utc)
+        return max((exp - now).total_seconds() / 3600.0, 0.0)
+
+
+def leg_premium(trade):
+    """(premium per trade, number of trades) to charge a payoff leg for
+    `trade` — a dankbit.trade record, or an AggTrade standing for `count`
+    trades at their mean premium, which adds up to exactly the same curve
+    as adding each trade on its own."""
+    if isinstance(trade, AggTrade):
+        return trade.premium, trade.count
+    return trade.price * trade.index_price, 1
+
+
 class OptionStrat:
     def __init__(self, name, S0, from_price, to_price, step):
         self.name = name
@@ -337,7 +382,7 @@ def per_leg_greeks(STs, trades, r=0.0):
     portfolio gamma/theta/vega curve peaks or bottoms out, and the price
     where its portfolio delta first saturates to DELTA_SATURATION_FRACTION
     of its own extreme (see delta_saturation_price). Returns
-    {leg_name: {"trades": recordset, "gamma_price", "gamma_value",
+    {leg_name: {"trades": list, "gamma_price", "gamma_value",
     "delta_price", "delta_value", "theta_price", "theta_value",
     "vega_price", "vega_value"}} — raw (unscaled) prices and values; each
     caller applies its own display scaling (e.g. the /<instrument>/zones
@@ -350,12 +395,13 @@ def per_leg_greeks(STs, trades, r=0.0):
     (controllers/forecast.py), so the three can never quietly compute
     different numbers for the same trades. `trades` should already be
     filtered to whichever expiry/time-window the caller cares about — this
-    function only splits by direction/option_type, nothing else."""
+    function only splits by direction/option_type, nothing else. Records
+    and AggTrade legs both work."""
     legs = {
-        "long_call": trades.filtered(lambda t: t.direction == "buy" and t.option_type == "call"),
-        "long_put": trades.filtered(lambda t: t.direction == "buy" and t.option_type == "put"),
-        "short_call": trades.filtered(lambda t: t.direction == "sell" and t.option_type == "call"),
-        "short_put": trades.filtered(lambda t: t.direction == "sell" and t.option_type == "put"),
+        "long_call": [t for t in trades if t.direction == "buy" and t.option_type == "call"],
+        "long_put": [t for t in trades if t.direction == "buy" and t.option_type == "put"],
+        "short_call": [t for t in trades if t.direction == "sell" and t.option_type == "call"],
+        "short_put": [t for t in trades if t.direction == "sell" and t.option_type == "put"],
     }
 
     result = {}
@@ -445,10 +491,11 @@ def zone_summary(STs, longs_curve, shorts_curve):
 def build_zone_curves(instrument_name, index_price, trades, from_price, to_price, steps):
     """Build the Longs/Shorts OptionStrat curves from `trades` (any iterable of
     objects with .direction/.option_type/.strike/.price/.index_price — an Odoo
-    recordset works directly), then re-center on the crossing-based zoom
-    exactly as the live /<instrument>/zones PNG chart does: ±$2000 for BTC,
-    ±$100 for ETH (ETH's much smaller price scale made the ±$2000 margin blow
-    out the auto-zoom). Falls back to the wide [from_price, to_price] range
+    recordset works directly — or of AggTrade legs, see leg_premium), then
+    re-center on the crossing-based zoom exactly as the live
+    /<instrument>/zones PNG chart does: ±$2000 for BTC, ±$100 for ETH
+    (ETH's much smaller price scale made the ±$2000 margin blow out the
+    auto-zoom). Falls back to the wide [from_price, to_price] range
     if the curves never cross.
 
     Shared by the /<instrument>/zones route (controllers/main.py) and
@@ -459,16 +506,17 @@ def build_zone_curves(instrument_name, index_price, trades, from_price, to_price
         longs = OptionStrat(instrument_name, index_price, fp, tp, st)
         shorts = OptionStrat(instrument_name, index_price, fp, tp, st)
         for trade in trades:
+            premium, count = leg_premium(trade)
             if trade.direction == "buy":
                 if trade.option_type == "call":
-                    longs.long_call(trade.strike, trade.price * trade.index_price)
+                    longs.long_call(trade.strike, premium, count)
                 elif trade.option_type == "put":
-                    longs.long_put(trade.strike, trade.price * trade.index_price)
+                    longs.long_put(trade.strike, premium, count)
             elif trade.direction == "sell":
                 if trade.option_type == "call":
-                    shorts.short_call(trade.strike, trade.price * trade.index_price)
+                    shorts.short_call(trade.strike, premium, count)
                 elif trade.option_type == "put":
-                    shorts.short_put(trade.strike, trade.price * trade.index_price)
+                    shorts.short_put(trade.strike, premium, count)
         return longs, shorts
 
     longs_obj, shorts_obj = build(from_price, to_price, steps)
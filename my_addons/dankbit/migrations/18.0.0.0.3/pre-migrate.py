@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""Add and fill dankbit_trade.currency / expiry_code before the registry
+loads, with one UPDATE. Left to the ORM, two new stored computed fields
+would be recomputed record by record over the whole trade table."""
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    cr.execute(
+        """
+        ALTER TABLE dankbit_trade
+            ADD COLUMN IF NOT EXISTS currency VARCHAR,
+            ADD COLUMN IF NOT EXISTS expiry_code VARCHAR
+        """
+    )
+    cr.execute(
+        """
+        UPDATE dankbit_trade
+        SET currency = NULLIF(split_part(name, '-', 1), ''),
+            expiry_code = NULLIF(split_part(name, '-', 2), '')
+        WHERE currency IS NULL
+        """
+    )
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Fill dankbit_instrument from the instrument names already stored in
+dankbit_trade (fields derived from the name, as dankbit.instrument._ensure
+does — the next _sync_from_deribit() adds tick size etc. for listed ones),
+then point every trade at its instrument."""
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    cr.execute(
+        """
+        INSERT INTO dankbit_instrument
+            (name, currency, expiry_code, strike, option_type, expiration, active)
+        SELECT name,
+               split_part(name, '-', 1),
+               NULLIF(split_part(name, '-', 2), ''),
+               CASE WHEN split_part(name, '-', 3) ~ '^[0-9]+(d[0-9]+)?$'
+                    THEN replace(split_part(name, '-', 3), 'd', '.')::numeric END,
+               CASE split_part(name, '-', 4) WHEN 'C' THEN 'call' WHEN 'P' THEN 'put' END,
+               MIN(expiration),
+               MIN(expiration) >= NOW() AT TIME ZONE 'UTC'
+        FROM dankbit_trade
+        GROUP BY name
+        ON CONFLICT (name) DO NOTHING
+        """
+    )
+    cr.execute(
+        """
+        UPDATE dankbit_trade t
+        SET instrument_id = i.id
+        FROM dankbit_instrument i
+        WHERE t.name = i.name
+          AND t.instrument_id IS NULL
+        """
+    )
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Trades are now archived by expiration (see
+Trade._delete_expired_trades), so ones stored without it would stay in
+dankbit_trade for good. Fill it in from the instrument name, with the same
+parser bulk_ingest_trades() uses (08:00 UTC on the expiry day). Rows whose
+name doesn't parse are left as they are."""
+
+import logging
+
+from psycopg2.extras import execute_values
+
+from odoo.addons.dankbit.models.instrument import _parse_instrument_name
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    cr.execute("SELECT DISTINCT name FROM dankbit_trade WHERE expiration IS NULL")
+    names = [name for (name,) in cr.fetchall()]
+    if not names:
+        return
+
+    parsed = [(name, _parse_instrument_name(name)[4]) for name in names]
+    rows = [(name, expiration) for name, expiration in parsed if expiration]
+    if rows:
+        # execute_values() runs one statement per page, so cr.rowcount
+        # would only count the last one: count the returned ids instead
+        updated = execute_values(
+            cr._obj,
+            """
+            UPDATE dankbit_trade t SET expiration = v.expiration
+            FROM (VALUES %s) AS v (name, expiration)
+            WHERE t.name = v.name AND t.expiration IS NULL
+            RETURNING t.id
+            """,
+            rows,
+            template="(%s, %s::timestamp)",
+            fetch=True,
+        )
+        _logger.info("Derived the expiration of %d trades from their instrument name", len(updated))
+    if len(rows) < len(names):
+        _logger.warning(
+            "%d instrument names have no parsable expiry, their trades keep a NULL expiration",
+            len(names) - len(rows),
+        )
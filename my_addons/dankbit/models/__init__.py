@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from . import instrument
 from . import trade
+from . import position_rollup
+from . import instrument_state
+from . import deribit_cache
 from . import bands
 from . import forecast_snapshot
 from . import forecast_log
@@ -166,11 +166,11 @@ class Bands(models.Model):
         self.env.cr.execute(
             """
             SELECT DISTINCT expiration FROM dankbit_trade
-            WHERE name ILIKE %s AND expiration >= %s
+            WHERE currency = %s AND expiration >= %s
             ORDER BY expiration ASC
             LIMIT %s
             """,
-            (f"{asset}-%", as_of, limit),
+            (asset, as_of, limit),
         )
         return [row[0] for row in self.env.cr.fetchall()]
 
@@ -265,7 +265,7 @@ class Bands(models.Model):
             _logger.warning("_compute_asset: no index price for %s, skipping", asset)
             return None
 
-        Trade = self.env["dankbit.trade"].with_context(active_test=False)
+        Trade = self.env["dankbit.trade"]
 
         expirations = self._distinct_expirations(asset, as_of, expiry_index + 1)
         if len(expirations) <= expiry_index:
@@ -284,13 +284,15 @@ class Bands(models.Model):
             as_of - timedelta(hours=hours) if hours is not None
             else as_of.replace(hour=0, minute=0, second=0, microsecond=0)
         )
-        domain = [
-            ("name", "=ilike", f"{asset}-%"),
-            ("expiration", "=", target_expiration),
-            ("deribit_ts", ">=", window_start),
-            ("deribit_ts", "<=", as_of),
+        # Archived trades count too, as they always have here (the search
+        # this replaced ran with active_test=False)
+        trades = [
+            options_lib.AggTrade.from_row(row)
+            for row in Trade._aggregate_legs(
+                asset, expiration_exact=target_expiration, traded_since=window_start, unexpired=False,
+                include_archived=True,
+            )
         ]
-        trades = Trade.search(domain=domain)
         if not trades:
             # No trades in the trade window for this expiry (e.g. thin/no
             # activity right before it rolls off) — an all-zero payoffs
@@ -630,15 +632,15 @@ get_box_n() (the only caller of this method) is itself only ever
             SELECT b.gamma_band, t.expiration
             FROM dankbit_bands b
             JOIN (
-                SELECT SUBSTRING(name FROM '^[^-]+-[^-]+') AS instrument, MIN(expiration) AS expiration
+                SELECT currency || '-' || expiry_code AS instrument, MIN(expiration) AS expiration
                 FROM dankbit_trade
-                WHERE name ILIKE %s
-                GROUP BY instrument
+                WHERE currency = %s
+                GROUP BY currency, expiry_code
             ) t ON t.instrument = b.instrument
             WHERE b.asset = %s AND t.expiration > NOW()
             ORDER BY t.expiration ASC
             LIMIT 2
-        """, (f"{asset}-%", asset))
+        """, (asset, asset))
         term_structure = []
         for gamma_band, expiration in cr.fetchall():
             exp_ts = expiration if expiration.tzinfo else expiration.replace(tzinfo=timezone.utc)
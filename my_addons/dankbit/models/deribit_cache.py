@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import threading
+import time
+
+from odoo import api, models
+
+_logger = logging.getLogger(__name__)
+
+# How long a cold miss (no value at all yet) waits for the worker fetching
+# it, polling every COLD_MISS_POLL seconds, before giving up with None —
+# the default dankbit.deribit_timeout.
+COLD_MISS_WAIT = 5.0
+COLD_MISS_POLL = 0.1
+
+# Per-worker counters, see DeribitCache.stats().
+_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_failures": 0, "waits": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class DeribitCache(models.AbstractModel):
+    """Deribit REST responses shared by every Odoo worker (HTTP and cron),
+    replacing the per-process _DERIBIT_CACHE dict trade.py used to keep —
+    with N prefork workers that dict meant N independent copies, each
+    refreshed on its own, and a burst of simultaneous misses all going to
+    Deribit at once.
+
+    Values live in dankbit_deribit_cache, an UNLOGGED table created in
+    init() (no ORM model behind it: nothing but get() ever touches it, and
+    losing it on a crash only costs one refetch per key). Refreshes are
+    single-flight and stale-while-revalidate: when a key is older than its
+    TTL, whichever worker wins pg_try_advisory_lock on it fetches and
+    upserts the new value, and everyone else keeps serving the previous one
+    meanwhile. Nobody ever blocks on the lock: a cold miss (no value at all
+    yet) polls for the winner's value for a bounded time instead. The
+    claim, re-read and upsert run on a short-lived cursor of their own,
+    with no transaction open across fetch(), so the new value is visible
+    to other workers as soon as it's fetched rather than when the caller's
+    transaction ends."""
+
+    _name = "dankbit.deribit.cache"
+    _description = "Shared Deribit REST cache"
+
+    def init(self):
+        self.env.cr.execute(
+            """
+            CREATE UNLOGGED TABLE IF NOT EXISTS dankbit_deribit_cache (
+                key VARCHAR PRIMARY KEY,
+                value JSONB NOT NULL,
+                fetched_at TIMESTAMP NOT NULL
+            )
+            """
+        )
+
+    def _read(self, cr, key):
+        # (value, age in seconds), or None
+        cr.execute(
+            """
+            SELECT value, EXTRACT(EPOCH FROM (clock_timestamp() AT TIME ZONE 'UTC' - fetched_at))
+            FROM dankbit_deribit_cache
+            WHERE key = %s
+            """,
+            (key,),
+        )
+        return cr.fetchone()
+
+    @api.model
+    def get(self, key, ttl, fetch):
+        """Cached value of `key`, refreshed through `fetch()` once older than
+        `ttl` seconds. `fetch` returns a JSON-serializable value, or None on
+        failure — the previous value (however old) is then served instead,
+        and None only comes back when there has never been one, or when
+        another worker's first fetch of it takes longer than
+        COLD_MISS_WAIT."""
+        row = self._read(self.env.cr, key)
+        if row and row[1] < ttl:
+            _count("hits")
+            return row[0]
+
+        lock_key = f"dankbit_deribit_cache:{key}"
+        cr = self.env.registry.cursor()
+        claimed = False
+        try:
+            cr.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (lock_key,))
+            claimed = cr.fetchone()[0]
+            if not claimed:
+                if row:
+                    # someone else is refreshing it — serve the old value
+                    _count("stale_hits")
+                    return row[0]
+                return self._await(cr, key)
+
+            # re-read under the claim: another worker may have just refreshed it
+            row = self._read(cr, key)
+            if row and row[1] < ttl:
+                _count("hits")
+                return row[0]
+            # the session-level lock outlives the transaction: fetch() runs
+            # with none open on this connection
+            cr.commit()
+
+            _count("misses")
+            value = fetch()
+            if value is None:
+                _count("refresh_failures")
+                _logger.warning("Deribit cache refresh failed for %s, %s", key, "serving stale value" if row else "no value")
+                return row[0] if row else None
+
+            cr.execute(
+                """
+                INSERT INTO dankbit_deribit_cache (key, value, fetched_at)
+                VALUES (%s, %s, clock_timestamp() AT TIME ZONE 'UTC')
+                ON CONFLICT (key) DO UPDATE
+                    SET value = EXCLUDED.value, fetched_at = EXCLUDED.fetched_at
+                """,
+                (key, json.dumps(value)),
+            )
+            cr.commit()
+            _count("refreshes")
+            return value
+        finally:
+            try:
+                if claimed:
+                    # the pool hands this connection out again: the lock
+                    # must not go back with it
+                    cr.rollback()
+                    cr.execute("SELECT pg_advisory_unlock(hashtext(%s))", (lock_key,))
+                    cr.commit()
+            finally:
+                cr.close()
+
+    def _await(self, cr, key):
+        # Cold miss while another worker fetches: poll for its value for up
+        # to COLD_MISS_WAIT seconds, each read in a fresh transaction (a
+        # repeatable-read snapshot would never see the new row), then give
+        # up with None rather than queue on the lock.
+        _count("waits")
+        deadline = time.monotonic() + COLD_MISS_WAIT
+        while True:
+            row = self._read(cr, key)
+            cr.rollback()
+            if row:
+                _count("hits")
+                return row[0]
+            if time.monotonic() >= deadline:
+                _logger.warning("Deribit cache: gave up waiting %.1fs for %s", COLD_MISS_WAIT, key)
+                return None
+            time.sleep(COLD_MISS_POLL)
+
+    @api.model
+    def stats(self):
+        """This worker's hit/refresh counters plus every key's current age
+        (seconds since it was fetched) — served by /api/deribit-status."""
+        with _stats_lock:
+            counters = dict(_stats)
+        served = counters["hits"] + counters["stale_hits"] + counters["misses"]
+        counters["hit_ratio"] = round((counters["hits"] + counters["stale_hits"]) / served, 4) if served else None
+        self.env.cr.execute(
+            """
+            SELECT key, EXTRACT(EPOCH FROM (clock_timestamp() AT TIME ZONE 'UTC' - fetched_at))
+            FROM dankbit_deribit_cache
+            ORDER BY key
+            """
+        )
+        counters["age_seconds"] = {key: round(float(age), 1) for key, age in self.env.cr.fetchall()}
+        return counters
@@ -344,15 +344,16 @@ class ForecastSnapshot(models.Model):
         generated_at = datetime.now(timezone.utc)
         index_price = self.env["dankbit.trade"].get_index_price(asset)
 
-        cr = self.env.cr
-        cr.execute("""
-            SELECT SUM(iv * amount) / NULLIF(SUM(amount), 0)
-            FROM dankbit_trade
-            WHERE name ILIKE %s
-              AND deribit_ts >= NOW() - INTERVAL '24 hours'
-        """, (f"{asset}-%",))
-        avg_iv_row = cr.fetchone()
-        sigma_annual = float(avg_iv_row[0]) / 100.0 if avg_iv_row and avg_iv_row[0] else None
+        # amount-weighted IV of every trade in the trailing 24h, from the
+        # hourly buckets (see Trade._aggregate_legs) rather than a raw scan
+        rows = self.env["dankbit.trade"]._aggregate_legs(
+            asset,
+            traded_since=generated_at.replace(tzinfo=None) - timedelta(hours=24),
+            unexpired=False,
+        )
+        total_amount = sum(float(row[4]) for row in rows if row[5] is not None)
+        iv_amount = sum(float(row[4]) * float(row[5]) for row in rows if row[5] is not None)
+        sigma_annual = iv_amount / total_amount / 100.0 if total_amount and iv_amount else None
 
         current_record = self.compute_and_persist(asset)
 
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models
+
+
+def _parse_instrument_name(name):
+    """(currency, expiry_code, strike, option_type, expiration) derived
+    from a Deribit option name such as BTC-29NOV24-98000-P — the fallback
+    for instruments Deribit no longer lists. Options expire at 08:00 UTC."""
+    parts = (name or "").split("-")
+    currency = parts[0] or None
+    expiry_code = parts[1] if len(parts) > 1 and parts[1] else None
+    try:
+        strike = float(parts[2].replace("d", "."))
+    except (IndexError, ValueError):
+        strike = None
+    option_type = {"P": "put", "C": "call"}.get(parts[-1]) if len(parts) > 3 else None
+    try:
+        expiration = datetime.strptime(expiry_code, "%d%b%y").replace(hour=8)
+    except (TypeError, ValueError):
+        expiration = None
+    return currency, expiry_code, strike, option_type, expiration
+
+
+def _ms_to_datetime(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None) if ms else None
+
+
+class Instrument(models.Model):
+    """One row per Deribit option instrument, from public/get_instruments
+    (see _sync_from_deribit) — what dankbit.trade.instrument_id points at,
+    so expiry/strike lookups and per-instrument GROUP BYs can run on this
+    table of a few thousand rows and an integer key instead of on the
+    name string repeated in millions of trades.
+
+    Rows are written with raw upserts keyed on name, hence _log_access =
+    False. Instruments that only appear in trades (delisted before the
+    first sync) get a row derived from the name, without tick size or
+    creation time."""
+
+    _name = "dankbit.instrument"
+    _description = "Deribit option instrument"
+    _order = "expiration, strike, option_type"
+    _log_access = False
+
+    name = fields.Char(required=True, index=True)
+    active = fields.Boolean(default=True)
+    currency = fields.Char(index=True)
+    expiry_code = fields.Char()
+    expiration = fields.Datetime(index=True)
+    strike = fields.Float(digits=(16, 4))
+    option_type = fields.Selection([("call", "Call"), ("put", "Put")])
+    tick_size = fields.Float(digits=(16, 8))
+    contract_size = fields.Float(digits=(16, 4))
+    created_at = fields.Datetime(string="Listed At")
+
+    _sql_constraints = [
+        ("name_uniq", "unique (name)", "Only one row is kept per instrument."),
+    ]
+
+    @api.model
+    def _sync_from_deribit(self):
+        """Cron entry point (every 15 minutes — see data/ir_cron.xml), also
+        run by Trade.get_last_trades() before each backfill. Upserts every
+        listed option from Trade._get_instruments() (shared-cached, so this
+        rarely costs a Deribit call), archives expired instruments, and
+        links trades that were stored before their instrument existed
+        here. Returns {name: id} for the listed instruments."""
+        listed = self.env["dankbit.trade"]._get_instruments()
+        rows = []
+        for inst in listed:
+            name = inst.get("instrument_name")
+            if not name or inst.get("kind", "option") != "option":
+                continue
+            currency, expiry_code, strike, option_type, expiration = _parse_instrument_name(name)
+            rows.append((
+                name,
+                inst.get("base_currency") or currency,
+                expiry_code,
+                _ms_to_datetime(inst.get("expiration_timestamp")) or expiration,
+                inst.get("strike", strike),
+                inst.get("option_type") or option_type,
+                inst.get("tick_size"),
+                inst.get("contract_size"),
+                _ms_to_datetime(inst.get("creation_timestamp")),
+            ))
+
+        ids = {}
+        new_ids = []
+        if rows:
+            for inst_id, name, inserted in execute_values(
+                self.env.cr._obj,
+                """
+                INSERT INTO dankbit_instrument
+                    (name, currency, expiry_code, expiration, strike, option_type,
+                     tick_size, contract_size, created_at, active)
+                VALUES %s
+                ON CONFLICT (name) DO UPDATE SET
+                    expiration = EXCLUDED.expiration,
+                    tick_size = EXCLUDED.tick_size,
+                    contract_size = EXCLUDED.contract_size,
+                    created_at = EXCLUDED.created_at,
+                    active = TRUE
+                RETURNING id, name, (xmax = 0)
+                """,
+                rows,
+                template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE)",
+                page_size=len(rows),
+                fetch=True,
+            ):
+                ids[name] = inst_id
+                if inserted:
+                    new_ids.append(inst_id)
+
+        self.env.cr.execute(
+            """
+            UPDATE dankbit_instrument SET active = FALSE
+            WHERE active AND expiration < NOW() AT TIME ZONE 'UTC'
+            """
+        )
+        self._link_trades(new_ids)
+        return ids
+
+    @api.model
+    def _ensure(self, names):
+        """{name: id} for every name in `names`, creating name-derived rows
+        for instruments not synced yet (used by Trade.bulk_ingest_trades)."""
+        names = sorted({name for name in names if name})
+        if not names:
+            return {}
+        self.env.cr.execute("SELECT name, id FROM dankbit_instrument WHERE name = ANY(%s)", (names,))
+        ids = dict(self.env.cr.fetchall())
+        missing = [name for name in names if name not in ids]
+        if missing:
+            execute_values(
+                self.env.cr._obj,
+                """
+                INSERT INTO dankbit_instrument
+                    (name, currency, expiry_code, strike, option_type, expiration, active)
+                VALUES %s
+                ON CONFLICT (name) DO NOTHING
+                """,
+                [(name, *_parse_instrument_name(name)) for name in missing],
+                template="(%s, %s, %s, %s, %s, %s, TRUE)",
+            )
+            self.env.cr.execute("SELECT name, id FROM dankbit_instrument WHERE name = ANY(%s)", (missing,))
+            new = dict(self.env.cr.fetchall())
+            self._link_trades(list(new.values()))
+            ids.update(new)
+        return ids
+
+    def _link_trades(self, instrument_ids):
+        # Trades inserted before their instrument row existed (the WS
+        # service resolves instrument_id with a subselect, which yields
+        # NULL then). Driven by name through the (name, deribit_ts) index.
+        if not instrument_ids:
+            return
+        self.env.cr.execute(
+            """
+            UPDATE dankbit_trade t
+            SET instrument_id = i.id
+            FROM dankbit_instrument i
+            WHERE i.id = ANY(%s)
+              AND t.name = i.name
+              AND t.instrument_id IS NULL
+            """,
+            (list(instrument_ids),),
+        )
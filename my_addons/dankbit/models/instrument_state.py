@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from odoo import fields, models
+
+# Default for dankbit.state_max_age: how old (seconds) a row may be before
+# readers stop trusting it and fall back to a REST call. The WS service
+# upserts index/mark rows every few seconds and open interest every 30s, so
+# anything much older means the service is down, not just between ticks.
+STATE_MAX_AGE = 60.0
+
+
+class InstrumentState(models.Model):
+    """Latest market state pushed by the WS service (dankbit_ws_service):
+    one row per Deribit index (name = index name, e.g. "btc_usdt", holding
+    index_price) and one per option instrument (mark_price/mark_iv from the
+    markprice.options channel, open_interest from a get_book_summary_by_currency
+    poll). The service writes it with raw upserts keyed on name, so Odoo's
+    create/write audit columns are left out (_log_access = False).
+
+    Replaces the blocking REST calls Trade.get_index_price() and
+    get_open_interest_by_currency() used to make from inside HTTP workers —
+    both now read one indexed row (or one currency's rows) here first and
+    only go to Deribit when the state is missing or older than
+    dankbit.state_max_age."""
+
+    _name = "dankbit.instrument.state"
+    _description = "Live Deribit instrument state"
+    _order = "name"
+    _log_access = False
+
+    name = fields.Char(required=True, index=True)
+    currency = fields.Char(index=True)
+    index_price = fields.Float(digits=(16, 4))
+    mark_price = fields.Float(digits=(16, 4))
+    mark_iv = fields.Float(string="Mark IV %", digits=(8, 4))
+    open_interest = fields.Float(digits=(16, 4))
+    updated_at = fields.Datetime(index=True)
+    # Open interest comes from a slower poll than the mark/index streams, so
+    # it carries its own timestamp — a fresh mark price must not make a
+    # stale open interest look current.
+    oi_updated_at = fields.Datetime()
+
+    _sql_constraints = [
+        ("name_uniq", "unique (name)", "Only one state row is kept per index/instrument."),
+    ]
+
+    def _max_age(self):
+        try:
+            return float(self.env["ir.config_parameter"].sudo().get_param("dankbit.state_max_age", default=STATE_MAX_AGE))
+        except (TypeError, ValueError):
+            return STATE_MAX_AGE
+
+    def get_index_price(self, index_name):
+        """Fresh index price for `index_name`, or None if the WS service
+        hasn't written one within dankbit.state_max_age."""
+        self.env.cr.execute(
+            """
+            SELECT index_price
+            FROM dankbit_instrument_state
+            WHERE name = %s
+              AND index_price IS NOT NULL
+              AND updated_at >= NOW() AT TIME ZONE 'UTC' - %s * INTERVAL '1 second'
+            """,
+            (index_name, self._max_age()),
+        )
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
+
+    def get_open_interest(self, currency):
+        """{instrument_name: open_interest} for `currency`'s options, from
+        rows whose open interest is within dankbit.state_max_age — empty
+        dict when the WS service hasn't polled it recently (callers then
+        fall back to REST)."""
+        self.env.cr.execute(
+            """
+            SELECT name, open_interest
+            FROM dankbit_instrument_state
+            WHERE currency = %s
+              AND open_interest IS NOT NULL
+              AND oi_updated_at >= NOW() AT TIME ZONE 'UTC' - %s * INTERVAL '1 second'
+            """,
+            (currency, self._max_age()),
+        )
+        return {name: float(oi or 0.0) for name, oi in self.env.cr.fetchall()}
+
+    def _delete_stale_states(self):
+        """Cron entry point (daily — see data/ir_cron.xml). Drops rows the
+        WS service stopped updating (expired instruments) so the table only
+        holds what's currently listed."""
+        cutoff = fields.Datetime.now() - timedelta(days=1)
+        self.sudo().search([("updated_at", "<", cutoff)]).unlink()
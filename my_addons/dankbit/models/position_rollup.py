@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# every dankbit_trade column a rollup is keyed on or sums — see
+# TradeRollupMixin.init(), an UPDATE touching none of them is skipped
+ROLLUP_TRADE_COLUMNS = (
+    "name", "direction", "deribit_ts", "currency", "expiry_code", "expiration",
+    "strike", "option_type", "amount", "iv", "price", "index_price", "active",
+)
+
+
+class TradeRollupMixin(models.AbstractModel):
+    """Running sums of dankbit_trade — total amount, amount-weighted IV
+    numerator, premium and trade count — grouped by the concrete model's
+    _rollup_keys, maintained by statement-level triggers on dankbit_trade
+    (see init()), so they're exact whichever writer inserted the trades:
+    the WS service, the REST backfill or the ORM. Each INSERT/DELETE
+    statement folds its whole transition table into the rollup in one
+    grouped upsert, so a 1000-row batch costs one statement, not 1000 row
+    triggers; an UPDATE moves the trades it changed from their old rows
+    to their new ones.
+
+    Rows cover active trades only (_rollup_filter), like the queries they
+    replace: archiving a trade, from the expiry cron or by hand, is an
+    UPDATE of `active` and moves it out.
+
+    _check_consistency() recomputes everything from dankbit_trade and diffs
+    (cron, daily); with repair=True it rebuilds the table."""
+
+    _name = "dankbit.trade.rollup.mixin"
+    _description = "Trade rollup (shared columns and trigger maintenance)"
+
+    # (column, expression over dankbit_trade) pairs the rows are keyed on —
+    # the concrete model's unique constraint must cover exactly these
+    # columns, it's the upsert's conflict target
+    _rollup_keys = [("name", "name"), ("direction", "direction")]
+    # trades left out of the rollup entirely
+    _rollup_filter = "active"
+
+    name = fields.Char(required=True, index=True)
+    currency = fields.Char()
+    expiry_code = fields.Char()
+    expiration = fields.Datetime(index=True)
+    strike = fields.Integer()
+    option_type = fields.Char()
+    direction = fields.Selection([("buy", "Buy"), ("sell", "Sell")], required=True)
+    amount = fields.Float(digits=(20, 4))
+    iv_amount = fields.Float(string="IV × Amount", digits=(24, 6))
+    # sum of the per-trade premium in USD (price * index_price), what the
+    # payoff curves charge once per trade regardless of amount (see
+    # options.build_zone_curves)
+    premium = fields.Float(digits=(24, 6))
+    trade_count = fields.Integer()
+
+    def _rollup_select(self, source):
+        # One row per key of whatever trade set is being summed. Ordered by
+        # the key so concurrent writers lock rollup rows in the same order
+        # (no deadlocks). The sums are never NULL — a group of trades with
+        # no amount/iv/price sums to 0 — since NULL + x stays NULL and would
+        # poison the row for every later increment.
+        keys = ", ".join(expr for _col, expr in self._rollup_keys)
+        return f"""
+            SELECT {keys}, MIN(currency), MIN(expiry_code), MIN(expiration), MIN(strike),
+                   MIN(option_type), COALESCE(SUM(amount), 0), COALESCE(SUM(iv * amount), 0),
+                   COALESCE(SUM(price * index_price), 0), COUNT(*)
+            FROM {source}
+            WHERE {self._rollup_filter}
+            GROUP BY {keys}
+            ORDER BY {keys}
+        """
+
+    def _rollup_columns(self):
+        keys = ", ".join(col for col, _expr in self._rollup_keys)
+        return (
+            f"{keys}, currency, expiry_code, expiration, strike, option_type, "
+            "amount, iv_amount, premium, trade_count"
+        )
+
+    def _rollup_add(self, source):
+        table = self._table
+        key_columns = ", ".join(col for col, _expr in self._rollup_keys)
+        return f"""
+            INSERT INTO {table} ({self._rollup_columns()})
+            {self._rollup_select(source)}
+            ON CONFLICT ({key_columns}) DO UPDATE SET
+                amount = COALESCE({table}.amount, 0) + EXCLUDED.amount,
+                iv_amount = COALESCE({table}.iv_amount, 0) + EXCLUDED.iv_amount,
+                premium = COALESCE({table}.premium, 0) + EXCLUDED.premium,
+                trade_count = COALESCE({table}.trade_count, 0) + EXCLUDED.trade_count;
+        """
+
+    def _rollup_subtract(self, source):
+        table = self._table
+        key_join = " AND ".join(f"r.{col} = o.{col}" for col, _expr in self._rollup_keys)
+        return f"""
+            UPDATE {table} r
+            SET amount = COALESCE(r.amount, 0) - o.amount,
+                iv_amount = COALESCE(r.iv_amount, 0) - o.iv_amount,
+                premium = COALESCE(r.premium, 0) - o.premium,
+                trade_count = COALESCE(r.trade_count, 0) - o.trade_count
+            FROM ({self._rollup_select(source)}) AS o ({self._rollup_columns()})
+            WHERE {key_join};
+            DELETE FROM {table} WHERE trade_count <= 0;
+        """
+
+    def init(self):
+        if self._abstract:
+            return
+        cr = self.env.cr
+        table = self._table
+        # An UPDATE only moves the trades whose summed or keyed columns
+        # changed: out of their old rows, into their new ones. Everything
+        # else (instrument_id, write_date...) is a no-op here; archiving
+        # is a move too, out of the rollup and into the archived buckets.
+        # (A trigger with transition tables can't take an UPDATE OF column
+        # list, hence the IS DISTINCT FROM filter.)
+        changed = """(
+            SELECT {side}.* FROM old_trades o JOIN new_trades n ON n.id = o.id
+            WHERE ({old}) IS DISTINCT FROM ({new})
+        ) AS changed""".format
+        old_cols = ", ".join(f"o.{col}" for col in ROLLUP_TRADE_COLUMNS)
+        new_cols = ", ".join(f"n.{col}" for col in ROLLUP_TRADE_COLUMNS)
+        cr.execute(f"""
+            CREATE OR REPLACE FUNCTION {table}_apply() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    {self._rollup_add("new_trades")}
+                ELSIF TG_OP = 'DELETE' THEN
+                    {self._rollup_subtract("old_trades")}
+                ELSE
+                    {self._rollup_subtract(changed(side="o", old=old_cols, new=new_cols))}
+                    {self._rollup_add(changed(side="n", old=old_cols, new=new_cols))}
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        for event, transition in (
+            ("insert", "NEW TABLE AS new_trades"),
+            ("delete", "OLD TABLE AS old_trades"),
+            ("update", "OLD TABLE AS old_trades NEW TABLE AS new_trades"),
+        ):
+            cr.execute(f"DROP TRIGGER IF EXISTS {table}_{event} ON dankbit_trade")
+            cr.execute(f"""
+                CREATE TRIGGER {table}_{event}
+                AFTER {event.upper()} ON dankbit_trade
+                REFERENCING {transition}
+                FOR EACH STATEMENT EXECUTE FUNCTION {table}_apply()
+            """)
+
+        cr.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        if not cr.fetchone()[0]:
+            self._rebuild()
+
+    def _rebuild(self):
+        # SHARE mode: writers wait until the rebuilt table is committed, so
+        # no trade can be counted twice or missed in between
+        self.env.cr.execute("LOCK TABLE dankbit_trade IN SHARE MODE")
+        self.env.cr.execute(f"DELETE FROM {self._table}")
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table} ({self._rollup_columns()})
+            {self._rollup_select("dankbit_trade")}
+        """)
+        _logger.info("Rebuilt %s: %d rows", self._table, self.env.cr.rowcount)
+
+    @api.model
+    def _check_consistency(self, repair=False):
+        """Cron entry point (daily — see data/ir_cron.xml). Recomputes the
+        rollup from dankbit_trade in a temporary table and diffs it against
+        the maintained one; logs and returns the keys that differ. With
+        `repair`, a non-empty diff triggers _rebuild()."""
+        cr = self.env.cr
+        table = self._table
+        key_columns = [col for col, _expr in self._rollup_keys]
+        cr.execute("LOCK TABLE dankbit_trade IN SHARE MODE")
+        cr.execute(f"""
+            CREATE TEMPORARY TABLE {table}_check AS
+            SELECT {", ".join(key_columns)}, amount, iv_amount, premium, trade_count FROM (
+                {self._rollup_select("dankbit_trade")}
+            ) AS fresh ({self._rollup_columns()})
+        """)
+        # the fresh sums are never NULL, so a NULL on the maintained side
+        # is a mismatch too: COALESCE(..., TRUE) flags it
+        cr.execute(f"""
+            SELECT {", ".join(f"COALESCE(r.{col}, c.{col})" for col in key_columns)},
+                   r.amount, c.amount, r.premium, c.premium, r.trade_count, c.trade_count
+            FROM {table} r
+            FULL OUTER JOIN {table}_check c
+              ON {" AND ".join(f"c.{col} = r.{col}" for col in key_columns)}
+            WHERE r.name IS NULL OR c.name IS NULL
+               OR r.trade_count IS DISTINCT FROM c.trade_count
+               OR COALESCE(ABS(r.amount - c.amount) > 0.0001, TRUE)
+               OR COALESCE(ABS(r.iv_amount - c.iv_amount) > 0.01, TRUE)
+               OR COALESCE(ABS(r.premium - c.premium) > 0.01, TRUE)
+        """)
+        diffs = cr.fetchall()
+        cr.execute(f"DROP TABLE {table}_check")
+        if not diffs:
+            _logger.info("%s is consistent", table)
+            return []
+
+        nkeys = len(key_columns)
+        for row in diffs[:20]:
+            amount, expected, premium, expected_premium, count, expected_count = row[nkeys:]
+            _logger.warning(
+                "%s mismatch %s: amount %s (expected %s), premium %s (expected %s), trades %s (expected %s)",
+                table, "/".join(str(k) for k in row[:nkeys]), amount, expected,
+                premium, expected_premium, count, expected_count,
+            )
+        _logger.warning("%s: %d mismatched rows", table, len(diffs))
+        if repair:
+            self._rebuild()
+        return [tuple(row[:nkeys]) for row in diffs]
+
+
+class PositionRollup(models.Model):
+    """Per-(instrument, direction) totals over all time — what
+    Trade._aggregate_legs() reads instead of grouping every live trade on
+    each chart/delta-zero/gamma request."""
+
+    _name = "dankbit.position.rollup"
+    _inherit = "dankbit.trade.rollup.mixin"
+    _description = "Trade position rollup"
+    _order = "expiration, strike, option_type, direction"
+    _log_access = False
+
+    _sql_constraints = [
+        ("name_direction_uniq", "unique (name, direction)", "One rollup row per instrument and direction."),
+    ]
+
+
+class TradeBucket(models.Model):
+    """The same totals per UTC hour of deribit_ts — what
+    Trade._aggregate_legs() sums for trailing-window and since-midnight
+    queries (see there), so a 24h window is at most 25 bucket rows per
+    instrument plus a raw read of the partial leading hour. The current
+    hour's bucket is kept up to date by the trigger like every other, so
+    there is no raw tail to read. A trade whose deribit_ts is corrected
+    moves buckets through the UPDATE trigger.
+
+    Unlike the position rollup, buckets keep archived trades, in rows of
+    their own (active is part of the key): the bands cron reads past
+    windows including them, every other reader filters on active."""
+
+    _name = "dankbit.trade.bucket"
+    _inherit = "dankbit.trade.rollup.mixin"
+    _description = "Hourly trade bucket"
+    _order = "bucket desc, expiration, strike, option_type, direction"
+    _log_access = False
+
+    _rollup_keys = [
+        ("bucket", "date_trunc('hour', deribit_ts)"),
+        ("name", "name"),
+        ("direction", "direction"),
+        ("active", "active"),
+    ]
+    _rollup_filter = "deribit_ts IS NOT NULL"
+
+    bucket = fields.Datetime(required=True, index=True, help="Start of the UTC hour")
+    active = fields.Boolean(required=True, help="Whether the bucket's trades are active")
+
+    _sql_constraints = [
+        ("bucket_name_direction_active_uniq", "unique (bucket, name, direction, active)",
+         "One bucket row per hour, instrument, direction and active flag."),
+    ]
@@ -62,6 +62,44 @@ class ResConfigSettings(models.TransientModel):
         help="Time-to-live in seconds for cached Deribit responses (index/instruments)."
     )
 
+    state_max_age = fields.Float(
+        string="Live state max age (s)",
+        config_parameter="dankbit.state_max_age",
+        help="Index prices and open interest written by the WS service are used while younger than this many seconds; older rows fall back to Deribit's REST API. Defaults to 60."
+    )
+
+    trade_archive_after_days = fields.Integer(
+        string="Archive trades after (days)",
+        config_parameter="dankbit.trade_archive_after_days",
+        help="Days after an expiry before its trades are moved into the dankbit_archive schema. Defaults to 30."
+    )
+
+    backfill_mode = fields.Selection(
+        [("instrument", "Per instrument"), ("currency", "Per currency")],
+        string="Backfill mode",
+        config_parameter="dankbit.backfill_mode",
+        default="instrument",
+        help="How the REST trade backfill pages Deribit: once per listed instrument from its newest stored trade, or once per currency (get_last_trades_by_currency_and_time) from a single high-water mark — one or two requests per currency on a typical pass."
+    )
+
+    backfill_concurrency = fields.Integer(
+        string="Backfill threads",
+        config_parameter="dankbit.backfill_concurrency",
+        help="How many instruments the REST trade backfill fetches in parallel. Defaults to 8."
+    )
+
+    backfill_rate_limit = fields.Float(
+        string="Backfill rate limit (req/s)",
+        config_parameter="dankbit.backfill_rate_limit",
+        help="Requests per second the REST trade backfill may send to Deribit, shared by all its threads. Defaults to 20 (Deribit's public credit budget)."
+    )
+
+    backfill_lookback_hours = fields.Integer(
+        string="Backfill lookback (hours)",
+        config_parameter="dankbit.backfill_lookback_hours",
+        help="How far back the per-currency backfill starts the first time it runs for a currency, before it has a high-water mark of its own. Defaults to 6."
+    )
+
     weekly_expiry = fields.Char(
         string="Weekly Expiry",
         config_parameter="dankbit.weekly_expiry",
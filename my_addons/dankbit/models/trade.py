@@ -1,20 +1,175 @@
 # -*- coding: utf-8 -*-
 
-import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import logging
+import os
+import queue
+import threading
 import requests, time as time_module
+from requests.adapters import HTTPAdapter
 
-from odoo import api, fields, models
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models, tools
+
+from . import trade_feed
+from .instrument import _parse_instrument_name
 
 _logger = logging.getLogger(__name__)
 
-# Simple in-memory cache to avoid hitting Deribit too often.
-# Keys: 'index_price', 'instruments', optionally others.
-_DERIBIT_CACHE = {
-    "index_price": {"ts": 0, "value": None},
-    "instruments": {"ts": 0, "value": None},
-}
+# Defaults for dankbit.backfill_concurrency / dankbit.backfill_rate_limit.
+# Deribit's public (non-matching-engine) limit is a credit bucket refilled at
+# 10,000 credits/s with 500 credits per request — 20 requests/s sustained
+# per IP — so that is the whole pass's budget, however many threads share it.
+BACKFILL_CONCURRENCY = 8
+BACKFILL_RATE_LIMIT = 20.0
+
+# Default for dankbit.backfill_lookback_hours: how far back the currency-wide
+# backfill starts the first time it runs for a currency (the WS service's
+# BACKFILL_MAX_WINDOW covers the same 6 hours on its side).
+BACKFILL_LOOKBACK_HOURS = 6
+
+# Trades of an expiry day are moved into a table of this schema once the
+# day is older than dankbit.trade_archive_after_days, TRADE_ARCHIVE_BATCH
+# rows per transaction (see _delete_expired_trades).
+TRADE_ARCHIVE_SCHEMA = "dankbit_archive"
+TRADE_ARCHIVE_AFTER_DAYS = 30
+TRADE_ARCHIVE_BATCH = 5000
+
+LAST_TRADES_URL = "https://www.deribit.com/api/v2/public/get_last_trades_by_instrument_and_time"
+LAST_TRADES_BY_CURRENCY_URL = "https://www.deribit.com/api/v2/public/get_last_trades_by_currency_and_time"
+
+# Circuit breaker around every Deribit REST call (see _DeribitBreaker): after
+# this many consecutive transport-level failures, calls fail fast for the
+# cooldown (callers serve their stale dankbit.deribit.cache entry instead), then a
+# single probe decides whether to close again.
+DERIBIT_BREAKER_THRESHOLD = 5
+DERIBIT_BREAKER_COOLDOWN = 30.0  # seconds
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _deribit_session():
+    """This worker's shared requests.Session: keep-alive connections to
+    Deribit reused across calls instead of a new TCP+TLS handshake per
+    request. Created on first use, i.e. after Odoo's prefork — a pool
+    inherited across fork() would share sockets between workers. Sized for
+    the backfill's thread pool."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=BACKFILL_CONCURRENCY * 2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+class _DeribitBreaker:
+    """Per-worker circuit breaker and call stats for Deribit REST.
+
+    closed → open after DERIBIT_BREAKER_THRESHOLD consecutive failures
+    (network errors, timeouts, non-2xx); open → half-open once
+    DERIBIT_BREAKER_COOLDOWN has passed, letting exactly one call through;
+    that call's outcome closes or re-opens it. While open, allow() is False
+    and _safe_deribit_request() returns None at once instead of retrying
+    with sleeps inside an HTTP worker. Deribit-level {"error": ...} bodies
+    (rate limits, bad params) come from a healthy API and don't count.
+
+    snapshot() is what /api/deribit-status serves."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.calls = 0
+        self.errors = 0
+        self.short_circuited = 0
+        self.opened = 0
+        self.latencies = deque(maxlen=500)
+
+    def allow(self):
+        with self.lock:
+            if self.state == "open" and time_module.monotonic() - self.opened_at >= DERIBIT_BREAKER_COOLDOWN:
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.calls += 1
+            self.latencies.append(latency)
+            if ok:
+                self.state = "closed"
+                self.failures = 0
+                return
+            self.errors += 1
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= DERIBIT_BREAKER_THRESHOLD:
+                if self.state != "open":
+                    _logger.warning("Deribit circuit breaker open after %d failures", self.failures)
+                    self.opened += 1
+                self.state = "open"
+                self.opened_at = time_module.monotonic()
+                self.probing = False
+
+    def snapshot(self):
+        with self.lock:
+            ordered = sorted(self.latencies)
+
+            def pct(p):
+                if not ordered:
+                    return None
+                return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "calls": self.calls,
+                "errors": self.errors,
+                "short_circuited": self.short_circuited,
+                "times_opened": self.opened,
+                "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0), "samples": len(ordered)},
+            }
+
+
+_breaker = _DeribitBreaker()
+
+
+class _TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may go
+    out, at `rate` per second on average with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = max(float(rate), 0.1)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time_module.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time_module.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time_module.sleep(wait)
 
 def _safe_deribit_request(
     url,
@@ -23,6 +178,7 @@ def _safe_deribit_request(
     retries=3,
     backoff=0.4,
     raise_on_fail=False,
+    limiter=None,
 ):
     """
     Robust GET with retries and exponential backoff.
@@ -32,17 +188,33 @@ def _safe_deribit_request(
     limiting, which Deribit signals inside the JSON body rather than via
     HTTP status, so resp.raise_for_status() alone can't catch it) unless
     raise_on_fail=True.
+    With a `limiter` (_TokenBucket), every attempt — retries included —
+    waits for a token first. Calls go through this worker's keep-alive
+    session and circuit breaker: while the breaker is open this returns
+    None (or raises) immediately, and retries stop as soon as it opens.
     """
 
     for attempt in range(1, retries + 1):
+        if not _breaker.allow():
+            _logger.debug("Deribit circuit breaker open, skipping %s", url)
+            if raise_on_fail:
+                raise RuntimeError("Deribit circuit breaker open")
+            return None
+        if limiter is not None:
+            limiter.acquire()
+        started = time_module.monotonic()
+        transport_ok = False
         try:
-            resp = requests.get(url, params=params, timeout=timeout)
+            resp = _deribit_session().get(url, params=params, timeout=timeout)
             resp.raise_for_status()
             data = resp.json()
+            transport_ok = True
             if isinstance(data, dict) and "error" in data:
                 raise RuntimeError(f"Deribit error: {data['error']}")
+            _breaker.record(time_module.monotonic() - started, True)
             return data
         except Exception as e:
+            _breaker.record(time_module.monotonic() - started, transport_ok)
             _logger.warning(
                 "Deribit request failed (%d/%d) %s params=%s error=%s",
                 attempt, retries, url, params, e
@@ -54,14 +226,106 @@ def _safe_deribit_request(
                     raise
                 return None
 
+
+def _fetch_instrument_trades(inst_name, start_ts, now_ts, timeout, limiter, pages, stop, failed):
+    """
+    Worker for Trade.get_last_trades(): pages one instrument's trades from
+    `start_ts` to `now_ts` and puts each non-empty page on `pages` as
+    (inst_name, trades), then (inst_name, None) once it's done — always,
+    even on error, so the consumer can count instruments off. Pure HTTP,
+    no env access: it runs in a pool thread, and the cursor stays on the
+    cron's thread.
+    Gives up early once `stop` (threading.Event) is set — the consumer is
+    leaving — or once the consumer has put `inst_name` in `failed`: its
+    later pages would be thrown away anyway.
+    """
+    #
+    # Pagination loop
+    #
+    # Deribit REST pagination works ONLY via timestamp windows.
+    # “has_more” sometimes appears even when “trades=[]”, so we need safety exits.
+    #
+    empty_pages = 0
+    max_empty_pages = 3       # prevent infinite loops
+    max_pages = 5000          # safety guard
+
+    try:
+        for _ in range(max_pages):
+            if stop.is_set() or inst_name in failed:
+                break
+            params = {
+                "instrument_name": inst_name,
+                "count": 1000,
+                "start_timestamp": start_ts,
+                "end_timestamp": now_ts,
+                "sorting": "asc",
+            }
+
+            #
+            # Robust request with backoff — _safe_deribit_request()
+            # already retries (and eventually gives up with None)
+            # on a Deribit-level {"error": ...} body, e.g. rate
+            # limiting, not just on network/HTTP failures.
+            #
+            data = _safe_deribit_request(LAST_TRADES_URL, params=params, timeout=timeout, limiter=limiter)
+            if not data or "result" not in data:
+                _logger.warning("Deribit request failed for %s, stopping pagination.", inst_name)
+                break
+
+            trades = data["result"].get("trades", [])
+
+            #
+            # Handle empty page
+            #
+            if not trades:
+                empty_pages += 1
+
+                # if Deribit signals more but gives nothing — bail
+                if empty_pages >= max_empty_pages:
+                    _logger.warning(
+                        "Stopping early for %s due to repeated empty pages.",
+                        inst_name
+                    )
+                    break
+                continue
+
+            pages.put((inst_name, trades))
+
+            # advance pagination timestamp — inclusive, same
+            # same-millisecond reasoning as get_last_trades()' start_ts.
+            start_ts = trades[-1]["timestamp"]
+            empty_pages = 0
+
+            #
+            # break if no more pages
+            #
+            if not data["result"].get("has_more"):
+                break
+    except Exception:
+        _logger.exception("Unexpected error fetching trades for %s, skipping to next instrument.", inst_name)
+    finally:
+        pages.put((inst_name, None))
+
+
 class Trade(models.Model):
     _name = "dankbit.trade"
     _order = "deribit_ts desc"
 
     name = fields.Char(required=True)
     active = fields.Boolean(default=True)
+    instrument_id = fields.Many2one("dankbit.instrument", index=True, ondelete="restrict")
     strike = fields.Integer(compute="_compute_strike", store=True)
-    expiration = fields.Datetime()
+    # Leading parts of the instrument name (BTC-29NOV24-98000-P → "BTC",
+    # "29NOV24"), stored so hot queries can filter on equality through
+    # the composite indexes in init() instead of name ILIKE '%...%', which
+    # no B-tree can serve. Raw-SQL writers (bulk_ingest_trades, the WS
+    # service) fill them directly; migrations/18.0.0.0.3 backfilled them.
+    currency = fields.Char(compute="_compute_currency_expiry", store=True)
+    expiry_code = fields.Char(compute="_compute_currency_expiry", store=True)
+    # Always known (derived from the name when Deribit doesn't send it, see
+    # bulk_ingest_trades); indexed for the per-day archiving in
+    # _delete_expired_trades.
+    expiration = fields.Datetime(index=True)
     index_price = fields.Float(digits=(16, 4))
     price = fields.Float(digits=(16, 4), required=True)
     mark_price = fields.Float(digits=(16, 4))
@@ -120,6 +384,155 @@ class Trade(models.Model):
          "The Deribit trade ID must be unique!")
     ]
 
+    def init(self):
+        # Backs _get_latest_trade_ts_by_instrument(): newest trade per
+        # instrument as an index-only scan.
+        tools.create_index(
+            self.env.cr, "dankbit_trade_name_deribit_ts_index", self._table, ["name", "deribit_ts"]
+        )
+        # Back _instrument_domain()/_instrument_where() filters: live
+        # positions per currency (active, unexpired), and trade windows per
+        # currency/expiry.
+        tools.create_index(
+            self.env.cr, "dankbit_trade_currency_active_expiration_index", self._table,
+            ["currency", "active", "expiration"],
+        )
+        tools.create_index(
+            self.env.cr, "dankbit_trade_currency_expiration_deribit_ts_index", self._table,
+            ["currency", "expiration", "deribit_ts"],
+        )
+
+    @api.depends("name")
+    def _compute_currency_expiry(self):
+        for rec in self:
+            parts = (rec.name or "").split("-")
+            rec.currency = parts[0] or False
+            rec.expiry_code = parts[1] if len(parts) > 1 and parts[1] else False
+
+    @api.model
+    def _instrument_domain(self, instrument):
+        """Domain selecting the trades of `instrument`: an asset ("BTC"), an
+        expiry ("BTC-27MAR26") or an instrument (name prefix), on the
+        indexed currency/expiry_code columns rather than a name ILIKE."""
+        parts = instrument.upper().split("-")
+        domain = [("currency", "=", parts[0])]
+        if len(parts) > 1 and parts[1]:
+            domain.append(("expiry_code", "=", parts[1]))
+        if len(parts) > 2:
+            domain.append(("name", "=like", f"{instrument.upper()}%"))
+        return domain
+
+    @api.model
+    def _instrument_where(self, instrument):
+        """Raw-SQL counterpart of _instrument_domain(): (condition, params)
+        to AND into a WHERE on dankbit_trade."""
+        parts = instrument.upper().split("-")
+        conditions, params = ["currency = %s"], [parts[0]]
+        if len(parts) > 1 and parts[1]:
+            conditions.append("expiry_code = %s")
+            params.append(parts[1])
+        if len(parts) > 2:
+            conditions.append("name LIKE %s")
+            params.append(f"{instrument.upper()}%")
+        return " AND ".join(conditions), params
+
+    @api.model
+    def _aggregate_legs(self, instrument, expiration_exact=None, expiration_until=None,
+                        traded_since=None, unexpired=True, per_instrument=False,
+                        include_archived=False):
+        """Active trades of `instrument` (see _instrument_where) summed per
+        (strike, option_type, direction, expiration) — the shape every
+        Greeks/delta-zero route feeds to delta/gamma as options.AggTrade
+        legs. Rows are (strike, option_type, direction, expiration,
+        amount, amount-weighted IV, trade count, premium sum), with the
+        instrument name in front when `per_instrument`. Optional filters:
+        an exact expiration, expirations up to `expiration_until`, trades
+        with deribit_ts >= `traded_since` (naive UTC datetime), and
+        `unexpired` (the default) for expiration >= NOW(). Archived trades
+        are left out unless `include_archived`, which always reads the
+        raw/bucket tables (the rollup holds active trades only).
+
+        Nothing here groups raw trades in the common cases. Without a
+        traded_since window the sums come from dankbit.position.rollup
+        (one row per instrument and direction over active trades, kept
+        current by triggers).
+        With one, they come from the hourly dankbit.trade.bucket rows from
+        the first whole hour on (the current hour's bucket included), plus
+        the trades of the partial hour before it read raw — nothing at all
+        when `traded_since` falls on the hour, e.g. since midnight."""
+        where, params = self._instrument_where(instrument)
+        group = "strike, option_type, direction, expiration"
+        if per_instrument:
+            group = "name, " + group
+
+        conditions = [where]
+        if unexpired:
+            conditions.append("expiration >= NOW()")
+        if expiration_exact:
+            conditions.append("expiration = %s")
+            params.append(expiration_exact)
+        elif expiration_until:
+            conditions.append("expiration <= %s")
+            params.append(expiration_until)
+        where = " AND ".join(conditions)
+        # the rollup holds active trades only, it has no such column
+        active = "" if include_archived else " AND active"
+
+        if traded_since is None and unexpired and not include_archived:
+            self.env.cr.execute(
+                f"""
+                SELECT {group},
+                       SUM(amount), SUM(iv_amount) / NULLIF(SUM(amount), 0), SUM(trade_count), SUM(premium)
+                FROM dankbit_position_rollup
+                WHERE {where}
+                GROUP BY {group}
+                """,
+                params,
+            )
+            return self.env.cr.fetchall()
+
+        if traded_since is None:
+            self.env.cr.execute(
+                f"""
+                SELECT {group},
+                       SUM(amount), SUM(iv * amount) / NULLIF(SUM(amount), 0), COUNT(*),
+                       SUM(price * index_price)
+                FROM dankbit_trade
+                WHERE {where}{active}
+                GROUP BY {group}
+                """,
+                params,
+            )
+            return self.env.cr.fetchall()
+
+        first_bucket = traded_since.replace(minute=0, second=0, microsecond=0)
+        head = ""
+        head_params = []
+        if first_bucket < traded_since:
+            first_bucket += timedelta(hours=1)
+            head = f"""
+                UNION ALL
+                SELECT {group}, amount, iv * amount, 1, price * index_price
+                FROM dankbit_trade
+                WHERE {where}{active} AND deribit_ts >= %s AND deribit_ts < %s
+            """
+            head_params = [*params, traded_since, first_bucket]
+        self.env.cr.execute(
+            f"""
+            SELECT {group},
+                   SUM(amount), SUM(iv_amount) / NULLIF(SUM(amount), 0), SUM(trade_count), SUM(premium)
+            FROM (
+                SELECT {group}, amount, iv_amount, trade_count, premium
+                FROM dankbit_trade_bucket
+                WHERE {where}{active} AND bucket >= %s
+                {head}
+            ) AS window_legs
+            GROUP BY {group}
+            """,
+            [*params, first_bucket, *head_params],
+        )
+        return self.env.cr.fetchall()
+
     @api.depends("name")
     def _compute_type(self):
         for rec in self:
@@ -160,25 +573,26 @@ class Trade(models.Model):
         except Exception:
             cache_ttl = 30.0
 
-        # consult cache first — keyed by currency to avoid BTC/ETH collision
+        # live value the WS service keeps in dankbit.instrument.state — one
+        # indexed row, no Deribit round trip on the request path
+        if params:
+            live = self.env["dankbit.instrument.state"].get_index_price(params["index_name"])
+            if live:
+                return live
+
+        def fetch():
+            data = _safe_deribit_request(URL, params=params, timeout=timeout)
+            if data and isinstance(data, dict):
+                return data.get("result", {}).get("index_price", 0.0)
+            return None
+
+        # shared cache — keyed by currency to avoid BTC/ETH collision
         currency = "BTC" if instrument.startswith("BTC") else "ETH"
-        cache_key = f"index_price_{currency}"
-        now_ts = time_module.time()
-        cached = _DERIBIT_CACHE.get(cache_key, {})
-        if cached and cached.get("value") is not None and (now_ts - cached.get("ts", 0) < cache_ttl):
-            return cached.get("value")
-
-        data = _safe_deribit_request(URL, params=params, timeout=timeout)
-        if data and isinstance(data, dict):
-            val = data.get("result", {}).get("index_price", 0.0)
-            _DERIBIT_CACHE[cache_key] = {"ts": now_ts, "value": val}
-            return val
-        else:
-            if cached and cached.get("value") is not None:
-                _logger.warning("get_index_price: using stale cached value")
-                return cached.get("value")
-            _logger.exception("get_index_price failed and no cache available")
+        val = self.env["dankbit.deribit.cache"].get(f"index_price_{currency}", cache_ttl, fetch)
+        if val is None:
+            _logger.error("get_index_price failed and no cache available")
             return 0.0
+        return val
 
     def get_open_interest_by_currency(self, asset):
         """Current open interest (contracts outstanding) for every option
@@ -187,14 +601,20 @@ class Trade(models.Model):
         ticker lookups. Used by ChartController._gamma_by_strike to cap the
         net position it derives from cumulative signed trade flow, so
         historical round-tripped volume at a strike can't imply a larger
-        position than what's actually outstanding right now. Cached the
-        same way get_index_price is (_DERIBIT_CACHE, dankbit.deribit_cache_ttl),
-        keyed by currency. Returns {instrument_name: open_interest} — empty
-        dict for an unknown asset or on total failure with no cache."""
+        position than what's actually outstanding right now. Read from
+        dankbit.instrument.state (polled by the WS service) when fresh;
+        otherwise fetched and cached the same way get_index_price is
+        (dankbit.deribit.cache, dankbit.deribit_cache_ttl), keyed by currency.
+        Returns {instrument_name: open_interest} — empty dict for an unknown
+        asset or on total failure with no cache."""
         currency = "BTC" if asset.upper().startswith("BTC") else "ETH" if asset.upper().startswith("ETH") else None
         if not currency:
             return {}
 
+        live = self.env["dankbit.instrument.state"].get_open_interest(currency)
+        if live:
+            return live
+
         URL = "https://www.deribit.com/api/v2/public/get_book_summary_by_currency"
         params = {"currency": currency, "kind": "option"}
 
@@ -207,24 +627,39 @@ class Trade(models.Model):
         except Exception:
             pass
 
-        cache_key = f"open_interest_{currency}"
-        now_ts = time_module.time()
-        cached = _DERIBIT_CACHE.get(cache_key, {})
-        if cached and cached.get("value") is not None and (now_ts - cached.get("ts", 0) < cache_ttl):
-            return cached.get("value")
-
-        data = _safe_deribit_request(URL, params=params, timeout=timeout)
-        if data and isinstance(data, dict):
-            result = data.get("result", []) or []
-            val = {row["instrument_name"]: float(row.get("open_interest") or 0.0) for row in result}
-            _DERIBIT_CACHE[cache_key] = {"ts": now_ts, "value": val}
-            return val
-        else:
-            if cached and cached.get("value") is not None:
-                _logger.warning("get_open_interest_by_currency: using stale cached value")
-                return cached.get("value")
-            _logger.exception("get_open_interest_by_currency failed and no cache available")
+        def fetch():
+            data = _safe_deribit_request(URL, params=params, timeout=timeout)
+            if data and isinstance(data, dict):
+                result = data.get("result", []) or []
+                return {row["instrument_name"]: float(row.get("open_interest") or 0.0) for row in result}
+            return None
+
+        val = self.env["dankbit.deribit.cache"].get(f"open_interest_{currency}", cache_ttl, fetch)
+        if val is None:
+            _logger.error("get_open_interest_by_currency failed and no cache available")
             return {}
+        return val
+
+    @api.model
+    def get_deribit_status(self):
+        """Circuit-breaker state and Deribit REST call latency of the worker
+        serving this call (each Odoo worker has its own breaker and
+        session, see _DeribitBreaker), plus the shared cache's hit/refresh
+        counters and key ages (dankbit.deribit.cache.stats) — for
+        /api/deribit-status."""
+        return dict(_breaker.snapshot(), pid=os.getpid(), cache=self.env["dankbit.deribit.cache"].stats())
+
+    def get_data_version(self, asset, expiry=None):
+        """Change-feed version of `asset`'s trades — of one expiry when
+        `expiry` is given, either as the Deribit code ("27MAR26") or an
+        instrument prefix ("BTC-27MAR26"). Equal versions mean no trade was
+        inserted in between, so a cache or ETag keyed on it can be reused
+        as-is. None while this process's listener isn't connected yet —
+        callers should then treat the data as changed. See trade_feed.py."""
+        asset = asset.upper().split("-")[0]
+        if expiry and "-" in expiry:
+            expiry = expiry.split("-")[1]
+        return trade_feed.get_listener(self.env.cr.dbname).version(asset, expiry or None)
 
     def get_candles(self, asset, interval="4h", limit=500):
         """Real Deribit perpetual-futures candles, oldest-first — shared by
@@ -256,7 +691,7 @@ class Trade(models.Model):
         url = (f"https://www.deribit.com/api/v2/public/get_tradingview_chart_data"
                f"?instrument_name={instrument}&resolution={resolution}"
                f"&start_timestamp={start_ms}&end_timestamp={now_ms}")
-        resp = requests.get(url, timeout=10).json()
+        resp = _safe_deribit_request(url, params=None, timeout=10, retries=1) or {}
         result = resp.get("result", {})
         ticks  = result.get("ticks",  [])
         opens  = result.get("open",   [])
@@ -284,10 +719,32 @@ class Trade(models.Model):
 
         return candles
 
-    def _get_latest_trade_ts_for_instrument(self, instrument_name: str):
-        return self.with_context(active_test=False).search(
-            [("name", "=", instrument_name)], order="deribit_ts desc", limit=1
+    def _get_latest_trade_ts_by_instrument(self, instrument_names):
+        """{instrument_name: newest deribit_ts} for every name in
+        `instrument_names` that has trades (archived ones included) — one
+        query for the whole backfill pass instead of a search per
+        instrument. Written as a LATERAL top-1 per name rather than
+        MAX() ... GROUP BY so each name is a single backward index-only
+        probe of dankbit_trade_name_deribit_ts_index (see init()), not a
+        scan of every trade the instrument ever had."""
+        if not instrument_names:
+            return {}
+        self.env.cr.execute(
+            """
+            SELECT n.name, t.deribit_ts
+            FROM unnest(%s::varchar[]) AS n(name)
+            CROSS JOIN LATERAL (
+                SELECT deribit_ts
+                FROM dankbit_trade
+                WHERE name = n.name
+                  AND deribit_ts IS NOT NULL
+                ORDER BY deribit_ts DESC
+                LIMIT 1
+            ) t
+            """,
+            (list(instrument_names),),
         )
+        return dict(self.env.cr.fetchall())
 
     # ========== FETCHING & INGESTION ==========
 
@@ -299,18 +756,34 @@ class Trade(models.Model):
         - Uses timestamp-based pagination (Deribit REST's only supported method).
         - Ensures no gaps, no flooding, no duplicate inserts.
         - Gracefully handles Deribit rate-limit, empty responses, and pagination quirks.
-        - One instrument's failure can't take down the rest of the run: each
-          instrument's fetch is wrapped in its own try/except, so a single
-          malformed response/record only skips that instrument for this
-          cycle rather than aborting every instrument still left in
-          option_instruments (the next cron cycle resumes it normally,
-          since start_ts is always recomputed from the DB's last committed
-          trade).
+        - Instruments are fetched concurrently: dankbit.backfill_concurrency
+          threads (see _fetch_instrument_trades) share one _TokenBucket
+          sized by dankbit.backfill_rate_limit, so the pass as a whole
+          stays under Deribit's credit budget instead of each request
+          sleeping on its own. The threads only do HTTP — pages come back
+          through a bounded queue and are inserted/committed here, on the
+          cron's own cursor, one page at a time.
+        - One instrument's failure can't take down the rest of the run: a
+          fetch error only ends that instrument's pagination, and a page
+          that fails to insert is rolled back and ends that instrument for
+          this run — its later pages are dropped, not committed, because
+          start_ts is recomputed from the DB's last committed trade and a
+          later page landing would put the lost one behind it for good.
+          The next cron cycle then resumes from the page that failed.
+        - If the consumer itself dies (cursor lost, ...), the finally
+          below stops the workers and drains the queue, so none is left
+          blocked on a full queue and the pool can shut down.
+        - With dankbit.backfill_mode = "currency" none of the above runs:
+          see _get_last_trades_by_currency().
         """
 
+        # refresh dankbit.instrument first, so every page's trades find
+        # their instrument_id
+        self.env["dankbit.instrument"]._sync_from_deribit()
+
         option_instruments = [
             inst for inst in self._get_instruments()
-            if inst.get("kind") == "option"
+            if inst.get("kind") == "option" and inst.get("instrument_name")
         ]
 
         icp = self.env["ir.config_parameter"]
@@ -319,150 +792,341 @@ class Trade(models.Model):
         except Exception:
             timeout = 5.0
 
-        URL = "https://www.deribit.com/api/v2/public/get_last_trades_by_instrument_and_time"
+        if icp.get_param("dankbit.backfill_mode", default="instrument") == "currency":
+            return self._get_last_trades_by_currency(option_instruments, timeout)
+
+        try:
+            concurrency = max(1, int(icp.get_param("dankbit.backfill_concurrency", default=BACKFILL_CONCURRENCY)))
+        except Exception:
+            concurrency = BACKFILL_CONCURRENCY
+        try:
+            rate_limit = float(icp.get_param("dankbit.backfill_rate_limit", default=BACKFILL_RATE_LIMIT))
+        except Exception:
+            rate_limit = BACKFILL_RATE_LIMIT
 
         # critical: if DB already contains full history → always start from last trade timestamp
         # NEVER limit by "days ago" again
         base_start = 0  # REST can only return what it still retains internally
 
-        for inst in option_instruments:
-            inst_name = inst.get("instrument_name")
-            if not inst_name:
-                continue
+        latest = self._get_latest_trade_ts_by_instrument(
+            [inst["instrument_name"] for inst in option_instruments]
+        )
+        now_ts = int(time_module.time() * 1000)
 
-            try:
-                latest_trade = self._get_latest_trade_ts_for_instrument(inst_name)
-
-                # choose correct starting point
-                if latest_trade and latest_trade.deribit_ts:
-                    dt_val = latest_trade.deribit_ts
-                    if isinstance(dt_val, str):
-                        dt_obj = fields.Datetime.from_string(dt_val)
-                    else:
-                        dt_obj = dt_val
-                    if dt_obj.tzinfo is None:
-                        dt_obj = dt_obj.replace(tzinfo=timezone.utc)
-
-                    # Resume AT the last known trade's timestamp, not one ms
-                    # past it: Deribit's start_timestamp bound is inclusive,
-                    # and options books can have multiple trades landing in
-                    # the exact same millisecond (multi-leg/block fills). A
-                    # "+1" here would permanently skip any sibling trades at
-                    # that same millisecond that weren't in the last fetched
-                    # page. The one guaranteed re-fetch of the boundary
-                    # trade itself is cheap: _create_new_trade() already
-                    # silently drops it via the deribit_trade_identifier
-                    # unique-constraint conflict.
-                    start_ts = int(dt_obj.timestamp() * 1000)
-                else:
-                    # fallback (fresh DB case, or an instrument with zero trades)
-                    start_ts = base_start
+        jobs = []
+        for inst in option_instruments:
+            inst_name = inst["instrument_name"]
+            dt_val = latest.get(inst_name)
+
+            # choose correct starting point
+            if dt_val:
+                if isinstance(dt_val, str):
+                    dt_val = fields.Datetime.from_string(dt_val)
+                if dt_val.tzinfo is None:
+                    dt_val = dt_val.replace(tzinfo=timezone.utc)
+
+                # Resume AT the last known trade's timestamp, not one ms
+                # past it: Deribit's start_timestamp bound is inclusive,
+                # and options books can have multiple trades landing in
+                # the exact same millisecond (multi-leg/block fills). A
+                # "+1" here would permanently skip any sibling trades at
+                # that same millisecond that weren't in the last fetched
+                # page. The one guaranteed re-fetch of the boundary
+                # trade itself is cheap: bulk_ingest_trades() already
+                # silently drops it via the deribit_trade_identifier
+                # unique-constraint conflict.
+                start_ts = int(dt_val.timestamp() * 1000)
+            else:
+                # fallback (fresh DB case, or an instrument with zero trades)
+                start_ts = base_start
 
-                now_ts = int(time_module.time() * 1000)
+            if start_ts >= now_ts:
+                _logger.debug("Skipping %s — already up to date (start_ts=%s >= now_ts=%s)", inst_name, start_ts, now_ts)
+                continue
+            jobs.append((inst_name, start_ts, inst.get("expiration_timestamp")))
 
-                if start_ts >= now_ts:
-                    _logger.debug("Skipping %s — already up to date (start_ts=%s >= now_ts=%s)", inst_name, start_ts, now_ts)
-                    continue
+        _logger.info(
+            "Fetching trades for %d instruments (%d threads, %.1f req/s)",
+            len(jobs), concurrency, rate_limit,
+        )
 
-                _logger.info(
-                    "Fetching trades for %s from %s → %s",
-                    inst_name, start_ts, now_ts
+        limiter = _TokenBucket(rate_limit)
+        pages = queue.Queue(maxsize=concurrency * 4)
+        stop = threading.Event()
+        failed = set()  # instruments with a page that failed to insert
+        expirations = {inst_name: exp_ts for inst_name, _, exp_ts in jobs}
+        started = time_module.monotonic()
+        inserted = 0
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="dankbit-backfill") as pool:
+            for inst_name, start_ts, _ in jobs:
+                pool.submit(
+                    _fetch_instrument_trades,
+                    inst_name, start_ts, now_ts, timeout, limiter, pages, stop, failed,
                 )
 
-                #
-                # Pagination loop
-                #
-                # Deribit REST pagination works ONLY via timestamp windows.
-                # “has_more” sometimes appears even when “trades=[]”, so we need safety exits.
-                #
-                empty_pages = 0
-                max_empty_pages = 3       # prevent infinite loops
-                max_pages = 5000          # safety guard
+            remaining = len(jobs)
+            try:
+                while remaining:
+                    inst_name, trades = pages.get()
+                    if trades is None:  # that instrument's fetch is over
+                        remaining -= 1
+                        continue
+                    if inst_name in failed:
+                        continue
 
-                pages = 0
+                    try:
+                        page_inserted, _skipped = self.bulk_ingest_trades(trades, expirations)
+                        # per-page commit
+                        self.env.cr.commit()
+                        inserted += page_inserted
+                    except Exception:
+                        _logger.exception(
+                            "Unexpected error storing trades for %s, skipping the rest of its pages.",
+                            inst_name,
+                        )
+                        self.env.cr.rollback()
+                        failed.add(inst_name)
+            finally:
+                # normally a no-op; after an exception, unblock any worker
+                # stuck on pages.put() until every one has signed off, or
+                # the pool's __exit__ would wait on them forever
+                stop.set()
+                while remaining:
+                    if pages.get()[1] is None:
+                        remaining -= 1
+
+        _logger.info(
+            "Fetched %d trades for %d instruments in %.1fs",
+            inserted, len(jobs), time_module.monotonic() - started,
+        )
 
-                while pages < max_pages:
-                    pages += 1
+    def _get_last_trades_by_currency(self, option_instruments, timeout):
+        """
+        Currency-wide variant of get_last_trades() (dankbit.backfill_mode =
+        "currency"): pages get_last_trades_by_currency_and_time (kind=option)
+        once per currency from a single high-water mark, instead of one
+        pagination per instrument. Almost every instrument has no new trades
+        between two cron passes, so a typical pass is one or two HTTP calls
+        per currency rather than several hundred.
+        - The high-water mark is the timestamp of the newest trade stored
+          by this mode, kept per currency in ir.config_parameter (see
+          _get_backfill_hwm) and moved in the same transaction as each
+          page's inserts, so it never runs ahead of what's committed.
+          Trades the WS service stores never move it.
+        - Resumes AT the mark (inclusive), for the same-millisecond reason
+          explained in get_last_trades(); the boundary trades it re-fetches
+          are dropped by the deribit_trade_identifier constraint.
+        - Trades on instruments no longer listed (expired since the
+          instruments cache was filled) get their expiration from the
+          instrument name, see bulk_ingest_trades().
+        """
+        expirations = {
+            inst["instrument_name"]: inst.get("expiration_timestamp")
+            for inst in option_instruments
+        }
+        currencies = sorted({name.split("-")[0] for name in expirations})
+        now_ts = int(time_module.time() * 1000)
 
+        for currency in currencies:
+            start_ts = self._get_backfill_hwm(currency)
+            requests_made = inserted = 0
+            try:
+                while requests_made < 5000:  # safety guard
+                    requests_made += 1
                     params = {
-                        "instrument_name": inst_name,
+                        "currency": currency,
+                        "kind": "option",
                         "count": 1000,
                         "start_timestamp": start_ts,
                         "end_timestamp": now_ts,
                         "sorting": "asc",
                     }
-
-                    #
-                    # Robust request with backoff — _safe_deribit_request()
-                    # already retries (and eventually gives up with None)
-                    # on a Deribit-level {"error": ...} body, e.g. rate
-                    # limiting, not just on network/HTTP failures.
-                    #
-                    data = _safe_deribit_request(URL, params=params, timeout=timeout)
-                    if not data:
-                        _logger.warning("Deribit request failed for %s, stopping pagination.", inst_name)
-                        break
-
+                    data = _safe_deribit_request(LAST_TRADES_BY_CURRENCY_URL, params=params, timeout=timeout)
                     if not data or "result" not in data:
-                        _logger.warning("No valid result for %s", inst_name)
+                        _logger.warning("Deribit request failed for %s, stopping pagination.", currency)
                         break
 
                     trades = data["result"].get("trades", [])
-
-                    #
-                    # Handle empty page
-                    #
                     if not trades:
-                        empty_pages += 1
-
-                        # if Deribit signals more but gives nothing — bail
-                        if empty_pages >= max_empty_pages:
-                            _logger.warning(
-                                "Stopping early for %s due to repeated empty pages.",
-                                inst_name
-                            )
-                            break
-
-                        # chill and try next cycle
-                        time_module.sleep(0.05)
-                        continue
-
-                    #
-                    # Insert all trades in chronological order
-                    #
-                    for trd in trades:
-                        self._create_new_trade(
-                            trd,
-                            inst.get("expiration_timestamp")
-                        )
+                        break
 
-                    # advance pagination timestamp — inclusive, same
-                    # same-millisecond reasoning as the initial start_ts above.
-                    start_ts = trades[-1]["timestamp"]
-                    empty_pages = 0
+                    page_inserted, _skipped = self.bulk_ingest_trades(trades, expirations)
+                    # Inclusive resume, but always at least one ms forward:
+                    # a full page that ends on the mark itself (every trade
+                    # in the boundary millisecond) would otherwise be
+                    # re-requested until the safety guard — the same guard
+                    # as the WS service's backfill_gap().
+                    start_ts = max(trades[-1]["timestamp"], start_ts + 1)
+                    self._set_backfill_hwm(currency, start_ts)
+                    # per-page commit
+                    self.env.cr.commit()
+                    inserted += page_inserted
 
-                    #
-                    # break if no more pages
-                    #
                     if not data["result"].get("has_more"):
                         break
-
-                    # polite pacing
-                    time_module.sleep(0.05 + random.random() * 0.02)
-
-                # per-instrument commit
-                self.env.cr.commit()
-
-                _logger.info("Finished fetching trades for %s", inst_name)
             except Exception:
                 _logger.exception(
-                    "Unexpected error fetching trades for %s, skipping to next instrument.",
-                    inst_name,
+                    "Unexpected error fetching trades for %s, skipping to next currency.",
+                    currency,
                 )
                 self.env.cr.rollback()
 
-            # polite pause between instruments to avoid hammering Deribit
-            time_module.sleep(0.1 + random.random() * 0.05)
+            _logger.info(
+                "Fetched %d %s trades in %d requests (high-water mark %s)",
+                inserted, currency, requests_made, start_ts,
+            )
+
+    def _get_backfill_hwm(self, currency):
+        """Currency-wide backfill high-water mark (ms) for `currency`. Seeded
+        from now minus dankbit.backfill_lookback_hours the first time the
+        mode runs, so switching modes doesn't re-fetch all of history. Not
+        from the newest stored trade: the WS service stores trades too, and
+        one it wrote after a gap would put the mark past the gap."""
+        self.env.cr.execute(
+            "SELECT value FROM ir_config_parameter WHERE key = %s",
+            (f"dankbit.backfill_hwm.{currency}",),
+        )
+        row = self.env.cr.fetchone()
+        if row:
+            try:
+                return int(row[0])
+            except (TypeError, ValueError):
+                pass
+
+        try:
+            lookback = float(self.env["ir.config_parameter"].get_param(
+                "dankbit.backfill_lookback_hours", default=BACKFILL_LOOKBACK_HOURS
+            ))
+        except (TypeError, ValueError):
+            lookback = BACKFILL_LOOKBACK_HOURS
+        return int((time_module.time() - lookback * 3600) * 1000)
+
+    def _set_backfill_hwm(self, currency, ts):
+        # Raw upsert rather than set_param(): set_param() clears the
+        # registry's ormcache (and signals every other worker to do the
+        # same) on each write, which this would otherwise do every page of
+        # every cron pass. _get_backfill_hwm() reads it back with SQL too,
+        # so the stale get_param() cache never matters.
+        self.env.cr.execute(
+            """
+            INSERT INTO ir_config_parameter (key, value, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (key) DO UPDATE
+                SET value = EXCLUDED.value, write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+            """,
+            (f"dankbit.backfill_hwm.{currency}", str(ts), self.env.uid, self.env.uid),
+        )
+
+    @api.model
+    def bulk_ingest_trades(self, trades, expirations=None):
+        """
+        Store Deribit trade dicts (as returned by the public trades
+        endpoints) in one INSERT ... ON CONFLICT (deribit_trade_identifier)
+        DO NOTHING, and announce what was new on the trade feed — delivered
+        when the caller commits. Returns (inserted, skipped); skipped rows
+        are trades already stored (by the WS service or an earlier page).
+
+        This is what REST importers should call instead of create(): a 1000
+        trade page costs one statement rather than 1000 savepoints and ORM
+        creates. Since the ORM isn't involved, the stored computes (strike,
+        option_type, currency, expiry_code) are filled here from the
+        instrument name, exactly as their _compute_* methods would, and
+        instrument_id is resolved through dankbit.instrument._ensure().
+        `expirations` maps instrument name to Deribit's
+        expiration_timestamp (ms); for instruments missing from it the
+        expiration is derived from the name (08:00 UTC on the expiry day),
+        so trades on delisted instruments still get archived on time.
+
+        A malformed trade (e.g. missing a required field) fails the whole
+        statement, like a failing create() did — callers roll the page back.
+        """
+        expirations = expirations or {}
+        instrument_ids = self.env["dankbit.instrument"]._ensure(
+            trd.get("instrument_name") for trd in trades
+        )
+        rows = []
+        for trd in trades:
+            name = trd.get("instrument_name")
+            try:
+                # Deribit format: BTC-29NOV24-98000-P
+                strike = int(str(name).split("-")[2]) if name else 0
+            except Exception:
+                strike = 0
+            option_type = {"P": "put", "C": "call"}.get(name[-1]) if name else None
+            expiration_ts = expirations.get(name)
+            expiration = (
+                datetime.fromtimestamp(expiration_ts / 1000, tz=timezone.utc).replace(tzinfo=None)
+                if expiration_ts else _parse_instrument_name(name)[4]
+            )
+            parts = (name or "").split("-")
+            rows.append((
+                name,
+                instrument_ids.get(name),
+                parts[0] or None,
+                parts[1] if len(parts) > 1 and parts[1] else None,
+                strike,
+                option_type,
+                trd.get("trade_id"),
+                trd.get("iv"),
+                trd.get("index_price"),
+                trd.get("price"),
+                trd.get("mark_price"),
+                trd.get("direction"),
+                trd.get("trade_seq"),
+                trd.get("amount"),
+                datetime.fromtimestamp(trd["timestamp"] / 1000, tz=timezone.utc).replace(tzinfo=None),
+                expiration,
+                bool(
+                    trd.get("is_block_trade")
+                    or trd.get("block_trade")
+                    or trd.get("block_trade_id")
+                ),
+                trd.get("block_trade_id"),
+                self.env.uid,
+                self.env.uid,
+            ))
+        if not rows:
+            return 0, 0
+
+        # pending ORM writes must reach the table before raw SQL does
+        self.flush_model()
+        new_rows = execute_values(
+            self.env.cr._obj,
+            """
+            INSERT INTO dankbit_trade
+            (
+                name, instrument_id, currency, expiry_code, strike, option_type, deribit_trade_identifier, iv,
+                index_price, price, mark_price, direction, trade_seq, amount,
+                deribit_ts, expiration, is_block_trade, block_trade_id,
+                create_uid, write_uid, active, create_date, write_date
+            )
+            VALUES %s
+            ON CONFLICT (deribit_trade_identifier) DO NOTHING
+            RETURNING id, name
+            """,
+            rows,
+            template="""(
+                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                TRUE, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+            )""",
+            page_size=len(rows),
+            fetch=True,
+        )
+
+        max_new_ids = {}
+        expiries = {}
+        for trade_id, name in new_rows:
+            currency, expiry = (name.split("-") + [""])[:2]
+            max_new_ids[currency] = max(max_new_ids.get(currency, 0), trade_id)
+            expiries.setdefault(currency, set()).add(expiry)
+
+        # announce on the same change feed the WS ingester uses
+        # (see trade_feed.py)
+        for currency, max_new_id in max_new_ids.items():
+            trade_feed.notify(self.env.cr, currency, expiries[currency], max_new_id)
+
+        return len(new_rows), len(rows) - len(new_rows)
 
     @api.model
     def get_last_trade(self, instrument_name):
@@ -474,7 +1138,7 @@ class Trade(models.Model):
             return self.browse()
 
         return self.search(
-            [("name", "ilike", instrument_name)],
+            self._instrument_domain(instrument_name),
             order="deribit_ts desc, id desc",
             limit=1,
         )
@@ -490,87 +1154,92 @@ class Trade(models.Model):
         except Exception:
             cache_ttl = 300.0
 
-        now_ts = time_module.time()
         all_instruments = []
 
         for currency in ("BTC", "ETH"):
-            cache_key = f"instruments_{currency}"
-            cached = _DERIBIT_CACHE.get(cache_key, {})
-
-            if (
-                cached
-                and cached.get("value") is not None
-                and (now_ts - cached.get("ts", 0) < cache_ttl)
-            ):
-                all_instruments.extend(cached["value"])
-                continue
-
             params = {
                 "currency": currency,
                 "kind": "option",
                 "expired": "false",
             }
 
-            data = _safe_deribit_request(URL, params=params, timeout=timeout)
+            def fetch(params=params):
+                data = _safe_deribit_request(URL, params=params, timeout=timeout)
+                if data and isinstance(data, dict):
+                    return data.get("result", [])
+                return None
 
-            if data and isinstance(data, dict):
-                instruments = data.get("result", [])
-                _DERIBIT_CACHE[cache_key] = {
-                    "ts": now_ts,
-                    "value": instruments,
-                }
-                all_instruments.extend(instruments)
-            else:
-                _logger.warning(
-                    "Failed to fetch %s instruments from Deribit, using cache if available",
-                    currency,
-                )
-                if cached and cached.get("value"):
-                    all_instruments.extend(cached["value"])
+            instruments = self.env["dankbit.deribit.cache"].get(f"instruments_{currency}", cache_ttl, fetch)
+            if instruments is None:
+                _logger.warning("Failed to fetch %s instruments from Deribit and no cache available", currency)
+                continue
+            all_instruments.extend(instruments)
 
         return all_instruments
 
-    def _create_new_trade(self, trade, expiration_ts):
-        deribit_dt = datetime.fromtimestamp(trade["timestamp"] / 1000, tz=timezone.utc)
-        exp_dt = datetime.fromtimestamp(expiration_ts / 1000, tz=timezone.utc) if expiration_ts else None
-
-        vals = {
-            "name": trade.get("instrument_name"),
-            "iv": trade.get("iv"),
-            "index_price": trade.get("index_price"),
-            "price": trade.get("price"),
-            "mark_price": trade.get("mark_price"),
-            "direction": trade.get("direction"),
-            "trade_seq": trade.get("trade_seq"),
-            "deribit_trade_identifier": trade.get("trade_id"),
-            "amount": trade.get("amount"),
-            "deribit_ts": fields.Datetime.to_string(deribit_dt),
-            "expiration": fields.Datetime.to_string(exp_dt) if exp_dt else False,
-            "is_block_trade": bool(
-                trade.get("is_block_trade")
-                or trade.get("block_trade")
-                or trade.get("block_trade_id")
-            ),
-            "block_trade_id": trade.get("block_trade_id"),
-        }
-
-        try:
-            with self.env.cr.savepoint():
-                self.env["dankbit.trade"].create(vals)
-        except Exception as e:
-            if "deribit_trade_identifier" in str(e):
-                return  # WS already inserted this trade — skip silently
-            _logger.exception("Failed to create trade %s", trade.get("trade_id"))
-            raise
-
     # run by scheduled action
     def _delete_expired_trades(self):
-        self.env["dankbit.trade"].search(
-            domain=[
-                ("expiration", "<", fields.Datetime.now()), 
-                ("active", "=", True)
-            ]
-        ).write({"active": False})
+        """Archive expired trades. Rows turn active=False as soon as their
+        expiry has passed (a single UPDATE). Then, once a whole expiry day
+        is older than dankbit.trade_archive_after_days (default 30 —
+        past-expiry trades still feed historical points on the bands chart
+        for a while), its trades are moved into
+        dankbit_archive.dankbit_trade_YYYYMMDD, TRADE_ARCHIVE_BATCH rows per
+        committed DELETE ... RETURNING / INSERT: out of dankbit_trade and
+        its indexes, but still there to be inspected or dropped. The
+        UPDATE and the DELETEs fire the rollup triggers, so
+        dankbit.position.rollup and dankbit.trade.bucket follow along."""
+        cr = self.env.cr
+        cr.execute(
+            """
+            UPDATE dankbit_trade
+            SET active = FALSE, write_date = NOW() AT TIME ZONE 'UTC'
+            WHERE active AND expiration < NOW() AT TIME ZONE 'UTC'
+            """
+        )
+        cr.commit()
+
+        try:
+            keep_days = int(self.env["ir.config_parameter"].sudo().get_param(
+                "dankbit.trade_archive_after_days", default=TRADE_ARCHIVE_AFTER_DAYS))
+        except (TypeError, ValueError):
+            keep_days = TRADE_ARCHIVE_AFTER_DAYS
+        today = datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+        cutoff = today - timedelta(days=keep_days)
+
+        while True:
+            # oldest expiry day left, straight off the expiration index
+            cr.execute("SELECT MIN(expiration) FROM dankbit_trade WHERE expiration < %s", (cutoff,))
+            oldest = cr.fetchone()[0]
+            if not oldest:
+                break
+            day = oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+            archive = f"{TRADE_ARCHIVE_SCHEMA}.dankbit_trade_{day:%Y%m%d}"
+            cr.execute(f"CREATE SCHEMA IF NOT EXISTS {TRADE_ARCHIVE_SCHEMA}")
+            cr.execute(f"CREATE TABLE IF NOT EXISTS {archive} (LIKE dankbit_trade)")
+            moved = 0
+            while True:
+                cr.execute(
+                    f"""
+                    WITH moved AS (
+                        DELETE FROM dankbit_trade
+                        WHERE id IN (
+                            SELECT id FROM dankbit_trade
+                            WHERE expiration >= %s AND expiration < %s
+                            LIMIT %s
+                        )
+                        RETURNING *
+                    )
+                    INSERT INTO {archive} SELECT * FROM moved
+                    """,
+                    (day, day + timedelta(days=1), TRADE_ARCHIVE_BATCH),
+                )
+                batch = cr.rowcount
+                cr.commit()
+                moved += batch
+                if batch < TRADE_ARCHIVE_BATCH:
+                    break
+            _logger.info("Archived %d trades of %s to %s", moved, f"{day:%Y-%m-%d}", archive)
 
     @api.model
     def get_views(self, views, options=None):
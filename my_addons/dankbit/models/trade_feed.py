@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Change feed for dankbit_trade, over PostgreSQL LISTEN/NOTIFY.
+
+The WS ingester (dankbit_ws_service/dankbit_ws_batch.py, notify_trades) and
+Trade.get_last_trades() both NOTIFY dankbit_trades once per committed batch
+with {"currency", "expirations", "max_id"}. One daemon thread per database
+(per Odoo process) LISTENs on that channel and keeps a data version per
+(asset, expiry code) — the highest dankbit_trade id announced for it. A
+version that hasn't moved means nothing was inserted for that expiry, so
+caches/ETags/incremental aggregates can key on it instead of a TTL — the
+delta-zero routes do (controllers/main.py, ChartController._by_data_version),
+and their first call is what starts this process's listener.
+
+Versions are opaque tokens, only meant for equality checks: they start at
+the table's MAX(id) when the listener (re)connects, so an expiry with no
+traffic since then shares that baseline, and every version moves after a
+reconnect (notifications may have been missed in between).
+"""
+
+import json
+import logging
+import selectors
+import threading
+import time
+
+from odoo import sql_db
+
+_logger = logging.getLogger(__name__)
+
+CHANNEL = "dankbit_trades"
+SELECT_TIMEOUT = 50      # seconds, just so a dead connection is noticed
+RECONNECT_DELAY = 5      # seconds
+
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+class TradeFeedListener(threading.Thread):
+
+    def __init__(self, dbname):
+        super().__init__(name=f"dankbit.trade_feed.{dbname}", daemon=True)
+        self.dbname = dbname
+        self.lock = threading.Lock()
+        self.baseline = None
+        self.versions = {}
+
+    def version(self, asset, expiry=None):
+        """Data version of `asset` (all expiries when `expiry` is None), or
+        None while the listener isn't connected."""
+        with self.lock:
+            if self.baseline is None:
+                return None
+            return self.versions.get((asset, expiry), self.baseline)
+
+    def apply(self, payload):
+        try:
+            msg = json.loads(payload)
+            asset, max_id = msg["currency"], int(msg["max_id"])
+            expirations = msg.get("expirations") or []
+        except (ValueError, KeyError, TypeError):
+            _logger.warning("Ignoring malformed %s payload: %r", CHANNEL, payload)
+            return
+
+        with self.lock:
+            if self.baseline is None:
+                return
+            for key in [(asset, None)] + [(asset, expiry) for expiry in expirations]:
+                self.versions[key] = max(self.versions.get(key, self.baseline), max_id)
+
+    def run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                _logger.exception("%s listener for %s failed, reconnecting in %ss", CHANNEL, self.dbname, RECONNECT_DELAY)
+            with self.lock:
+                self.baseline = None
+                self.versions = {}
+            time.sleep(RECONNECT_DELAY)
+
+    def _listen(self):
+        # Same shape as the bus module's ImDispatch loop: a dedicated pooled
+        # cursor that only ever LISTENs.
+        with sql_db.db_connect(self.dbname).cursor() as cr, selectors.DefaultSelector() as sel:
+            cr.execute(f"LISTEN {CHANNEL}")
+            cr.commit()
+            # Read after LISTEN is active, so no insert falls in between
+            cr.execute("SELECT COALESCE(MAX(id), 0) FROM dankbit_trade")
+            baseline = cr.fetchone()[0]
+            cr.commit()
+            with self.lock:
+                self.baseline = baseline
+                self.versions = {}
+            _logger.info("Listening on %s for %s (baseline id %s)", CHANNEL, self.dbname, baseline)
+
+            conn = cr._cnx
+            sel.register(conn, selectors.EVENT_READ)
+            while True:
+                if sel.select(SELECT_TIMEOUT):
+                    conn.poll()
+                    while conn.notifies:
+                        self.apply(conn.notifies.pop(0).payload)
+                else:
+                    # NOTIFYs are only delivered outside a transaction
+                    cr.execute("SELECT 1")
+                    cr.commit()
+
+
+def get_listener(dbname):
+    """The running listener for `dbname`, started on first use."""
+    with _listeners_lock:
+        listener = _listeners.get(dbname)
+        if listener is None:
+            listener = _listeners[dbname] = TradeFeedListener(dbname)
+            listener.start()
+        return listener
+
+
+def notify(cr, currency, expirations, max_id):
+    """NOTIFY from an Odoo transaction (delivered on commit) — same payload
+    as the WS ingester's."""
+    payload = json.dumps({
+        "currency": currency,
+        "expirations": sorted(expirations),
+        "max_id": max_id,
+    }, separators=(",", ":"))
+    cr.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
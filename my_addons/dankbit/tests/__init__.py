@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+from . import test_bulk_ingest
+from . import test_deribit_client
+from . import test_position_rollup
+from . import test_trade_bucket
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import time
+from datetime import datetime
+
+from odoo.tests import TransactionCase, tagged
+
+
+def deribit_trade(trade_id, name, ts=1700000000000, **values):
+    return dict({
+        "trade_id": trade_id,
+        "instrument_name": name,
+        "timestamp": ts,
+        "iv": 50.0,
+        "index_price": 60000.0,
+        "price": 0.01,
+        "mark_price": 0.011,
+        "direction": "buy",
+        "trade_seq": 1,
+        "amount": 1.0,
+    }, **values)
+
+
+@tagged("post_install", "-at_install")
+class TestBulkIngestTrades(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Trade = self.env["dankbit.trade"]
+
+    def _trade(self, trade_id):
+        return self.Trade.with_context(active_test=False).search([("deribit_trade_identifier", "=", trade_id)])
+
+    def test_fields_derived_from_name(self):
+        inserted, skipped = self.Trade.bulk_ingest_trades([
+            deribit_trade("test-1", "BTC-26DEC36-98000-P"),
+            deribit_trade("test-2", "ETH-26DEC36-4000-C", direction="sell"),
+        ])
+        self.assertEqual((inserted, skipped), (2, 0))
+
+        put = self._trade("test-1")
+        self.assertEqual(put.name, "BTC-26DEC36-98000-P")
+        self.assertEqual(put.currency, "BTC")
+        self.assertEqual(put.expiry_code, "26DEC36")
+        self.assertEqual(put.strike, 98000)
+        self.assertEqual(put.option_type, "put")
+        # not in `expirations`: 08:00 UTC on the expiry day, from the name
+        self.assertEqual(put.expiration, datetime(2036, 12, 26, 8, 0))
+        self.assertEqual(put.deribit_ts, datetime(2023, 11, 14, 22, 13, 20))
+        self.assertEqual(put.instrument_id.name, "BTC-26DEC36-98000-P")
+
+        call = self._trade("test-2")
+        self.assertEqual((call.currency, call.option_type, call.direction), ("ETH", "call", "sell"))
+
+    def test_expiration_from_instrument_list(self):
+        self.Trade.bulk_ingest_trades(
+            [deribit_trade("test-3", "BTC-26DEC36-100000-C")],
+            {"BTC-26DEC36-100000-C": 2113372800000},  # 2036-12-20 08:00 UTC
+        )
+        self.assertEqual(self._trade("test-3").expiration, datetime(2036, 12, 20, 8, 0))
+
+    def test_duplicates_are_skipped(self):
+        self.Trade.bulk_ingest_trades([deribit_trade("test-4", "BTC-26DEC36-98000-P")])
+        inserted, skipped = self.Trade.bulk_ingest_trades([
+            deribit_trade("test-4", "BTC-26DEC36-98000-P"),
+            deribit_trade("test-5", "BTC-26DEC36-98000-P"),
+        ])
+        self.assertEqual((inserted, skipped), (1, 1))
+        self.assertEqual(len(self._trade("test-4")), 1)
+
+    def test_block_trade_and_empty_page(self):
+        self.assertEqual(self.Trade.bulk_ingest_trades([]), (0, 0))
+        self.Trade.bulk_ingest_trades([
+            deribit_trade("test-6", "BTC-26DEC36-98000-P", block_trade_id="BLOCK-1"),
+        ])
+        trade = self._trade("test-6")
+        self.assertTrue(trade.is_block_trade)
+        self.assertEqual(trade.block_trade_id, "BLOCK-1")
+
+    def test_backfill_hwm_ignores_stored_trades(self):
+        # a trade the WS service stored (here one dated 2036) must not seed
+        # the currency-wide backfill's mark, only the lookback does
+        self.env.cr.execute("DELETE FROM ir_config_parameter WHERE key = 'dankbit.backfill_hwm.BTC'")
+        self.env["ir.config_parameter"].set_param("dankbit.backfill_lookback_hours", 2)
+        self.Trade.bulk_ingest_trades([deribit_trade("test-7", "BTC-26DEC36-98000-P", ts=2113372800000)])
+
+        now_ms = time.time() * 1000
+        self.assertAlmostEqual(self.Trade._get_backfill_hwm("BTC"), now_ms - 2 * 3600 * 1000, delta=60 * 1000)
+
+        self.Trade._set_backfill_hwm("BTC", 1700000000000)
+        self.assertEqual(self.Trade._get_backfill_hwm("BTC"), 1700000000000)
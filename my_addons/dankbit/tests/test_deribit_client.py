@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import time
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.dankbit.models import trade as trade_module
+
+
+@tagged("post_install", "-at_install")
+class TestTokenBucket(TransactionCase):
+
+    def test_burst_then_rate(self):
+        bucket = trade_module._TokenBucket(rate=50, burst=5)
+        started = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.05, "the burst goes out without waiting")
+
+        for _ in range(5):
+            bucket.acquire()
+        # 5 more tokens at 50/s take ~0.1s to refill
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_minimum_rate(self):
+        # a 0 or negative setting must not divide by zero or never refill
+        bucket = trade_module._TokenBucket(rate=0)
+        self.assertEqual(bucket.rate, 0.1)
+        self.assertEqual(bucket.capacity, 1.0)
+
+
+@tagged("post_install", "-at_install")
+class TestDeribitBreaker(TransactionCase):
+
+    def _fail(self, breaker, times):
+        for _ in range(times):
+            breaker.record(0.01, False)
+
+    def test_opens_after_threshold(self):
+        breaker = trade_module._DeribitBreaker()
+        self._fail(breaker, trade_module.DERIBIT_BREAKER_THRESHOLD - 1)
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+        self._fail(breaker, 1)
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.snapshot()["short_circuited"], 1)
+        self.assertEqual(breaker.snapshot()["times_opened"], 1)
+
+    def test_success_resets_failures(self):
+        breaker = trade_module._DeribitBreaker()
+        self._fail(breaker, trade_module.DERIBIT_BREAKER_THRESHOLD - 1)
+        breaker.record(0.01, True)
+        self._fail(breaker, trade_module.DERIBIT_BREAKER_THRESHOLD - 1)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = trade_module._DeribitBreaker()
+        self._fail(breaker, trade_module.DERIBIT_BREAKER_THRESHOLD)
+        breaker.opened_at -= trade_module.DERIBIT_BREAKER_COOLDOWN
+
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, "half_open")
+        self.assertFalse(breaker.allow(), "only one probe at a time")
+
+        # a failed probe re-opens at once, without another threshold's worth
+        self._fail(breaker, 1)
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.snapshot()["times_opened"], 2)
+
+        breaker.opened_at -= trade_module.DERIBIT_BREAKER_COOLDOWN
+        self.assertTrue(breaker.allow())
+        breaker.record(0.01, True)
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+    def test_open_breaker_skips_the_request(self):
+        breaker = trade_module._DeribitBreaker()
+        self._fail(breaker, trade_module.DERIBIT_BREAKER_THRESHOLD)
+        with patch.object(trade_module, "_breaker", breaker), \
+                patch.object(trade_module, "_deribit_session") as session:
+            self.assertIsNone(trade_module._safe_deribit_request("https://example.invalid", {}))
+            with self.assertRaises(RuntimeError):
+                trade_module._safe_deribit_request("https://example.invalid", {}, raise_on_fail=True)
+        session.assert_not_called()
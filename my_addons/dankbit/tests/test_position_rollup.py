@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import TransactionCase, tagged
+
+from .test_bulk_ingest import deribit_trade
+
+NAME = "BTC-26DEC36-98000-P"
+
+
+@tagged("post_install", "-at_install")
+class TestPositionRollup(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Trade = self.env["dankbit.trade"]
+        self.Rollup = self.env["dankbit.position.rollup"]
+
+    def _rollup(self, name=NAME):
+        self.env.cr.execute(
+            """
+            SELECT direction, amount, iv_amount, premium, trade_count
+            FROM dankbit_position_rollup WHERE name = %s ORDER BY direction
+            """,
+            (name,),
+        )
+        return [
+            (direction, float(amount), float(iv_amount), round(float(premium), 2), count)
+            for direction, amount, iv_amount, premium, count in self.env.cr.fetchall()
+        ]
+
+    def _ids(self, *trade_ids):
+        return self.Trade.search([("deribit_trade_identifier", "in", trade_ids)])
+
+    def test_insert_and_delete(self):
+        self.Trade.bulk_ingest_trades([
+            deribit_trade("rollup-1", NAME, amount=1.0, iv=50.0, price=0.01, index_price=60000.0),
+            deribit_trade("rollup-2", NAME, amount=3.0, iv=60.0, price=0.02, index_price=60000.0),
+            deribit_trade("rollup-3", NAME, amount=2.0, iv=40.0, direction="sell"),
+        ])
+        self.assertEqual(self._rollup(), [
+            ("buy", 4.0, 230.0, 1800.0, 2),
+            ("sell", 2.0, 80.0, 600.0, 1),
+        ])
+
+        self._ids("rollup-2").unlink()
+        self.assertEqual(self._rollup(), [
+            ("buy", 1.0, 50.0, 600.0, 1),
+            ("sell", 2.0, 80.0, 600.0, 1),
+        ])
+
+        self._ids("rollup-1", "rollup-3").unlink()
+        self.assertEqual(self._rollup(), [], "rows with no trades left are dropped")
+        self.assertEqual(self.Rollup._check_consistency(), [])
+
+    def test_missing_index_price_does_not_poison_the_row(self):
+        self.Trade.bulk_ingest_trades([deribit_trade("rollup-4", NAME, index_price=None)])
+        self.assertEqual(self._rollup(), [("buy", 1.0, 50.0, 0.0, 1)])
+
+        self.Trade.bulk_ingest_trades([deribit_trade("rollup-5", NAME, price=0.01, index_price=60000.0)])
+        self.assertEqual(self._rollup(), [("buy", 2.0, 100.0, 600.0, 2)])
+        self.assertEqual(self.Rollup._check_consistency(), [])
+
+    def test_update_moves_the_trade(self):
+        self.Trade.bulk_ingest_trades([
+            deribit_trade("rollup-6", NAME, amount=1.0),
+            deribit_trade("rollup-7", NAME, amount=2.0),
+        ])
+        trade = self._ids("rollup-7")
+
+        trade.write({"amount": 5.0})
+        self.env.flush_all()
+        self.assertEqual(self._rollup(), [("buy", 6.0, 300.0, 1200.0, 2)])
+
+        trade.write({"direction": "sell"})
+        self.env.flush_all()
+        self.assertEqual(self._rollup(), [
+            ("buy", 1.0, 50.0, 600.0, 1),
+            ("sell", 5.0, 250.0, 600.0, 1),
+        ])
+
+        # columns the rollup doesn't read leave it alone
+        trade.write({"mark_price": 0.5})
+        self.env.flush_all()
+        self.assertEqual(len(self._rollup()), 2)
+        self.assertEqual(self.Rollup._check_consistency(), [])
+
+    def test_archived_trades_leave_the_rollup(self):
+        self.Trade.bulk_ingest_trades([
+            deribit_trade("rollup-9", NAME, amount=1.0),
+            deribit_trade("rollup-10", NAME, amount=2.0),
+        ])
+        trade = self._ids("rollup-10")
+
+        trade.action_archive()
+        self.env.flush_all()
+        self.assertEqual(self._rollup(), [("buy", 1.0, 50.0, 600.0, 1)])
+
+        trade.action_unarchive()
+        self.env.flush_all()
+        self.assertEqual(self._rollup(), [("buy", 3.0, 150.0, 1200.0, 2)])
+
+        # the archive cron deletes trades that are already inactive
+        trade.action_archive()
+        trade.unlink()
+        self.assertEqual(self._rollup(), [("buy", 1.0, 50.0, 600.0, 1)])
+        self.assertEqual(self.Rollup._check_consistency(), [])
+
+    def test_check_flags_and_repairs(self):
+        self.Trade.bulk_ingest_trades([deribit_trade("rollup-8", NAME)])
+        self.env.cr.execute("UPDATE dankbit_position_rollup SET premium = NULL WHERE name = %s", (NAME,))
+
+        self.assertEqual(self.Rollup._check_consistency(), [(NAME, "buy")])
+        self.Rollup._check_consistency(repair=True)
+        self.assertEqual(self.Rollup._check_consistency(), [])
+        self.assertEqual(self._rollup(), [("buy", 1.0, 50.0, 600.0, 1)])
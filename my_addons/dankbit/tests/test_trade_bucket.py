@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+from odoo.tests import TransactionCase, tagged
+
+from .test_bulk_ingest import deribit_trade
+
+NAME = "ETH-26DEC36-4000-C"
+HOUR = datetime(2036, 1, 1, 10, 0)
+
+
+def ms(dt):
+    return int((dt - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+@tagged("post_install", "-at_install")
+class TestTradeBucket(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Trade = self.env["dankbit.trade"]
+        self.Bucket = self.env["dankbit.trade.bucket"]
+
+    def _buckets(self):
+        self.env.cr.execute(
+            """
+            SELECT bucket, direction, amount, trade_count
+            FROM dankbit_trade_bucket WHERE name = %s AND active ORDER BY bucket, direction
+            """,
+            (NAME,),
+        )
+        return [(bucket, direction, float(amount), count) for bucket, direction, amount, count in self.env.cr.fetchall()]
+
+    def test_trades_land_in_their_hour(self):
+        self.Trade.bulk_ingest_trades([
+            deribit_trade("bucket-1", NAME, ms(HOUR), amount=1.0),
+            deribit_trade("bucket-2", NAME, ms(HOUR + timedelta(minutes=59, seconds=59)), amount=2.0),
+            deribit_trade("bucket-3", NAME, ms(HOUR + timedelta(hours=1)), amount=4.0),
+        ])
+        self.assertEqual(self._buckets(), [
+            (HOUR, "buy", 3.0, 2),
+            (HOUR + timedelta(hours=1), "buy", 4.0, 1),
+        ])
+        self.assertEqual(self.Bucket._check_consistency(), [])
+
+    def test_corrected_timestamp_moves_buckets(self):
+        self.Trade.bulk_ingest_trades([
+            deribit_trade("bucket-4", NAME, ms(HOUR), amount=1.0),
+            deribit_trade("bucket-5", NAME, ms(HOUR + timedelta(minutes=5)), amount=2.0),
+        ])
+        trade = self.Trade.search([("deribit_trade_identifier", "=", "bucket-5")])
+        trade.write({"deribit_ts": HOUR + timedelta(hours=2, minutes=5)})
+        self.env.flush_all()
+
+        self.assertEqual(self._buckets(), [
+            (HOUR, "buy", 1.0, 1),
+            (HOUR + timedelta(hours=2), "buy", 2.0, 1),
+        ])
+
+        # a trade without deribit_ts is in no bucket at all
+        trade.write({"deribit_ts": False})
+        self.env.flush_all()
+        self.assertEqual(self._buckets(), [(HOUR, "buy", 1.0, 1)])
+        self.assertEqual(self.Bucket._check_consistency(), [])
+
+    def test_archived_trades_keep_a_bucket_of_their_own(self):
+        self.Trade.bulk_ingest_trades([
+            deribit_trade("bucket-6", NAME, ms(HOUR), amount=1.0),
+            deribit_trade("bucket-7", NAME, ms(HOUR + timedelta(minutes=5)), amount=2.0),
+        ])
+        trade = self.Trade.search([("deribit_trade_identifier", "=", "bucket-7")])
+        trade.action_archive()
+        self.env.flush_all()
+
+        self.assertEqual(self._buckets(), [(HOUR, "buy", 1.0, 1)])
+        self.assertEqual(self.Bucket._check_consistency(), [])
+
+        def window_amount(**kwargs):
+            rows = self.Trade._aggregate_legs(
+                "ETH", expiration_exact=datetime(2036, 12, 26, 8, 0), traded_since=HOUR, unexpired=False, **kwargs
+            )
+            return sum(float(row[-4]) for row in rows)
+
+        self.assertEqual(window_amount(), 1.0)
+        self.assertEqual(window_amount(include_archived=True), 3.0)
+
+        trade.action_unarchive()
+        self.env.flush_all()
+        self.assertEqual(self._buckets(), [(HOUR, "buy", 3.0, 2)])
+        self.assertEqual(self.Bucket._check_consistency(), [])